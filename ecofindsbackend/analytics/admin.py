@@ -0,0 +1,20 @@
+from django.contrib import admin
+from .models import ProductDailyStats, RollupWatermark, SellerDailyStats
+
+@admin.register(SellerDailyStats)
+class SellerDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('seller', 'date', 'views', 'cart_adds', 'units_sold', 'revenue', 'listings_created')
+    list_filter = ('date',)
+    search_fields = ('seller__username', 'seller__email')
+    list_select_related = ('seller',)
+
+@admin.register(ProductDailyStats)
+class ProductDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('product', 'seller', 'date', 'views', 'cart_adds', 'units_sold', 'revenue')
+    list_filter = ('date',)
+    search_fields = ('product__title', 'seller__username')
+    list_select_related = ('product', 'seller')
+
+@admin.register(RollupWatermark)
+class RollupWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('source', 'last_id', 'updated_at')
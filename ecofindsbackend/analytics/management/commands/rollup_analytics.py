@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from analytics.rollup import run_rollups
+
+class Command(BaseCommand):
+    help = 'Fold new view/cart events, sales and listings into the daily seller analytics rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Source ids folded per transaction')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep rolling up every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            processed = run_rollups(chunk_size=options['chunk_size'])
+            summary = ', '.join(f'{source} +{count}' for source, count in processed.items())
+            self.stdout.write(self.style.SUCCESS(f'Rolled up {summary} in {time.perf_counter() - started:.1f}s'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
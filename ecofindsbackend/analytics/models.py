@@ -0,0 +1,56 @@
+from django.db import models
+from django.conf import settings
+from products.models import Product
+
+class SellerDailyStats(models.Model):
+    """Per-seller totals for one day, maintained by `manage.py rollup_analytics`"""
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    cart_adds = models.PositiveIntegerField(default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    listings_created = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['seller', 'date']
+        verbose_name_plural = "Seller daily stats"
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'date'], name='unique_seller_daily_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.seller_id} on {self.date}"
+
+class ProductDailyStats(models.Model):
+    """Per-product totals for one day; seller is copied so dashboards never join products"""
+    # Not constrained, so history survives the listing being archived
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='daily_stats')
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='product_daily_stats')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    cart_adds = models.PositiveIntegerField(default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['product', 'date']
+        verbose_name_plural = "Product daily stats"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='unique_product_daily_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.date}"
+
+class RollupWatermark(models.Model):
+    """Highest source row id already folded into the rollups"""
+    source = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} @ {self.last_id}"
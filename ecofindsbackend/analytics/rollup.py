@@ -0,0 +1,167 @@
+"""
+Incremental daily rollups for seller analytics.
+
+Each source table is append-only and read in id order from its watermark:
+- view and add-to-cart event buckets;
+- purchase items;
+- newly created listings.
+
+Rows younger than ANALYTICS_ROLLUP_SETTLE are left for the next run: a
+slower transaction may still commit a lower id, which a watermark already
+past it would skip. A chunk is read under a lock on its watermark row, and
+its deltas and the watermark advance commit in one transaction, so neither
+a crash nor a concurrent run double counts. Run it more often than
+TRENDING_WINDOW, because `compute_trending` prunes event buckets older than
+that.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from products.models import ArchivedProduct, Product, ProductEventBucket
+from purchases.models import PurchaseItem
+from .models import ProductDailyStats, RollupWatermark, SellerDailyStats
+
+EVENT_FIELDS = {'view': 'views', 'cart': 'cart_adds'}
+STAT_FIELDS = {
+    ProductDailyStats: ['views', 'cart_adds', 'units_sold', 'revenue'],
+    SellerDailyStats: ['views', 'cart_adds', 'units_sold', 'revenue', 'listings_created'],
+}
+
+
+class Deltas:
+    def __init__(self):
+        self.products = defaultdict(lambda: defaultdict(int))
+        self.sellers = defaultdict(lambda: defaultdict(int))
+        self.product_sellers = {}
+
+    def add(self, product_id, seller_id, day, **values):
+        for field, value in values.items():
+            if product_id is not None:
+                self.products[product_id, day][field] += value
+            self.sellers[seller_id, day][field] += value
+        if product_id is not None:
+            self.product_sellers[product_id] = seller_id
+
+
+def _event_deltas(deltas, low, high):
+    # Buckets are already per hour, so grouping them in SQL saves little; fold into days here
+    rows = ProductEventBucket.objects.filter(id__gt=low, id__lte=high).values_list(
+        'product_id', 'product__seller_id', 'bucket_start', 'kind', 'count'
+    ).order_by()
+    days = {}
+    for product_id, seller_id, start, kind, count in rows.iterator(chunk_size=10000):
+        field = EVENT_FIELDS.get(kind)
+        if field:
+            day = days.get(start) or days.setdefault(start, timezone.localtime(start).date())
+            deltas.add(product_id, seller_id, day, **{field: count})
+
+
+def _sale_deltas(deltas, low, high):
+    # Sold listings move to the archive, so the seller comes from whichever table holds the product
+    seller_id = Coalesce(
+        Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('seller_id')[:1]),
+        Subquery(ArchivedProduct.objects.filter(pk=OuterRef('product_id')).values('seller_id')[:1]),
+    )
+    rows = PurchaseItem.objects.filter(id__gt=low, id__lte=high).annotate(
+        day=TruncDate('purchase__created_at'), seller=seller_id
+    ).values('product_id', 'seller', 'day').annotate(
+        units=Sum('quantity'),
+        amount=Sum(F('quantity') * F('price_at_purchase'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    ).order_by()
+    for row in rows:
+        # A listing deleted outright has no seller left to credit
+        if row['seller'] is not None:
+            deltas.add(row['product_id'], row['seller'], row['day'], units_sold=row['units'], revenue=row['amount'])
+
+
+def _listing_deltas(deltas, low, high):
+    rows = Product.objects.filter(id__gt=low, id__lte=high).annotate(
+        day=TruncDate('created_at')
+    ).values('seller_id', 'day').annotate(created=Count('id')).order_by()
+    for row in rows:
+        deltas.add(None, row['seller_id'], row['day'], listings_created=row['created'])
+
+
+# (watermark name, model, creation time of its rows, collector)
+SOURCES = [
+    ('events', ProductEventBucket, 'created_at', _event_deltas),
+    ('sales', PurchaseItem, 'purchase__created_at', _sale_deltas),
+    ('listings', Product, 'created_at', _listing_deltas),
+]
+
+
+def _apply(model, owner_field, changes, extra=None, batch_size=1000):
+    """
+    Add ``changes`` {(owner_id, date): {field: delta}} onto the rollup rows.
+
+    ``extra`` maps further columns to {owner_id: value}; they are only used
+    when a row is first inserted.
+
+    A single upsert per batch increments existing rows in place, so the job
+    never reads rollups back to merge them.
+    """
+    if not changes:
+        return
+    extra = extra or {}
+    columns = [owner_field, 'date', *extra, *STAT_FIELDS[model]]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    column_sql = ', '.join(quote(model._meta.get_field(column).column) for column in columns)
+    row_sql = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    key_sql = f'{quote(model._meta.get_field(owner_field).column)}, {quote("date")}'
+    if connection.vendor == 'mysql':
+        increments = ', '.join(f'{quote(field)} = {quote(field)} + VALUES({quote(field)})' for field in STAT_FIELDS[model])
+        conflict_sql = f'ON DUPLICATE KEY UPDATE {increments}'
+    else:
+        increments = ', '.join(f'{quote(field)} = {table}.{quote(field)} + excluded.{quote(field)}' for field in STAT_FIELDS[model])
+        conflict_sql = f'ON CONFLICT ({key_sql}) DO UPDATE SET {increments}'
+
+    rows = [
+        [owner_id, day, *[values_by_owner[owner_id] for values_by_owner in extra.values()],
+         *[values.get(field, 0) for field in STAT_FIELDS[model]]]
+        for (owner_id, day), values in changes.items()
+    ]
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} ({column_sql}) VALUES {", ".join([row_sql] * len(batch))} {conflict_sql}',
+                [value for row in batch for value in row]
+            )
+
+
+def _fold_chunk(source, collect, high, chunk_size):
+    """Fold the next chunk below ``high`` into the rollups; returns how many ids it covered"""
+    with transaction.atomic():
+        # Held until commit, so a concurrent run waits and then starts from the advanced watermark
+        watermark = RollupWatermark.objects.select_for_update().get(source=source)
+        low = watermark.last_id
+        if low >= high:
+            return 0
+        upper = min(low + chunk_size, high)
+        deltas = Deltas()
+        collect(deltas, low, upper)
+        _apply(ProductDailyStats, 'product_id', deltas.products, extra={'seller_id': deltas.product_sellers})
+        _apply(SellerDailyStats, 'seller_id', deltas.sellers)
+        watermark.last_id = upper
+        watermark.save(update_fields=['last_id', 'updated_at'])
+    return upper - low
+
+
+def run_rollups(chunk_size=100000):
+    """Fold every source's settled new rows into the daily rollups; returns how far each watermark moved"""
+    processed = {}
+    settled = timezone.now() - settings.ANALYTICS_ROLLUP_SETTLE
+    for source, model, created_field, collect in SOURCES:
+        RollupWatermark.objects.get_or_create(source=source)
+        high = model.objects.filter(**{f'{created_field}__lte': settled}).aggregate(high=Max('id'))['high'] or 0
+        processed[source] = 0
+        while True:
+            folded = _fold_chunk(source, collect, high, chunk_size)
+            if not folded:
+                break
+            processed[source] += folded
+    return processed
@@ -0,0 +1,22 @@
+from rest_framework import serializers
+from .models import SellerDailyStats
+
+class SellerDailyStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SellerDailyStats
+        fields = ('date', 'views', 'cart_adds', 'units_sold', 'revenue', 'listings_created')
+
+class StatsTotalsSerializer(serializers.Serializer):
+    views = serializers.IntegerField()
+    cart_adds = serializers.IntegerField()
+    units_sold = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    listings_created = serializers.IntegerField()
+
+class TopProductSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    title = serializers.CharField(source='product__title')
+    views = serializers.IntegerField()
+    cart_adds = serializers.IntegerField()
+    units_sold = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
@@ -0,0 +1,127 @@
+import os
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from products.archive import archive_sold_listings
+from products.models import Category, Product, ProductEventBucket
+from products.trending import bucket_start
+from purchases.models import Purchase, PurchaseItem
+from .models import ProductDailyStats, SellerDailyStats
+from .rollup import run_rollups
+
+User = get_user_model()
+
+
+@override_settings(ANALYTICS_ROLLUP_SETTLE=timedelta(0))
+class RollupTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', email='seller@example.com', password='password')
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        self.product = Product.objects.create(
+            title='Oak chair', description='Solid oak', category=category,
+            price=Decimal('25.00'), quantity=2, seller=self.seller
+        )
+
+    def _sell(self, quantity):
+        purchase = Purchase.objects.create(
+            buyer=self.buyer, shipping_address='1 Main St', payment_method='card', total_amount=Decimal('25.00') * quantity
+        )
+        PurchaseItem.objects.create(purchase=purchase, product=self.product, quantity=quantity, price_at_purchase=Decimal('25.00'))
+
+    def test_rerun_does_not_double_count(self):
+        self._sell(1)
+
+        self.assertEqual(run_rollups(), {'events': 0, 'sales': 1, 'listings': 1})
+        self.assertEqual(run_rollups(), {'events': 0, 'sales': 0, 'listings': 0})
+
+        stats = SellerDailyStats.objects.get(seller=self.seller)
+        self.assertEqual((stats.units_sold, stats.revenue, stats.listings_created), (1, Decimal('25.00'), 1))
+
+    def test_sales_of_archived_listings_are_counted(self):
+        self._sell(2)
+        Product.objects.filter(pk=self.product.pk).update(
+            quantity=0, is_sold=True, updated_at=self.product.updated_at - timedelta(days=1)
+        )
+        self.assertEqual(archive_sold_listings(older_than=timedelta(hours=1)), 1)
+
+        run_rollups()
+
+        stats = ProductDailyStats.objects.get(product_id=self.product.pk)
+        self.assertEqual((stats.seller_id, stats.units_sold, stats.revenue), (self.seller.pk, 2, Decimal('50.00')))
+        self.assertEqual(SellerDailyStats.objects.get(seller=self.seller).units_sold, 2)
+
+    def test_unsettled_rows_wait_for_next_run(self):
+        self._sell(1)
+
+        with override_settings(ANALYTICS_ROLLUP_SETTLE=timedelta(minutes=1)):
+            self.assertEqual(run_rollups(), {'events': 0, 'sales': 0, 'listings': 0})
+        self.assertFalse(SellerDailyStats.objects.exists())
+
+        self.assertEqual(run_rollups(), {'events': 0, 'sales': 1, 'listings': 1})
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+@override_settings(ANALYTICS_ROLLUP_SETTLE=timedelta(0))
+class RollupBenchmark(TestCase):
+    """
+    Cold rollup of BENCHMARK_EVENT_BUCKETS event buckets (10M by default) over
+    BENCHMARK_PRODUCTS products (100k) and 30 days, then the seller endpoint.
+
+    Events land on random product-days, the worst case for the number of rollup rows.
+    """
+    buckets = int(os.environ.get('BENCHMARK_EVENT_BUCKETS', 10000000))
+    products = int(os.environ.get('BENCHMARK_PRODUCTS', 100000))
+    sellers = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        sellers = User.objects.bulk_create([
+            User(username=f'seller{i}', email=f'seller{i}@example.com') for i in range(cls.sellers)
+        ])
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        for start in range(0, cls.products, 50000):
+            Product.objects.bulk_create([
+                Product(
+                    title=f'Listing {i}', description='', category=category, price=Decimal('25.00'),
+                    seller=sellers[i % cls.sellers]
+                )
+                for i in range(start, min(start + 50000, cls.products))
+            ], batch_size=5000)
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        now = timezone.now()
+        rng = random.Random(0)
+        for start in range(0, cls.buckets, 100000):
+            ProductEventBucket.objects.bulk_create([
+                ProductEventBucket(
+                    product_id=rng.choice(product_ids), kind=rng.choice(('view', 'view', 'cart')),
+                    bucket_start=bucket_start(now - timedelta(hours=rng.randrange(30 * 24))),
+                    count=rng.randint(1, 5)
+                )
+                for _ in range(min(100000, cls.buckets - start))
+            ], batch_size=5000)
+
+    def test_rollup_and_endpoint(self):
+        start = time.perf_counter()
+        run_rollups()
+        elapsed = time.perf_counter() - start
+
+        views = ProductEventBucket.objects.filter(kind='view').aggregate(total=Sum('count'))['total']
+        self.assertEqual(SellerDailyStats.objects.aggregate(total=Sum('views'))['total'], views)
+
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='seller0'))
+        timings = []
+        for _ in range(5):
+            request_start = time.perf_counter()
+            self.assertEqual(client.get('/api/v1/analytics/seller/', {'days': 30}).status_code, 200)
+            timings.append(time.perf_counter() - request_start)
+        print(f'\n{self.buckets} event buckets: cold rollup {elapsed:.1f} s into '
+              f'{ProductDailyStats.objects.count()} product-day rows; endpoint {min(timings) * 1000:.1f} ms')
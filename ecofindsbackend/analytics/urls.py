@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('seller/', views.seller_analytics, name='seller_analytics'),
+]
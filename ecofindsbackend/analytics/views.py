@@ -0,0 +1,54 @@
+from datetime import timedelta
+from decimal import Decimal
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.db.models import Min, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from products.archive import resolve_listings
+from .models import ProductDailyStats, RollupWatermark, SellerDailyStats
+from .serializers import SellerDailyStatsSerializer, StatsTotalsSerializer, TopProductSerializer
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def seller_analytics(request):
+    try:
+        days = max(1, min(int(request.GET.get('days', 30)), 365))
+    except ValueError:
+        return Response({'message': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    since = timezone.localdate() - timedelta(days=days - 1)
+    
+    # Reads only the rollup tables; nothing here scans products or purchases
+    daily = SellerDailyStats.objects.filter(seller=request.user, date__gte=since).order_by('date')
+    totals = daily.aggregate(
+        views=Coalesce(Sum('views'), 0),
+        cart_adds=Coalesce(Sum('cart_adds'), 0),
+        units_sold=Coalesce(Sum('units_sold'), 0),
+        revenue=Coalesce(Sum('revenue'), Decimal('0')),
+        listings_created=Coalesce(Sum('listings_created'), 0)
+    )
+    top_products = ProductDailyStats.objects.filter(
+        seller=request.user, date__gte=since
+    ).values('product_id').annotate(
+        views=Sum('views'),
+        cart_adds=Sum('cart_adds'),
+        units_sold=Sum('units_sold'),
+        revenue=Sum('revenue')
+    ).order_by('-revenue', '-views')[:10]
+    # Titles come from the live or archived listing once the top ten are known
+    listings = resolve_listings([row['product_id'] for row in top_products], select_related=())
+    top_products = [
+        {**row, 'product__title': getattr(listings.get(row['product_id']), 'title', '')}
+        for row in top_products
+    ]
+    
+    return Response({
+        'days': days,
+        'since': since,
+        'updated_at': RollupWatermark.objects.aggregate(updated_at=Min('updated_at'))['updated_at'],
+        'totals': StatsTotalsSerializer(totals).data,
+        'daily': SellerDailyStatsSerializer(daily, many=True).data,
+        'top_products': TopProductSerializer(top_products, many=True).data
+    }, status=status.HTTP_200_OK)
@@ -1,3 +1,7 @@
 from django.contrib import admin
+from .models import RevokedToken
 
-# Register your models here.
+@admin.register(RevokedToken)
+class RevokedTokenAdmin(admin.ModelAdmin):
+    list_display = ('jti', 'expires_at', 'revoked_at')
+    search_fields = ('jti',)
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from authentication.revocation import purge_expired_revocations
+
+class Command(BaseCommand):
+    help = 'Delete revoked refresh tokens that have expired anyway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep purging every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            purged = purge_expired_revocations(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired revoked token(s)'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
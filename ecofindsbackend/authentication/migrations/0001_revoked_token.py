@@ -0,0 +1,41 @@
+# Generated by Django 4.2.24 on 2026-10-19 11:40
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def copy_blacklist(apps, schema_editor):
+    # Carry over unexpired entries from simplejwt's token_blacklist app, if it was ever migrated
+    connection = schema_editor.connection
+    tables = connection.introspection.table_names()
+    if 'token_blacklist_blacklistedtoken' not in tables or 'token_blacklist_outstandingtoken' not in tables:
+        return
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO authentication_revokedtoken (jti, expires_at, revoked_at) '
+            'SELECT o.jti, o.expires_at, b.blacklisted_at FROM token_blacklist_blacklistedtoken b '
+            'JOIN token_blacklist_outstandingtoken o ON o.id = b.token_id WHERE o.expires_at > %s',
+            [now]
+        )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(max_length=255, unique=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('revoked_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(copy_blacklist, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone as dt_timezone
+from django.db import migrations
+from django.utils import timezone
+
+LOGOUT_TASK = 'authentication.tasks.blacklist_refresh_token'
+
+
+def revoke_queued_logouts(apps, schema_editor):
+    # Logouts used to be revoked by a background task carrying the raw refresh token;
+    # revoke the ones still pending and drop every such row so no token stays in the table
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import RefreshToken
+    RevokedToken = apps.get_model('authentication', 'RevokedToken')
+    Task = apps.get_model('taskqueue', 'Task')
+    tasks = Task.objects.filter(name=LOGOUT_TASK)
+    revoked = []
+    for args in tasks.exclude(status='succeeded').values_list('args', flat=True).iterator():
+        try:
+            token = RefreshToken(args[0], verify=False)
+        except Exception:
+            continue
+        expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+        if expires_at > timezone.now():
+            revoked.append(RevokedToken(jti=token[api_settings.JTI_CLAIM], expires_at=expires_at))
+    RevokedToken.objects.bulk_create(revoked, ignore_conflicts=True)
+    tasks.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_revoked_token'),
+        ('taskqueue', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(revoke_queued_logouts, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,10 @@
 from django.db import models
 
-# Create your models here.
+class RevokedToken(models.Model):
+    """Refresh token revoked before it expired; removed by `manage.py purge_revoked_tokens` once it would have expired anyway"""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.jti
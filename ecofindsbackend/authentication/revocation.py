@@ -0,0 +1,160 @@
+"""
+Refresh token revocation.
+
+Revoked token ids (jti) live in RevokedToken until the token would have
+expired anyway. Each process also keeps a Bloom filter of them. A jti that
+is not in the filter was never revoked, so most refreshes never query the
+table. Filter hits (real revocations plus about
+REVOKED_TOKEN_FILTER_ERROR_RATE false positives) are confirmed with an
+indexed lookup.
+
+The request that finds the filter missing or due for a rebuild builds it
+before answering; concurrent requests keep using the previous filter, or
+the table until there is one. A failed build is retried after a backoff
+rather than on every check. A revocation made in this process is added at
+once. Revocations from other processes are picked up every
+REVOKED_TOKEN_SYNC_INTERVAL seconds. The filter is rebuilt every
+REVOKED_TOKEN_FILTER_REBUILD so expired entries drop out.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from .models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+MIN_CAPACITY = 100000
+# Re-read this much before the last sync, so a revocation committed a little
+# after a later one is not missed
+SYNC_OVERLAP = timedelta(seconds=5)
+# Seconds before retrying a failed build, doubling per consecutive failure up to the maximum
+MIN_RETRY_DELAY = 1
+MAX_RETRY_DELAY = 300
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._building = False
+        self._built_at = 0
+        self._synced_at = 0
+        self._synced_from = None
+        self._failures = 0
+        self._retry_at = 0
+
+    def is_revoked(self, jti):
+        bloom = self._current_filter()
+        if bloom is not None and jti not in bloom:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        """Record the revocation; returns False if ``jti`` was already revoked"""
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+        return True
+
+    def _current_filter(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = self._filter is None or now - self._built_at > settings.REVOKED_TOKEN_FILTER_REBUILD.total_seconds()
+            build = stale and not self._building and now >= self._retry_at
+            if build:
+                self._building = True
+        if build:
+            self._build()
+
+        with self._lock:
+            if self._filter is None or now - self._synced_at < settings.REVOKED_TOKEN_SYNC_INTERVAL:
+                return self._filter
+            self._synced_at = now
+            bloom, since = self._filter, self._synced_from
+            self._synced_from = timezone.now() - SYNC_OVERLAP
+
+        for jti in RevokedToken.objects.filter(revoked_at__gte=since).values_list('jti', flat=True):
+            bloom.add(jti)
+        return bloom
+
+    def _build(self):
+        try:
+            started = timezone.now()
+            live = RevokedToken.objects.filter(expires_at__gt=started)
+            bloom = BloomFilter(max(live.count() * 2, MIN_CAPACITY), settings.REVOKED_TOKEN_FILTER_ERROR_RATE)
+            for jti in live.values_list('jti', flat=True).iterator(chunk_size=10000):
+                bloom.add(jti)
+        except Exception:
+            logger.exception('Building the revoked token filter failed')
+            with self._lock:
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(MIN_RETRY_DELAY * 2 ** (self._failures - 1), MAX_RETRY_DELAY)
+                self._building = False
+            return
+        with self._lock:
+            self._filter = bloom
+            self._built_at = time.monotonic()
+            self._failures = 0
+            # Sync before the next answer, covering everything revoked while building
+            self._synced_at = 0
+            self._synced_from = started - SYNC_OVERLAP
+            self._building = False
+
+
+revocations = RevocationStore()
+
+
+def revoke_token(token):
+    """Revoke a simplejwt token until it expires; returns False if it already was"""
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    return revocations.revoke(token[api_settings.JTI_CLAIM], expires_at)
+
+
+def is_token_revoked(token):
+    return revocations.is_revoked(token[api_settings.JTI_CLAIM])
+
+
+def purge_expired_revocations(batch_size=10000):
+    """Delete revocations of tokens that have expired; returns the number removed"""
+    purged = 0
+    while True:
+        ids = list(
+            RevokedToken.objects.filter(expires_at__lte=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return purged
+        purged += RevokedToken.objects.filter(pk__in=ids).delete()[0]
@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from users.models import CustomUser
+from .revocation import is_token_revoked, revoke_token
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
@@ -40,3 +44,15 @@ class UserLoginSerializer(serializers.Serializer):
             raise serializers.ValidationError('Must include email and password')
         
         return attrs
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh checked against RevokedToken instead of simplejwt's blacklist app"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_token_revoked(refresh):
+            raise TokenError('Token is blacklisted')
+        # The unique jti also stops two concurrent refreshes of one token from both succeeding
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION and not revoke_token(refresh):
+            raise TokenError('Token is blacklisted')
+        return super().validate(attrs)
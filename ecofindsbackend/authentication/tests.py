@@ -1,3 +1,241 @@
-from django.test import TestCase
+import os
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.throttling import AnonRateThrottle
+from rest_framework_simplejwt.tokens import RefreshToken
+from ecofindsbackend.throttling import AuthRateThrottle, SearchRateThrottle, SlidingWindowThrottle
+from taskqueue.models import Task
+from .models import RevokedToken
+from .revocation import MIN_RETRY_DELAY, RevocationStore, is_token_revoked, revoke_token
 
-# Create your tests here.
+User = get_user_model()
+
+
+class LogoutTests(TestCase):
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE].clear()
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_logout_revokes_refresh_token_before_responding(self):
+        refresh = RefreshToken.for_user(self.user)
+
+        response = self.client.post('/api/v1/auth/logout/', {'refresh_token': str(refresh)}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_token_revoked(refresh))
+        # Nothing is queued, so the raw token is never stored
+        self.assertFalse(Task.objects.exists())
+        refreshed = self.client.post('/api/v1/auth/refresh/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(refreshed.status_code, 401)
+
+    def test_logout_rejects_invalid_token(self):
+        response = self.client.post('/api/v1/auth/logout/', {'refresh_token': 'not-a-token'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RevocationTests(TestCase):
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE].clear()
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        self.client = APIClient()
+
+    def test_revoke_and_check(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.assertFalse(is_token_revoked(refresh))
+
+        self.assertTrue(revoke_token(refresh))
+        self.assertFalse(revoke_token(refresh))
+
+        self.assertTrue(is_token_revoked(refresh))
+        self.assertFalse(is_token_revoked(RefreshToken.for_user(self.user)))
+
+    def test_refresh_refuses_revoked_token(self):
+        refresh = RefreshToken.for_user(self.user)
+
+        first = self.client.post('/api/v1/auth/refresh/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(first.status_code, 200)
+        # Rotation revoked the token just used; the one it was exchanged for still works
+        self.assertEqual(self.client.post('/api/v1/auth/refresh/', {'refresh': str(refresh)}, format='json').status_code, 401)
+        self.assertEqual(self.client.post('/api/v1/auth/refresh/', {'refresh': first.data['refresh']}, format='json').status_code, 200)
+
+    def test_filter_answers_unrevoked_tokens_without_the_table(self):
+        store = RevocationStore()
+        store.revoke('revoked', timezone.now() + timedelta(days=1))
+        store.is_revoked('warm-up')
+
+        with self.assertNumQueries(0):
+            self.assertFalse(store.is_revoked('never-revoked'))
+        with self.assertNumQueries(1):
+            self.assertTrue(store.is_revoked('revoked'))
+
+    def test_filter_false_positive_falls_back_to_table(self):
+        store = RevocationStore()
+        store.is_revoked('warm-up')
+        # As if another jti hashed to the same bits
+        store._filter.add('collides')
+
+        with self.assertNumQueries(1):
+            self.assertFalse(store.is_revoked('collides'))
+
+    def test_failed_build_is_retried_after_backoff(self):
+        store = RevocationStore()
+        store.revoke('revoked', timezone.now() + timedelta(days=1))
+
+        with mock.patch('authentication.revocation.time') as clock, \
+                mock.patch('authentication.revocation.BloomFilter', side_effect=DatabaseError) as bloom_filter, \
+                self.assertLogs('authentication.revocation', 'ERROR'):
+            clock.monotonic.return_value = 1000
+            # Answered from the table while there is no filter, without a build attempt per check
+            self.assertTrue(store.is_revoked('revoked'))
+            self.assertFalse(store.is_revoked('other'))
+            self.assertEqual(bloom_filter.call_count, 1)
+
+            clock.monotonic.return_value = 1000 + MIN_RETRY_DELAY
+            store.is_revoked('other')
+            self.assertEqual(bloom_filter.call_count, 2)
+            # The delay doubles after each consecutive failure
+            clock.monotonic.return_value = 1000 + MIN_RETRY_DELAY * 2
+            store.is_revoked('other')
+            self.assertEqual(bloom_filter.call_count, 2)
+
+        with mock.patch('authentication.revocation.time') as clock:
+            clock.monotonic.return_value = 1000 + MIN_RETRY_DELAY * 3
+            self.assertTrue(store.is_revoked('revoked'))
+        self.assertIsNotNone(store._filter)
+
+
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE].clear()
+        # Pinned to the start of a window, so the budget does not fade partway through a test
+        timer = mock.patch.object(SlidingWindowThrottle, 'timer', return_value=60 * 10 ** 8 + 1)
+        timer.start()
+        self.addCleanup(timer.stop)
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        self.client = APIClient()
+
+    def _login(self, email, password, **extra):
+        return self.client.post('/api/v1/auth/login/', {'email': email, 'password': password}, format='json', **extra)
+
+    def test_forwarded_for_header_does_not_reset_ip_budget(self):
+        statuses = [
+            self._login(f'user{index}@example.com', 'wrong', HTTP_X_FORWARDED_FOR=f'203.0.113.{index}').status_code
+            for index in range(21)
+        ]
+
+        self.assertNotIn(429, statuses[:20])
+        self.assertEqual(statuses[20], 429)
+
+    def test_failed_attempts_elsewhere_do_not_lock_owner_out(self):
+        attempts = [self._login('buyer@example.com', 'wrong', REMOTE_ADDR='198.51.100.7').status_code for _ in range(11)]
+        self.assertEqual(attempts[-1], 429)
+
+        response = self._login('buyer@example.com', 'password', REMOTE_ADDR='192.0.2.1')
+
+        self.assertEqual(response.status_code, 200)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class ThrottleBenchmark(TestCase):
+    """Cost of one throttle decision on THROTTLE_CACHE: sliding window counter against DRF's timestamp list"""
+    decisions = 20000
+    clients = 100
+
+    class TimestampListThrottle(AnonRateThrottle):
+        scope = 'search'
+
+    def _time(self, throttle):
+        # A budget no client reaches, so every decision takes the full allow path
+        throttle.cache = caches[settings.THROTTLE_CACHE]
+        throttle.rate = '1000000/min'
+        throttle.num_requests, throttle.duration = throttle.parse_rate(throttle.rate)
+        factory = APIRequestFactory()
+        requests = [
+            Request(factory.get('/api/v1/search/', REMOTE_ADDR=f'10.0.{index // 256}.{index % 256}'))
+            for index in range(self.clients)
+        ]
+        for request in requests:
+            request.user = AnonymousUser()
+        timings = []
+        for index in range(self.decisions):
+            start = time.perf_counter()
+            self.assertTrue(throttle.allow_request(requests[index % self.clients], None))
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        return timings[len(timings) // 2] * 10 ** 6, timings[len(timings) * 99 // 100] * 10 ** 6
+
+    def test_decision_latency(self):
+        caches[settings.THROTTLE_CACHE].clear()
+        sliding = self._time(SearchRateThrottle())
+        caches[settings.THROTTLE_CACHE].clear()
+        builtin = self._time(self.TimestampListThrottle())
+        print(f'\n{self.decisions} decisions: sliding window p50 {sliding[0]:.1f} µs, p99 {sliding[1]:.1f} µs; '
+              f'DRF AnonRateThrottle p50 {builtin[0]:.1f} µs, p99 {builtin[1]:.1f} µs')
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class RevocationBenchmark(TestCase):
+    """Revocation checks and refreshes with BENCHMARK_REVOKED_TOKENS revoked tokens (1M by default), with and without the filter"""
+    tokens = int(os.environ.get('BENCHMARK_REVOKED_TOKENS', 1000000))
+    checks = 20000
+    refreshes = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        expires_at = timezone.now() + timedelta(days=1)
+        for start in range(0, cls.tokens, 100000):
+            RevokedToken.objects.bulk_create([
+                RevokedToken(jti=uuid.uuid4().hex, expires_at=expires_at)
+                for _ in range(min(100000, cls.tokens - start))
+            ], batch_size=10000)
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+
+    def _p50(self, check):
+        timings = []
+        for _ in range(self.checks):
+            jti = uuid.uuid4().hex
+            start = time.perf_counter()
+            check(jti)
+            timings.append(time.perf_counter() - start)
+        return sorted(timings)[len(timings) // 2] * 10 ** 6
+
+    def _refresh_rate(self):
+        client = APIClient()
+        refresh = str(RefreshToken.for_user(self.user))
+        start = time.perf_counter()
+        for _ in range(self.refreshes):
+            response = client.post('/api/v1/auth/refresh/', {'refresh': refresh}, format='json')
+            refresh = response.data['refresh']
+        return self.refreshes / (time.perf_counter() - start)
+
+    @mock.patch.object(AuthRateThrottle, 'allow_request', return_value=True)
+    def test_checks_and_refreshes(self, allow_request):
+        store = RevocationStore()
+        start = time.perf_counter()
+        store.is_revoked('warm-up')
+        built = time.perf_counter() - start
+        with_filter = self._p50(store.is_revoked)
+        without_filter = self._p50(lambda jti: RevokedToken.objects.filter(jti=jti).exists())
+
+        with mock.patch('authentication.revocation.revocations', store):
+            refreshes_with_filter = self._refresh_rate()
+        with mock.patch.object(RevocationStore, '_current_filter', return_value=None):
+            refreshes_without_filter = self._refresh_rate()
+        print(f'\n{self.tokens} revoked tokens: filter {len(store._filter.bits) / 2 ** 20:.1f} MB built in {built:.1f} s; '
+              f'unrevoked check p50 {with_filter:.1f} µs with the filter, {without_filter:.1f} µs without; '
+              f'{refreshes_with_filter:.0f} refreshes/s with the filter, {refreshes_without_filter:.0f} without')
@@ -1,15 +1,18 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenRefreshView
 from django.contrib.auth import authenticate
+from ecofindsbackend.throttling import AuthRateThrottle, LoginAccountRateThrottle
 from .serializers import UserRegistrationSerializer, UserLoginSerializer
 from users.serializers import UserProfileSerializer
+from .revocation import revoke_token
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AuthRateThrottle])
 def register(request):
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
@@ -33,6 +36,7 @@ def register(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AuthRateThrottle, LoginAccountRateThrottle])
 def login(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
@@ -55,8 +59,8 @@ def login(request):
 def logout(request):
     try:
         refresh_token = request.data.get('refresh_token')
-        token = RefreshToken(refresh_token)
-        token.blacklist()
+        # Revoked before responding: a single insert, and the token must be dead once we say so
+        revoke_token(RefreshToken(refresh_token))
         return Response({
             'message': 'Successfully logged out'
         }, status=status.HTTP_200_OK)
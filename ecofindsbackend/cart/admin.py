@@ -1,4 +1,7 @@
+from decimal import Decimal
 from django.contrib import admin
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
 from .models import Cart, CartItem
 
 class CartItemInline(admin.TabularInline):
@@ -8,11 +11,23 @@ class CartItemInline(admin.TabularInline):
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ('user', 'total_items', 'total_price', 'updated_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'user__email')
     inlines = [CartItemInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_total_price=Coalesce(
+            Sum(F('items__product__price') * F('items__quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Decimal('0')
+        ))
+
+    @admin.display(description='Total price', ordering='_total_price')
+    def total_price(self, obj):
+        return obj._total_price
+
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ('cart', 'product', 'quantity', 'added_at')
     list_filter = ('added_at',)
+    list_select_related = ('cart__user', 'product')
     search_fields = ('cart__user__username', 'product__title')
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-19 09:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_items_count(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    totals = CartItem.objects.filter(cart=OuterRef('pk')).values('cart').annotate(total=Sum('quantity')).values('total')
+    Cart.objects.update(items_count=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_items_count, migrations.RunPython.noop),
+    ]
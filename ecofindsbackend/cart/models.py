@@ -1,29 +1,141 @@
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
 from products.models import Product
 
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Sum of item quantities, maintained on every add/update/delete
+    items_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Cart for {self.user.username}"
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.items_count
 
     @property
     def total_price(self):
         return sum(item.product.price * item.quantity for item in self.items.all())
 
+class CartItemManager(models.Manager):
+    def add_products(self, user, quantities):
+        """
+        Add ``{product_id: quantity}`` to ``user``'s cart in a single upsert.
+
+        The cart row itself is only created here, on the first successful add.
+        The availability check is part of the statement, so products that
+        are missing, sold, or would end up with more in the cart than is in
+        stock are simply not inserted or updated. Returns one dict
+        per added item with its id, product_id, quantity and added_at.
+        """
+        if not quantities:
+            return []
+
+        product_ids = list(quantities)
+        cart_table = connection.ops.quote_name(Cart._meta.db_table)
+        item_table = connection.ops.quote_name(self.model._meta.db_table)
+        product_table = connection.ops.quote_name(Product._meta.db_table)
+        id_placeholders = ', '.join(['%s'] * len(product_ids))
+        quantity_case = ' '.join(['WHEN %s THEN %s'] * len(product_ids))
+        now = timezone.now()
+
+        cart_sql = (
+            f'INSERT INTO {cart_table} (user_id, created_at, updated_at, items_count) '
+            'VALUES (%s, %s, %s, 0) '
+        )
+        cart_params = [user.pk, now, now]
+        item_sql = (
+            f'INSERT INTO {item_table} (cart_id, product_id, quantity, added_at) '
+            f'SELECT %s, id, CASE id {quantity_case} END, %s '
+            f'FROM {product_table} WHERE id IN ({id_placeholders}) AND is_sold = %s '
+            f'AND quantity >= CASE id {quantity_case} END '
+        )
+        quantity_params = []
+        for product_id in product_ids:
+            quantity_params += [product_id, quantities[product_id]]
+        item_params = quantity_params + [now] + product_ids + [False] + quantity_params
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                # MySQL has no ON CONFLICT / RETURNING; LAST_INSERT_ID(id) hands
+                # back the existing cart id and the touched items are re-read
+                cursor.execute(
+                    cart_sql + 'ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), updated_at = VALUES(updated_at)',
+                    cart_params
+                )
+                cart_id = cursor.lastrowid
+                select_items_sql = (
+                    f'SELECT id, product_id, quantity, added_at FROM {item_table} '
+                    f'WHERE cart_id = %s AND product_id IN ({id_placeholders})'
+                )
+                cursor.execute(select_items_sql + ' FOR UPDATE', [cart_id] + product_ids)
+                before = {row[1]: row[2] for row in cursor.fetchall()}
+                # Like the ON CONFLICT ... WHERE below: an add that would exceed the stock changes nothing
+                cursor.execute(
+                    item_sql + 'ON DUPLICATE KEY UPDATE quantity = IF(quantity + VALUES(quantity) <= '
+                    f'(SELECT quantity FROM {product_table} WHERE id = VALUES(product_id)), '
+                    'quantity + VALUES(quantity), quantity)',
+                    [cart_id] + item_params
+                )
+                cursor.execute(select_items_sql, [cart_id] + product_ids)
+            else:
+                cursor.execute(
+                    cart_sql + 'ON CONFLICT (user_id) DO UPDATE '
+                    'SET updated_at = excluded.updated_at RETURNING id',
+                    cart_params
+                )
+                cart_id = cursor.fetchone()[0]
+                cursor.execute(
+                    item_sql + 'ON CONFLICT (cart_id, product_id) DO UPDATE '
+                    f'SET quantity = {item_table}.quantity + excluded.quantity '
+                    f'WHERE {item_table}.quantity + excluded.quantity <= '
+                    f'(SELECT quantity FROM {product_table} WHERE id = excluded.product_id) '
+                    'RETURNING id, product_id, quantity, added_at',
+                    [cart_id] + item_params
+                )
+            rows = cursor.fetchall()
+            if connection.vendor == 'mysql':
+                # Only the items the upsert actually changed, by how much they changed
+                rows = [row for row in rows if row[2] != before.get(row[1])]
+                added = sum(row[2] - before.get(row[1], 0) for row in rows)
+            else:
+                added = sum(quantities[row[1]] for row in rows)
+
+            if not rows:
+                # Nothing was available; keep the cart virtual
+                transaction.set_rollback(True)
+                return []
+
+            Cart.objects.filter(pk=cart_id).update(items_count=F('items_count') + added)
+
+        added_at = self.model._meta.get_field('added_at').get_col(self.model._meta.db_table)
+        converters = connection.ops.get_db_converters(added_at) + added_at.get_db_converters(connection)
+
+        items = []
+        for item_id, product_id, quantity, added in rows:
+            for converter in converters:
+                added = converter(added, added_at, connection)
+            items.append({
+                'id': item_id,
+                'product_id': product_id,
+                'quantity': quantity,
+                'added_at': added
+            })
+        return items
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemManager()
+
     class Meta:
         unique_together = ('cart', 'product')
 
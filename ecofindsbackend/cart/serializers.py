@@ -22,7 +22,16 @@ class AddToCartSerializer(serializers.Serializer):
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField(default=1, min_value=1)
 
+class AddToCartBatchSerializer(serializers.Serializer):
+    items = AddToCartSerializer(many=True, allow_empty=False, max_length=100)
+
 class UpdateCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ('quantity',)
+
+    def validate_quantity(self, value):
+        in_stock = self.instance.product.quantity
+        if value > in_stock:
+            raise serializers.ValidationError(f'Only {in_stock} left in stock')
+        return value
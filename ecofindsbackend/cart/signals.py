@@ -0,0 +1,12 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Cart, CartItem
+
+@receiver(post_delete, sender=CartItem)
+def decrement_cart_items_count(sender, instance, **kwargs):
+    # Also runs for cascades (e.g. a product being deleted) so the counter never drifts
+    Cart.objects.filter(pk=instance.cart_id).update(
+        items_count=Greatest(F('items_count') - instance.quantity, 0)
+    )
@@ -1,3 +1,285 @@
-from django.test import TestCase
+import os
+import threading
+import time
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from ecofindsbackend.throttling import WriteRateThrottle
+from products.models import Category, Product
+from .models import Cart, CartItem
 
-# Create your tests here.
+User = get_user_model()
+
+
+def _create_user(username):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+
+
+def _create_product(seller, quantity, **kwargs):
+    category, _ = Category.objects.get_or_create(name='Furniture', slug='furniture')
+    return Product.objects.create(
+        title='Oak chair', description='Solid oak', category=category,
+        price=Decimal('25.00'), quantity=quantity, seller=seller, **kwargs
+    )
+
+
+def _run_concurrently(workers, target):
+    """Start ``workers`` threads calling ``target(index)`` at the same moment; returns their results"""
+    barrier = threading.Barrier(workers)
+    results = [None] * workers
+    errors = []
+
+    def run(index):
+        try:
+            barrier.wait()
+            results[index] = target(index)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def _retry_locked(call):
+    # SQLite serialises writers by failing the loser with "database is locked";
+    # server databases queue the statements instead
+    for _ in range(50):
+        try:
+            return call()
+        except Exception as e:
+            if connection.vendor != 'sqlite' or 'locked' not in str(e):
+                raise
+            time.sleep(0.01)
+    raise AssertionError('Database stayed locked')
+
+
+def _add_with_retry(user, quantities):
+    return _retry_locked(lambda: CartItem.objects.add_products(user, quantities))
+
+
+class AddProductsTests(TestCase):
+    def setUp(self):
+        self.seller = _create_user('seller')
+        self.buyer = _create_user('buyer')
+
+    def test_first_add_creates_cart(self):
+        product = _create_product(self.seller, quantity=3)
+        self.assertFalse(Cart.objects.filter(user=self.buyer).exists())
+
+        items = CartItem.objects.add_products(self.buyer, {product.id: 2})
+
+        self.assertEqual([(item['product_id'], item['quantity']) for item in items], [(product.id, 2)])
+        self.assertEqual(Cart.objects.get(user=self.buyer).items_count, 2)
+
+    def test_repeat_add_increments_quantity(self):
+        product = _create_product(self.seller, quantity=5)
+        CartItem.objects.add_products(self.buyer, {product.id: 2})
+
+        items = CartItem.objects.add_products(self.buyer, {product.id: 3})
+
+        self.assertEqual(items[0]['quantity'], 5)
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+        self.assertEqual(Cart.objects.get(user=self.buyer).items_count, 5)
+
+    def test_unavailable_products_are_skipped(self):
+        product = _create_product(self.seller, quantity=2)
+        sold = _create_product(self.seller, quantity=0)
+
+        items = CartItem.objects.add_products(self.buyer, {product.id: 3, sold.id: 1, 999999: 1})
+
+        self.assertEqual(items, [])
+        # Nothing was added, so the cart stays virtual
+        self.assertFalse(Cart.objects.filter(user=self.buyer).exists())
+
+    def test_add_beyond_stock_keeps_existing_quantity(self):
+        product = _create_product(self.seller, quantity=4)
+        CartItem.objects.add_products(self.buyer, {product.id: 3})
+
+        items = CartItem.objects.add_products(self.buyer, {product.id: 2})
+
+        self.assertEqual(items, [])
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+        self.assertEqual(Cart.objects.get(user=self.buyer).items_count, 3)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.client.force_login(admin_user)
+        seller = _create_user('seller')
+        products = [_create_product(seller, quantity=5) for _ in range(3)]
+        for index in range(3):
+            CartItem.objects.add_products(_create_user(f'buyer{index}'), {product.id: 1 for product in products})
+
+    def _assert_changelist_queries(self, url, num):
+        # Session, user, filtered and total count and the page; a query per row would fail with three carts
+        with self.assertNumQueries(num):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_cart_changelist(self):
+        self._assert_changelist_queries('/admin/cart/cart/', 5)
+
+    def test_cart_item_changelist(self):
+        self._assert_changelist_queries('/admin/cart/cartitem/', 5)
+
+
+class CartViewTests(TestCase):
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE].clear()
+        self.seller = _create_user('seller')
+        self.buyer = _create_user('buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def _count(self):
+        return self.client.get('/api/v1/cart/count/').data['total_items']
+
+    def test_get_without_cart_is_virtual(self):
+        response = self.client.get('/api/v1/cart/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['id'], response.data['items'], response.data['total_items']), (None, [], 0))
+        self.assertEqual(self._count(), 0)
+        # Reads never create the cart row
+        self.assertFalse(Cart.objects.exists())
+
+    def test_count_follows_adds_updates_and_removals(self):
+        chair = _create_product(self.seller, quantity=5)
+        table = _create_product(self.seller, quantity=5)
+        items = CartItem.objects.add_products(self.buyer, {chair.id: 2, table.id: 1})
+        item_ids = {item['product_id']: item['id'] for item in items}
+        self.assertEqual(self._count(), 3)
+
+        response = self.client.patch(f'/api/v1/cart/items/{item_ids[chair.id]}/', {'quantity': 4}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._count(), 5)
+
+        # Rejected updates leave the counter alone
+        response = self.client.patch(f'/api/v1/cart/items/{item_ids[chair.id]}/', {'quantity': 6}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._count(), 5)
+
+        response = self.client.delete(f'/api/v1/cart/items/{item_ids[table.id]}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self._count(), 4)
+
+        data = self.client.get('/api/v1/cart/').data
+        self.assertEqual(data['total_items'], 4)
+        self.assertEqual([item['quantity'] for item in data['items']], [4])
+
+    def test_other_users_items_are_not_found(self):
+        product = _create_product(self.seller, quantity=5)
+        item = CartItem.objects.add_products(self.seller, {product.id: 1})[0]
+
+        response = self.client.patch(f'/api/v1/cart/items/{item["id"]}/', {'quantity': 2}, format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+
+class ConcurrentAddProductsTests(TransactionTestCase):
+    workers = 8
+    adds_per_worker = 5
+
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE].clear()
+        self.seller = _create_user('seller')
+        self.buyer = _create_user('buyer')
+
+    def test_concurrent_adds_lose_no_increments(self):
+        product = _create_product(self.seller, quantity=1000)
+
+        def add(index):
+            return sum(bool(_add_with_retry(self.buyer, {product.id: 1})) for _ in range(self.adds_per_worker))
+
+        added = sum(_run_concurrently(self.workers, add))
+
+        self.assertEqual(added, self.workers * self.adds_per_worker)
+        self.assertEqual(CartItem.objects.get().quantity, added)
+        self.assertEqual(Cart.objects.get(user=self.buyer).items_count, added)
+
+    def test_concurrent_adds_never_exceed_stock(self):
+        product = _create_product(self.seller, quantity=7)
+
+        def add(index):
+            return sum(bool(_add_with_retry(self.buyer, {product.id: 1})) for _ in range(self.adds_per_worker))
+
+        added = sum(_run_concurrently(self.workers, add))
+
+        self.assertEqual(added, 7)
+        self.assertEqual(CartItem.objects.get().quantity, 7)
+        self.assertEqual(Cart.objects.get(user=self.buyer).items_count, 7)
+
+    def test_concurrent_updates_keep_count_in_step(self):
+        product = _create_product(self.seller, quantity=100)
+        item_id = CartItem.objects.add_products(self.buyer, {product.id: 1})[0]['id']
+
+        def update(index):
+            client = APIClient()
+            client.force_authenticate(self.buyer)
+            for quantity in range(1, 6):
+                response = _retry_locked(lambda: client.patch(
+                    f'/api/v1/cart/items/{item_id}/', {'quantity': quantity + index}, format='json'
+                ))
+                assert response.status_code == 200, response.data
+
+        # Retries of locked requests would run into the write throttle
+        with mock.patch.object(WriteRateThrottle, 'get_cache_key', return_value=None):
+            _run_concurrently(self.workers, update)
+
+        self.assertEqual(Cart.objects.get(user=self.buyer).items_count, CartItem.objects.get().quantity)
+
+    def test_concurrent_first_adds_create_one_cart(self):
+        products = [_create_product(self.seller, quantity=10) for _ in range(self.workers)]
+
+        _run_concurrently(self.workers, lambda index: _add_with_retry(self.buyer, {products[index].id: 2}))
+
+        cart = Cart.objects.get(user=self.buyer)
+        self.assertEqual(cart.items.count(), self.workers)
+        self.assertEqual(cart.items_count, 2 * self.workers)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class AddProductsBenchmark(TestCase):
+    """Mean latency of the upsert against the get_or_create / read-modify-write path it replaced"""
+    iterations = 500
+
+    def setUp(self):
+        seller = _create_user('seller')
+        self.buyer = _create_user('buyer')
+        self.products = [_create_product(seller, quantity=10 ** 6) for _ in range(20)]
+
+    def _legacy_add(self, product_id, quantity):
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=self.buyer)
+            product = Product.objects.get(id=product_id, is_sold=False)
+            item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': quantity})
+            if not created:
+                item.quantity += quantity
+                item.save()
+
+    def _time(self, add):
+        start = time.perf_counter()
+        for index in range(self.iterations):
+            add(self.products[index % len(self.products)].id, 1)
+        return (time.perf_counter() - start) / self.iterations * 1000
+
+    def test_add_latency(self):
+        legacy = self._time(self._legacy_add)
+        CartItem.objects.all().delete()
+        Cart.objects.all().delete()
+        upsert = self._time(lambda product_id, quantity: CartItem.objects.add_products(self.buyer, {product_id: quantity}))
+        print(f'\nadd to cart: get_or_create {legacy:.3f} ms, upsert {upsert:.3f} ms per add')
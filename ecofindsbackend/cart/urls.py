@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path('', views.cart_list_add, name='cart_list_add'),
+    path('items/batch/', views.cart_add_batch, name='cart_add_batch'),
     path('items/<int:id>/', views.cart_item_update_remove, name='cart_item_update_remove'),
+    path('count/', views.cart_count, name='cart_count'),
     path('clear/', views.cart_clear, name='cart_clear'),
 ]
@@ -3,17 +3,29 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import F
+from products.trending import record_event
 from .models import Cart, CartItem
-from products.models import Product
-from .serializers import CartSerializer, AddToCartSerializer, UpdateCartItemSerializer
+from .serializers import (
+    CartSerializer, AddToCartSerializer, AddToCartBatchSerializer, UpdateCartItemSerializer
+)
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def cart_list_add(request):
-    # Get or create cart for user
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    
     if request.method == 'GET':
+        # Carts stay virtual until the first add, so reads never write
+        cart = Cart.objects.filter(user=request.user).prefetch_related('items__product').first()
+        if cart is None:
+            return Response({
+                'id': None,
+                'user': request.user.id,
+                'items': [],
+                'total_items': 0,
+                'total_price': 0,
+                'updated_at': None
+            }, status=status.HTTP_200_OK)
         serializer = CartSerializer(cart)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
@@ -23,56 +35,72 @@ def cart_list_add(request):
             product_id = serializer.validated_data['product_id']
             quantity = serializer.validated_data['quantity']
             
-            try:
-                product = Product.objects.get(id=product_id, is_sold=False)
-            except Product.DoesNotExist:
+            # Single upsert; unavailable products are skipped by the insert itself
+            items = CartItem.objects.add_products(request.user, {product_id: quantity})
+            if not items:
                 return Response({
-                    'message': 'Product not found or already sold'
+                    'message': 'Product not found, already sold or not enough in stock'
                 }, status=status.HTTP_404_NOT_FOUND)
-            
-            # Check if item already exists in cart
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            record_event(product_id, 'cart')
             
             return Response({
                 'message': 'Item added to cart successfully',
-                'cart_item': {
-                    'id': cart_item.id,
-                    'product_id': product.id,
-                    'quantity': cart_item.quantity,
-                    'added_at': cart_item.added_at
-                }
+                'cart_item': items[0]
             }, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def cart_add_batch(request):
+    serializer = AddToCartBatchSerializer(data=request.data)
+    if serializer.is_valid():
+        # Merge duplicate product ids so each product is upserted once
+        quantities = {}
+        for item in serializer.validated_data['items']:
+            product_id = item['product_id']
+            quantities[product_id] = quantities.get(product_id, 0) + item['quantity']
+        
+        items = CartItem.objects.add_products(request.user, quantities)
+        added_ids = {item['product_id'] for item in items}
+        for product_id in added_ids:
+            record_event(product_id, 'cart')
+        
+        return Response({
+            'message': f'{len(items)} item(s) added to cart',
+            'cart_items': items,
+            'unavailable_product_ids': [pid for pid in quantities if pid not in added_ids]
+        }, status=status.HTTP_201_CREATED)
+    
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def cart_item_update_remove(request, id):
-    cart_item = get_object_or_404(CartItem, id=id, cart__user=request.user)
-    
-    if request.method == 'PATCH':
-        serializer = UpdateCartItemSerializer(cart_item, data=request.data)
-        if serializer.is_valid():
+    with transaction.atomic():
+        # Locked, so a concurrent change cannot apply its counter delta from the same stale quantity
+        cart_item = get_object_or_404(CartItem.objects.select_for_update(), id=id, cart__user=request.user)
+        
+        if request.method == 'PATCH':
+            previous_quantity = cart_item.quantity
+            serializer = UpdateCartItemSerializer(cart_item, data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             serializer.save()
-            return Response({
-                'id': cart_item.id,
-                'product_id': cart_item.product.id,
-                'quantity': cart_item.quantity,
-                'updated_at': cart_item.cart.updated_at
-            }, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            Cart.objects.filter(pk=cart_item.cart_id).update(
+                items_count=F('items_count') + (cart_item.quantity - previous_quantity)
+            )
+        else:
+            cart_item.delete()
     
-    elif request.method == 'DELETE':
-        cart_item.delete()
+    if request.method == 'DELETE':
         return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({
+        'id': cart_item.id,
+        'product_id': cart_item.product_id,
+        'quantity': cart_item.quantity,
+        'updated_at': cart_item.cart.updated_at
+    }, status=status.HTTP_200_OK)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
@@ -87,3 +115,12 @@ def cart_clear(request):
         return Response({
             'message': 'Cart is already empty'
         }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def cart_count(request):
+    # Header badge: a single-column read, no cart row required
+    total_items = Cart.objects.filter(user=request.user).values_list('items_count', flat=True).first()
+    return Response({
+        'total_items': total_items or 0
+    }, status=status.HTTP_200_OK)
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecofindsbackend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up; answers /api/v1/events/ and passes everything else to Django
+from realtime.stream import with_event_stream  # noqa: E402
+
+application = with_event_stream(django_application)
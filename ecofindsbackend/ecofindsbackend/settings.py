@@ -49,6 +49,10 @@ INSTALLED_APPS = [
     'products',
     'cart',
     'purchases',
+    'taskqueue',
+    'analytics',
+    'realtime',
+    'mediafiles',
 ]
 
 MIDDLEWARE = [
@@ -145,8 +149,34 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'ecofindsbackend.throttling.WriteRateThrottle',
+    ],
+    # Throttles identify anonymous clients by REMOTE_ADDR; X-Forwarded-For is client-controlled
+    # unless a proxy sets it. Behind N trusted proxies set this to N to use the address they saw
+    'NUM_PROXIES': 0,
+    # Search and auth views opt into their own scopes with @throttle_classes
+    'DEFAULT_THROTTLE_RATES': {
+        'search': '120/min',
+        'auth': '20/min',
+        'login_account': '10/min',
+        'write': '60/min',
+    },
 }
 
+# Counters for ecofindsbackend.throttling. locmem is per process; with several
+# workers point the alias at a shared cache (Redis, memcached) instead
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
+}
+THROTTLE_CACHE = 'throttle'
+
 # JWT Settings
 from datetime import timedelta
 
@@ -155,8 +185,92 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Revocations go to authentication.RevokedToken (see authentication/revocation.py)
+    'TOKEN_REFRESH_SERIALIZER': 'authentication.serializers.RevocableTokenRefreshSerializer',
 }
 
+# Inventory settings
+# How long stock stays held for a buyer between starting checkout and paying
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
+
+# Idempotency-Key settings for checkout
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# Node id (0-1023) embedded in order numbers. None picks one at random in each process;
+# a fixed value is shared by every worker that loads these settings, so only set it
+# where each process gets its own. Colliding numbers are redrawn by Purchase.save.
+ORDER_NUMBER_NODE_ID = None
+
+# Background task queue (see taskqueue app and `manage.py run_workers`)
+# Base delay in seconds before a failed task is retried; doubles on every attempt
+TASK_RETRY_BACKOFF = 5
+# Running tasks older than this are assumed orphaned by a dead worker and requeued
+TASK_VISIBILITY_TIMEOUT = timedelta(minutes=10)
+# Succeeded tasks are kept this long for latency metrics (`manage.py task_stats`)
+TASK_RESULT_TTL = timedelta(days=7)
+
+# Seconds before each process rebuilds its in-memory search suggestion index
+SUGGEST_INDEX_TTL = 300
+
+# Typo-tolerant search: used when a query has fewer exact matches than the threshold
+FUZZY_FALLBACK_THRESHOLD = 5
+# Minimum trigram (Jaccard) similarity for a word to count as a misspelling of another
+FUZZY_MIN_SIMILARITY = 0.25
+FUZZY_INDEX_TTL = 900
+
+# Offline gazetteer (place or postal code -> coordinates) used to geocode locations
+GAZETTEER_PATH = BASE_DIR / 'products' / 'data' / 'gazetteer.csv'
+
+# Trending: event buckets are flushed from memory every TRENDING_FLUSH_INTERVAL seconds
+# and decayed into Product.trending_score by `manage.py compute_trending`
+TRENDING_FLUSH_INTERVAL = 5
+TRENDING_BUCKET = timedelta(hours=1)
+TRENDING_HALF_LIFE = timedelta(hours=24)
+TRENDING_WINDOW = timedelta(days=7)
+TRENDING_EVENT_WEIGHTS = {'view': 1.0, 'cart': 5.0}
+
+# Seller analytics (`manage.py rollup_analytics`) only folds in rows at least this old, so a
+# slower transaction's lower ids are not skipped; it must exceed the longest write transaction
+ANALYTICS_ROLLUP_SETTLE = timedelta(seconds=5)
+
+# Rows fetched per database round trip by the streaming CSV / JSON Lines exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Bulk listing import: rows per bulk_create transaction, and the synchronous API's row cap
+BULK_IMPORT_CHUNK_SIZE = 500
+BULK_IMPORT_MAX_ROWS = 5000
+
+# Most products returned by one GET /api/v1/products/batch/?ids= request
+PRODUCT_BATCH_MAX_IDS = 100
+
+# Sold listings untouched for this long move to the archive tables (manage.py archive_sold_listings)
+ARCHIVE_SOLD_AFTER = timedelta(days=180)
+
+# Product change feed (GET /api/v1/products/changes/): entries younger than PRODUCT_CHANGE_SETTLE
+# are held back so slower concurrent transactions are not skipped; it must exceed the longest
+# write transaction. `manage.py compact_product_changes` drops entries older than the retention,
+# so clients that have not synced for that long refetch the list.
+PRODUCT_CHANGE_SETTLE = timedelta(seconds=5)
+PRODUCT_CHANGE_RETENTION = timedelta(days=30)
+PRODUCT_CHANGE_PAGE_SIZE = 500
+
+# Revoked refresh tokens: each process screens refreshes with a Bloom filter of them,
+# picks up other processes' revocations every REVOKED_TOKEN_SYNC_INTERVAL seconds and
+# rebuilds the filter every REVOKED_TOKEN_FILTER_REBUILD (manage.py purge_revoked_tokens
+# deletes expired rows)
+REVOKED_TOKEN_FILTER_ERROR_RATE = 0.01
+REVOKED_TOKEN_SYNC_INTERVAL = 1
+REVOKED_TOKEN_FILTER_REBUILD = timedelta(hours=1)
+
+# Event stream (GET /api/v1/events/, served by asgi.py): the product change log is polled every
+# REALTIME_POLL_INTERVAL seconds per process; a stream more than REALTIME_QUEUE_SIZE events
+# behind is closed and the client reconnects after REALTIME_RETRY_MS
+REALTIME_POLL_INTERVAL = 1
+REALTIME_HEARTBEAT = 15
+REALTIME_QUEUE_SIZE = 100
+REALTIME_RETRY_MS = 3000
+REALTIME_MAX_PRODUCTS = 100
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React development server
@@ -167,6 +281,20 @@ CORS_ALLOWED_ORIGINS = [
 import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Uploads are stored once per distinct content, named by its hash, so mediafiles.views can serve
+# them as immutable; `manage.py gc_media` deletes files unreferenced for MEDIA_GC_GRACE
+STORAGES = {
+    'default': {'BACKEND': 'mediafiles.storage.DedupMediaStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Hand media transfers to the front web server: 'x-accel-redirect' (nginx, with an internal
+# location at MEDIA_ACCEL_PREFIX aliasing MEDIA_ROOT) or 'x-sendfile' (Apache, lighttpd).
+# None serves files from Django.
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Browser cache lifetime for uploads from before content addressing
+MEDIA_CACHE_MAX_AGE = 86400
+MEDIA_GC_GRACE = timedelta(hours=24)
 
 # Static files settings
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -0,0 +1,100 @@
+"""
+Rate limiting on a shared cache.
+
+DRF's built-in throttles keep a list of request timestamps per client and
+rewrite it on every request. These use a sliding window counter instead:
+one counter per fixed window, with the previous window weighted by how much
+of it still overlaps the last ``duration`` seconds. A decision is one
+get_many and one incr, and the counters live in the THROTTLE_CACHE alias,
+so production can point it at memcached or Redis without code changes.
+
+Budgets come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] by scope;
+DRF adds the Retry-After header from ``wait()``.
+"""
+import math
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    def __init__(self):
+        super().__init__()
+        self.cache = caches[settings.THROTTLE_CACHE]
+
+    def get_cache_key(self, request, view):
+        # Signed-in clients are counted per user, everyone else per IP
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'throttle:{self.scope}:{ident}'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        current_key, previous_key = f'{key}:{window}', f'{key}:{window - 1}'
+        counts = self.cache.get_many([current_key, previous_key])
+        self.current = counts.get(current_key, 0)
+        self.previous = counts.get(previous_key, 0)
+        self.elapsed = now - window * self.duration
+        if self.previous * (1 - self.elapsed / self.duration) + self.current >= self.num_requests:
+            return False
+
+        try:
+            self.cache.incr(current_key)
+        except ValueError:
+            # First hit in this window; add() loses to a concurrent first hit, which then incr()s
+            if not self.cache.add(current_key, 1, timeout=self.duration * 2):
+                self.cache.incr(current_key)
+        return True
+
+    def wait(self):
+        """Seconds until the weighted count drops back under the limit"""
+        if self.current < self.num_requests:
+            # The previous window's share has to fade by the overshoot
+            needed = self.previous * (1 - self.elapsed / self.duration) + self.current - self.num_requests + 1
+            return max(math.ceil(needed * self.duration / self.previous), 1)
+        # Only the next window helps, and then this one becomes the fading previous window
+        fade = self.duration * (1 - self.num_requests / self.current)
+        return max(math.ceil(self.duration - self.elapsed + fade), 1)
+
+
+class SearchRateThrottle(SlidingWindowThrottle):
+    scope = 'search'
+
+
+class AuthRateThrottle(SlidingWindowThrottle):
+    """Sign-in, sign-up and token refresh attempts per IP"""
+    scope = 'auth'
+
+    def get_cache_key(self, request, view):
+        return f'throttle:{self.scope}:ip:{self.get_ident(request)}'
+
+
+class LoginAccountRateThrottle(SlidingWindowThrottle):
+    """Sign-in attempts per account from one IP"""
+    scope = 'login_account'
+
+    def get_cache_key(self, request, view):
+        # Keyed on the IP too: counted per account alone, anyone could lock its owner out
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email:
+            return None
+        return f'throttle:{self.scope}:{email.strip().lower()}:ip:{self.get_ident(request)}'
+
+
+class WriteRateThrottle(SlidingWindowThrottle):
+    """Creates, updates and deletes; reads are not counted"""
+    scope = 'write'
+
+    def get_cache_key(self, request, view):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+        return super().get_cache_key(request, view)
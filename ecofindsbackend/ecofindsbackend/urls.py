@@ -14,11 +14,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
-from products.views import category_list, search_products
+from mediafiles.views import serve_media
+from products.views import category_list, search_products, search_suggest
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -29,12 +30,15 @@ urlpatterns = [
     path('api/v1/products/', include('products.urls')),
     path('api/v1/cart/', include('cart.urls')),
     path('api/v1/purchases/', include('purchases.urls')),
+    path('api/v1/analytics/', include('analytics.urls')),
     
     # Additional endpoints
     path('api/v1/categories/', category_list, name='category_list'),
     path('api/v1/search/', search_products, name='search_products'),
+    path('api/v1/search/suggest/', search_suggest, name='search_suggest'),
 ]
 
-# Serve media files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media files, in development and production (see mediafiles/views.py)
+urlpatterns += [
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='serve_media'),
+]
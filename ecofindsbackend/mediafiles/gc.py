@@ -0,0 +1,99 @@
+"""
+Garbage collection for DedupMediaStorage.
+
+Blobs whose refcount has been zero for MEDIA_GC_GRACE are deleted with
+their files. Files with no blob row at all (written by an upload whose
+transaction rolled back) are swept after the same grace.
+
+Writes that bypass model saves and deletes (queryset updates, raw SQL)
+can leave references counted that no longer exist, or miss new ones.
+``recount_references`` recomputes every refcount from the file fields
+themselves. It stamps changed blobs as just updated, so a reference
+committed while it was counting is never collected before the next recount
+corrects it.
+"""
+import os
+from collections import Counter
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import Count
+from django.utils import timezone
+from .models import MediaBlob
+from .storage import is_blob_name
+
+
+def file_fields():
+    """(model, field name) for every file field stored in the default storage"""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField) and field.storage is default_storage
+    ]
+
+
+def recount_references(batch_size=1000):
+    """Reset refcounts to the number of file fields naming each blob; returns how many changed"""
+    started = timezone.now()
+    counts = Counter()
+    for model, field in file_fields():
+        references = model._base_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+        for name, count in references.values_list(field).annotate(count=Count('pk')).order_by():
+            counts[name] += count
+
+    changed, last_id = 0, 0
+    while True:
+        blobs = list(MediaBlob.objects.filter(id__gt=last_id).order_by('id').only('id', 'name', 'refcount')[:batch_size])
+        if not blobs:
+            return changed
+        last_id = blobs[-1].id
+        stale = [blob for blob in blobs if blob.refcount != counts.get(blob.name, 0)]
+        for blob in stale:
+            blob.refcount, blob.updated_at = counts.get(blob.name, 0), started
+        MediaBlob.objects.bulk_update(stale, ['refcount', 'updated_at'])
+        changed += len(stale)
+
+
+def collect_garbage(grace=None, batch_size=1000):
+    """Delete unreferenced blobs and orphaned files older than ``grace``; returns (blobs, orphans) removed"""
+    cutoff = timezone.now() - (settings.MEDIA_GC_GRACE if grace is None else grace)
+    removed = 0
+    while True:
+        with transaction.atomic():
+            # Locked, so an upload of the same content waits and then writes the file again
+            blobs = list(
+                MediaBlob.objects.select_for_update().filter(refcount__lte=0, updated_at__lt=cutoff)
+                .order_by('id').only('id', 'name')[:batch_size]
+            )
+            if not blobs:
+                break
+            MediaBlob.objects.filter(id__in=[blob.id for blob in blobs]).delete()
+            for blob in blobs:
+                default_storage.purge(blob.name)
+        removed += len(blobs)
+    return removed, _sweep_orphans(cutoff, batch_size)
+
+
+def _sweep_orphans(cutoff, batch_size):
+    swept = 0
+    candidates = []
+    for directory, _, filenames in os.walk(settings.MEDIA_ROOT):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            if is_blob_name(name) and os.path.getmtime(path) < cutoff.timestamp():
+                candidates.append(name)
+            if len(candidates) >= batch_size:
+                swept += _delete_orphans(candidates)
+                candidates = []
+    return swept + _delete_orphans(candidates)
+
+
+def _delete_orphans(names):
+    known = set(MediaBlob.objects.filter(name__in=names).values_list('name', flat=True))
+    for name in names:
+        if name not in known:
+            default_storage.purge(name)
+    return len(names) - len(known)
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from mediafiles.gc import collect_garbage, recount_references
+
+class Command(BaseCommand):
+    help = 'Delete stored media files that no listing or profile references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, help='Unreferenced for at least this long (defaults to MEDIA_GC_GRACE)')
+        parser.add_argument('--recount', action='store_true', help='Recompute reference counts from the database first')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep collecting every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        grace = timedelta(hours=options['grace_hours']) if options['grace_hours'] is not None else None
+        while True:
+            if options['recount']:
+                changed = recount_references(batch_size=options['batch_size'])
+                self.stdout.write(f'Corrected {changed} reference count(s)')
+            blobs, orphans = collect_garbage(grace=grace, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Removed {blobs} unreferenced file(s) and {orphans} orphaned file(s)'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
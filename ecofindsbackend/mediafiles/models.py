@@ -0,0 +1,18 @@
+from django.db import models
+
+class MediaBlob(models.Model):
+    """A file stored by content hash; ``refcount`` is the number of file fields pointing at it"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last refcount change; unreferenced blobs are only collected after MEDIA_GC_GRACE
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} ref(s))"
@@ -0,0 +1,60 @@
+"""
+Reference counting for deleted rows and replaced files.
+
+Deleting a row that names a stored file drops the file's reference in the
+deleting transaction, however the row goes: the API, the admin,
+``set_images`` or a cascade. Saving a row whose file field no longer names
+the file it was loaded with (a new profile image, say) drops the old file's
+reference the same way. Receivers are connected for each model with a file
+field in the default storage, so models without files keep Django's fast
+deletes.
+"""
+from collections import defaultdict
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from .gc import file_fields
+from .storage import release_references
+
+FILE_FIELDS = defaultdict(list)
+for model, field in file_fields():
+    FILE_FIELDS[model].append(field)
+
+
+def release_deleted_files(sender, instance, **kwargs):
+    release_references([getattr(instance, field).name for field in FILE_FIELDS[sender]])
+
+
+def remember_stored_files(sender, instance, **kwargs):
+    # Names as loaded from the database; deferred fields and uploads not saved yet are left out
+    instance._stored_files = {
+        field: instance.__dict__[field] for field in FILE_FIELDS[sender]
+        if isinstance(instance.__dict__.get(field), str)
+    }
+
+
+def note_replaced_files(sender, instance, update_fields=None, **kwargs):
+    stored = instance.__dict__.get('_stored_files', {})
+    replaced = []
+    for field, name in stored.items():
+        if not name or (update_fields is not None and field not in update_fields):
+            continue
+        file = getattr(instance, field)
+        # A new upload adds a reference of its own, even when its content is the old file's
+        if file.name != name or not file._committed:
+            replaced.append(name)
+    instance._replaced_files = replaced
+
+
+def release_replaced_files(sender, instance, update_fields=None, **kwargs):
+    release_references(instance.__dict__.pop('_replaced_files', []))
+    stored = instance.__dict__.setdefault('_stored_files', {})
+    for field in FILE_FIELDS[sender]:
+        if update_fields is None or field in update_fields:
+            stored[field] = getattr(instance, field).name
+
+
+for model in FILE_FIELDS:
+    uid = f'release_files:{model._meta.label_lower}'
+    post_delete.connect(release_deleted_files, sender=model, dispatch_uid=uid)
+    post_init.connect(remember_stored_files, sender=model, dispatch_uid=uid)
+    pre_save.connect(note_replaced_files, sender=model, dispatch_uid=uid)
+    post_save.connect(release_replaced_files, sender=model, dispatch_uid=uid)
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import re
+from collections import Counter, defaultdict
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import MediaBlob
+
+# <sha256>.ext, written by DedupMediaStorage
+BLOB_NAME_RE = re.compile(r'(^|/)[0-9a-f]{64}\.[^./]+$')
+
+
+def is_blob_name(name):
+    return BLOB_NAME_RE.search(name) is not None
+
+
+def _content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def _adjust_references(names, delta):
+    # One UPDATE per distinct occurrence count; names that are not blobs are not counted
+    counts = Counter(name for name in names if name and is_blob_name(name))
+    by_count = defaultdict(list)
+    for name, count in counts.items():
+        by_count[count].append(name)
+    for count, group in by_count.items():
+        MediaBlob.objects.filter(name__in=group).update(refcount=F('refcount') + delta * count, updated_at=timezone.now())
+
+
+def add_references(names):
+    """One more reference per occurrence of a blob name in ``names``"""
+    _adjust_references(names, 1)
+
+
+def release_references(names):
+    """One reference fewer per occurrence of a blob name in ``names``"""
+    _adjust_references(names, -1)
+
+
+class DedupMediaStorage(FileSystemStorage):
+    """
+    Content-addressed media storage with reference counting.
+
+    Files are named by the SHA-256 of their content, so uploading a photo
+    that is already stored writes nothing. Every save adds a reference to
+    the file's MediaBlob, inside the caller's transaction; deleting a row
+    that names the file (mediafiles.signals) or calling delete() drops one.
+    Files are only removed by `manage.py gc_media`, once nothing has
+    referenced them for MEDIA_GC_GRACE.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = os.path.split(name)
+        name = os.path.join(directory, _content_hash(content) + os.path.splitext(filename)[1].lower())
+
+        with transaction.atomic():
+            blob, _ = MediaBlob.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': content.size, 'updated_at': timezone.now()}
+            )
+            if not self.exists(name):
+                # New content, or a file already collected; an orphan from a rolled-back upload is reused as is
+                saved = self._save(name, content)
+                if saved != name:
+                    # A concurrent upload of the same content wrote the file first, so this copy went beside it
+                    super().delete(saved)
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+        return name
+
+    def delete(self, name):
+        """Drop one reference; the file stays until `manage.py gc_media` finds it unreferenced"""
+        if not is_blob_name(name):
+            # Stored before content addressing; nothing counts its references
+            return super().delete(name)
+        release_references([name])
+
+    def purge(self, name):
+        """Remove the file itself, whatever its references; used by the garbage collector"""
+        super().delete(name)
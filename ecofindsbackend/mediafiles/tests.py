@@ -0,0 +1,286 @@
+import hashlib
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import TestCase, override_settings
+from products.archive import archive_sold_listings
+from products.models import Category, Product, ProductImage
+from .models import MediaBlob
+
+User = get_user_model()
+
+
+class ReferenceCountTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root.name
+
+        self.seller = User.objects.create_user(username='seller', email='seller@example.com', password='password')
+        self.category = Category.objects.create(name='Furniture', slug='furniture')
+
+    def _listing(self, content=b'photo', quantity=1):
+        product = Product.objects.create(
+            title='Oak chair', description='Solid oak', category=self.category,
+            price=Decimal('25.00'), quantity=quantity, seller=self.seller
+        )
+        image = ProductImage.objects.create(product=product, image=SimpleUploadedFile('chair.JPG', content))
+        return product, image.image.name
+
+    def _refcount(self, name):
+        return MediaBlob.objects.get(name=name).refcount
+
+    def test_same_content_is_stored_once(self):
+        _, first = self._listing()
+        _, second = self._listing()
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.jpg'))
+        self.assertEqual(self._refcount(first), 2)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'product_images')), [os.path.basename(first)])
+
+    def test_deleting_rows_releases_their_files(self):
+        product, name = self._listing()
+        self._listing()
+
+        product.delete()
+        self.assertEqual(self._refcount(name), 1)
+
+        # Cascades from the seller through their listings to the images
+        self.seller.delete()
+        self.assertEqual(self._refcount(name), 0)
+
+    def test_rolled_back_delete_keeps_references(self):
+        product, name = self._listing()
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                product.delete()
+                raise RuntimeError
+
+        self.assertEqual(self._refcount(name), 1)
+
+    def test_archived_listing_keeps_its_reference(self):
+        product, name = self._listing(quantity=0)
+        Product.objects.filter(pk=product.pk).update(updated_at=product.updated_at - timedelta(days=1))
+
+        self.assertEqual(archive_sold_listings(older_than=timedelta(hours=1)), 1)
+
+        self.assertEqual(self._refcount(name), 1)
+
+    def test_replacing_a_file_releases_the_old_one(self):
+        user = User.objects.get(pk=self.seller.pk)
+        user.profile_image = SimpleUploadedFile('me.png', b'old face')
+        user.save()
+        old = user.profile_image.name
+
+        # Loaded afresh, as a profile edit would be
+        user = User.objects.get(pk=self.seller.pk)
+        user.profile_image = SimpleUploadedFile('me.png', b'new face')
+        user.save()
+
+        self.assertEqual(self._refcount(old), 0)
+        self.assertEqual(self._refcount(user.profile_image.name), 1)
+
+        # Saved again on the same instance, the first replacement is released too
+        new = user.profile_image.name
+        user.profile_image = None
+        user.save()
+        self.assertEqual(self._refcount(new), 0)
+
+    def test_reuploading_the_same_content_keeps_one_reference(self):
+        product, _ = self._listing()
+        product.image = SimpleUploadedFile('chair.jpg', b'legacy')
+        product.save()
+        name = product.image.name
+
+        product = Product.objects.get(pk=product.pk)
+        product.image = SimpleUploadedFile('chair.jpg', b'legacy')
+        product.save()
+
+        self.assertEqual(product.image.name, name)
+        self.assertEqual(self._refcount(name), 1)
+
+    def test_saves_that_leave_the_file_keep_its_reference(self):
+        product, _ = self._listing()
+        product.image = SimpleUploadedFile('chair.jpg', b'legacy')
+        product.save()
+        name = product.image.name
+
+        Product.objects.get(pk=product.pk).save()
+        Product.objects.defer('image').get(pk=product.pk).save()
+        product.image = SimpleUploadedFile('chair.jpg', b'other')
+        product.save(update_fields=['title'])
+
+        self.assertEqual(self._refcount(name), 1)
+
+    def test_concurrent_first_upload_leaves_no_copy(self):
+        _, name = self._listing()
+        MediaBlob.objects.filter(name=name).delete()
+
+        # The other upload wrote the file between this one's check and its write
+        storage_class = type(default_storage._wrapped)
+        exists = storage_class.exists
+        stale_checks = [name]
+
+        def racing_exists(storage, path):
+            if path in stale_checks:
+                stale_checks.remove(path)
+                return False
+            return exists(storage, path)
+
+        with mock.patch.object(storage_class, 'exists', racing_exists):
+            _, saved = self._listing()
+
+        self.assertEqual(saved, name)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'product_images')), [os.path.basename(name)])
+
+
+class ServeMediaTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        os.makedirs(os.path.join(media_root.name, 'product_images'))
+        self.path = os.path.join(media_root.name, 'product_images', 'chair.txt')
+        with open(self.path, 'wb') as file:
+            file.write(b'0123456789')
+        self.url = '/media/product_images/chair.txt'
+
+    def _content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._content(response), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+
+    def test_byte_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self._content(response), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self._content(response), b'789')
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_range_ignored_when_if_range_does_not_match(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._content(response), b'0123456789')
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_precompressed_sibling(self):
+        with open(self.path + '.gz', 'wb') as file:
+            file.write(b'gzipped')
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(self._content(response), b'gzipped')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        # Each encoding revalidates against its own ETag
+        self.assertNotEqual(response['ETag'], self.client.get(self.url)['ETag'])
+
+        # A range applies to the plain file only
+        ranged = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_RANGE='bytes=0-1')
+        self.assertEqual(self._content(ranged), b'01')
+        self.assertFalse(ranged.has_header('Content-Encoding'))
+
+    @override_settings(MEDIA_ACCEL='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        # Files that do not exist are still answered by Django
+        response = self.client.get('/media/product_images/oak%20chair.txt')
+
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/product_images/chair.txt')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response.content, b'')
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class DedupBenchmark(TestCase):
+    """
+    Dedup ratio and upload latency of BENCHMARK_UPLOADS uploads (5000 by default).
+
+    The photos are drawn from a pool a fifth the size, most-used first (a seller
+    reusing the same shots across listings and edits), and saved through
+    DedupMediaStorage and a plain FileSystemStorage.
+    """
+    uploads = int(os.environ.get('BENCHMARK_UPLOADS', 5000))
+    photo_size = 200 * 1024
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root.name
+
+    def _disk_usage(self, directory):
+        directory = os.path.join(self.media_root, directory)
+        return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+    def _save_all(self, storage, directory, photos):
+        timings = []
+        for photo in photos:
+            start = time.perf_counter()
+            storage.save(f'{directory}/photo.jpg', ContentFile(photo))
+            timings.append(time.perf_counter() - start)
+        return sorted(timings)[len(timings) // 2] * 1000
+
+    def test_dedup_ratio(self):
+        rng = random.Random(0)
+        pool = [hashlib.sha256(str(index).encode()).digest() * (self.photo_size // 32) for index in range(self.uploads // 5)]
+        weights = [1 / (rank + 1) for rank in range(len(pool))]
+        photos = rng.choices(pool, weights, k=self.uploads)
+
+        plain = self._save_all(FileSystemStorage(location=self.media_root), 'plain', photos)
+        dedup = self._save_all(default_storage, 'dedup', photos)
+        uploaded, stored = self._disk_usage('plain'), self._disk_usage('dedup')
+        print(f'\n{self.uploads} uploads of {len(set(photos))} distinct photos: {uploaded / 2 ** 20:.0f} MiB uploaded, '
+              f'{stored / 2 ** 20:.0f} MiB stored, dedup ratio {uploaded / stored:.1f}x; '
+              f'median save {dedup:.2f} ms deduplicated, {plain:.2f} ms plain')
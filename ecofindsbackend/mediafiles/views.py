@@ -0,0 +1,136 @@
+"""
+Media file serving.
+
+With MEDIA_ACCEL set, the view only resolves the file and hands the transfer
+to the front web server (nginx X-Accel-Redirect, or X-Sendfile for Apache
+and lighttpd), which also deals with ranges and conditional requests, so no
+Python worker is tied up while an image downloads. Without it the view
+serves the file itself: single byte ranges, ETag / Last-Modified
+revalidation, and a file object the WSGI server can pass to sendfile().
+
+Content-addressed names (see mediafiles.storage) are cached as
+immutable for a year; older uploads get MEDIA_CACHE_MAX_AGE.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from .storage import is_blob_name
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Served from a .br / .gz sibling when one exists and the client accepts it
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+class FileRange:
+    """``length`` bytes of an open file from ``start``; keeps fileno() so WSGI servers can still sendfile()"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file, self.remaining, self.name = file, length, file.name
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single byte range; None to send the whole file; ValueError if unsatisfiable"""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Malformed and multi-range requests may be answered with the full file
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(fullpath)
+    except (OSError, ValueError):
+        raise Http404('Media file not found')
+    if not os.path.isfile(fullpath):
+        raise Http404('Media file not found')
+
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    cache_control = IMMUTABLE if is_blob_name(path) else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+    if settings.MEDIA_ACCEL:
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_ACCEL == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_PREFIX + path)
+        else:
+            response['X-Sendfile'] = fullpath
+        response['Cache-Control'] = cache_control
+        return response
+
+    encoding = None
+    if 'Range' not in request.headers:
+        accepted = request.headers.get('Accept-Encoding', '')
+        for name, suffix in PRECOMPRESSED:
+            if name in accepted and os.path.isfile(fullpath + suffix):
+                encoding, fullpath = name, fullpath + suffix
+                stat = os.stat(fullpath)
+                break
+
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    last_modified = http_date(stat.st_mtime)
+    headers = {'ETag': etag, 'Last-Modified': last_modified, 'Cache-Control': cache_control, 'Accept-Ranges': 'bytes'}
+    if encoding:
+        headers.update({'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'})
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    byte_range = None
+    if range_header and (not if_range or if_range in (etag, last_modified)):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(
+            FileRange(open(fullpath, 'rb'), start, end - start + 1),
+            status=206, content_type=content_type, filename=posixpath.basename(path)
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    else:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type, filename=posixpath.basename(path))
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -1,5 +1,25 @@
+import copy
+from django import forms
 from django.contrib import admin
-from .models import Category, Product
+from django.contrib.admin.helpers import ActionForm
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from mediafiles.storage import is_blob_name
+from .archive import delete_listings
+from .exports import export_listings
+from .inventory import InsufficientStock, save_listing
+from .models import (
+    ArchivedProduct, ArchivedProductImage, Category, Product, ProductChange, ProductImage, StockReservation
+)
+from .signals import index_updated_products
+from .tasks import delete_media_files
+
+# Fields the search indexes read, loaded before a bulk update so they can be adjusted afterwards
+INDEXED_FIELDS = ('category', 'condition', 'price', 'location', 'title', 'brand', 'model', 'is_sold', 'quantity')
+
+class ProductActionForm(ActionForm):
+    category = forms.ModelChoiceField(Category.objects.all(), required=False, label='Category')
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -7,10 +27,111 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name', 'description')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_product_count=Count('products'))
+
+    @admin.display(description='Product count', ordering='_product_count')
+    def product_count(self, obj):
+        return obj._product_count
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('title', 'category', 'price', 'condition', 'seller', 'is_sold', 'view_count', 'created_at')
+    list_display = ('title', 'category', 'price', 'quantity', 'condition', 'seller', 'is_sold', 'view_count', 'created_at')
     list_filter = ('category', 'condition', 'is_sold', 'created_at')
+    list_select_related = ('category', 'seller')
     search_fields = ('title', 'description', 'seller__username', 'seller__email')
-    readonly_fields = ('view_count', 'created_at', 'updated_at')
-    list_editable = ('is_sold',)
+    readonly_fields = ('is_sold', 'reserved', 'view_count', 'created_at', 'updated_at')
+    list_editable = ('quantity',)
+    action_form = ProductActionForm
+    actions = ('mark_sold', 'mark_unsold', 'reassign_category', 'export_csv', 'export_jsonl')
+
+    def _bulk_update(self, queryset, **values):
+        """One UPDATE for the whole selection, with the search indexes adjusted to match"""
+        with transaction.atomic():
+            previous = list(queryset.select_related(None).order_by().only(*INDEXED_FIELDS))
+            updated = queryset.update(updated_at=timezone.now(), **values)
+            changes = []
+            for product in previous:
+                current = copy.copy(product)
+                for field, value in values.items():
+                    setattr(current, field, value)
+                changes.append((product, current))
+            index_updated_products(changes)
+            ProductChange.record([product.pk for product in previous])
+        return updated
+
+    @admin.action(description='Mark selected products as sold')
+    def mark_sold(self, request, queryset):
+        # Same rule as the API: marking sold empties the stock
+        updated = self._bulk_update(queryset.filter(is_sold=False), quantity=0, is_sold=True)
+        self.message_user(request, f'{updated} product(s) marked as sold')
+
+    @admin.action(description='Mark selected products as available')
+    def mark_unsold(self, request, queryset):
+        # ...and relisting a sold-out product restores one unit
+        updated = self._bulk_update(queryset.filter(is_sold=True), quantity=1, is_sold=False)
+        self.message_user(request, f'{updated} product(s) marked as available')
+
+    @admin.action(description='Move selected products to category')
+    def reassign_category(self, request, queryset):
+        form = self.action_form(request.POST)
+        if not form.is_valid() or not form.cleaned_data['category']:
+            self.message_user(request, 'Choose a category to move the products to', level='error')
+            return
+        category = form.cleaned_data['category']
+        updated = self._bulk_update(queryset.exclude(category=category), category_id=category.id)
+        self.message_user(request, f'{updated} product(s) moved to {category.name}')
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Edits (list_editable included) write only the changed columns, and stock as a difference
+        try:
+            save_listing(obj, form.changed_data, form.initial['quantity'])
+        except InsufficientStock:
+            self.message_user(request, f'Stock of "{obj}" cannot go below the units buyers are holding in checkout', level='error')
+
+    def delete_queryset(self, request, queryset):
+        # Signals still fire per row, but facet counts are written once for the whole selection.
+        # Bought listings are archived instead, so purchase history keeps them.
+        # Content-addressed files are released by those signals; older files are deleted here
+        paths = set(ProductImage.objects.filter(product__in=queryset).values_list('image', flat=True))
+        paths.update(queryset.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True))
+        with transaction.atomic():
+            delete_listings(queryset)
+            transaction.on_commit(lambda: self._delete_files(paths))
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Product.objects.filter(pk=obj.pk))
+
+    def _delete_files(self, paths):
+        # Files from before content addressing are not reference counted: keep those another listing points at
+        legacy = {path for path in paths if not is_blob_name(path)}
+        legacy -= set(ProductImage.objects.filter(image__in=legacy).values_list('image', flat=True))
+        legacy -= set(Product.objects.filter(image__in=legacy).values_list('image', flat=True))
+        legacy -= set(ArchivedProductImage.objects.filter(image__in=legacy).values_list('image', flat=True))
+        legacy -= set(ArchivedProduct.objects.filter(image__in=legacy).values_list('image', flat=True))
+        if legacy:
+            delete_media_files.delay(sorted(legacy))
+
+    @admin.action(description='Export selected products as CSV')
+    def export_csv(self, request, queryset):
+        return export_listings(queryset, 'csv', filename='products')
+
+    @admin.action(description='Export selected products as JSON Lines')
+    def export_jsonl(self, request, queryset):
+        return export_listings(queryset, 'jsonl', filename='products')
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'user', 'quantity', 'expires_at', 'created_at')
+    list_filter = ('expires_at',)
+    list_select_related = ('product', 'user')
+    search_fields = ('product__title', 'user__email')
+
+@admin.register(ArchivedProduct)
+class ArchivedProductAdmin(admin.ModelAdmin):
+    list_display = ('title', 'category', 'price', 'seller', 'created_at', 'archived_at')
+    list_filter = ('category', 'archived_at')
+    list_select_related = ('category', 'seller')
+    search_fields = ('title', 'seller__username', 'seller__email')
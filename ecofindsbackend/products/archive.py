@@ -0,0 +1,103 @@
+"""
+Archival of sold listings into cold storage tables.
+
+Listings sold more than ARCHIVE_SOLD_AFTER ago are copied into
+ArchivedProduct / ArchivedProductImage with their original ids and deleted
+from the hot tables, one batch per transaction. The hot table and its
+indexes then only grow with the live catalogue.
+
+PurchaseItem and ProductDailyStats reference products without a database
+constraint, so their ids stay valid after archival; `resolve_listings`
+looks an id up in either table, as the sales rollup does for the seller.
+For the same reason a listing that was ever bought is archived rather than
+deleted (`delete_listings`), so no purchase item points at nothing.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from mediafiles.storage import add_references
+from purchases.models import PurchaseItem
+from .models import ArchivedProduct, ArchivedProductImage, Product, ProductImage
+from .signals import batched_facet_updates
+
+PRODUCT_FIELDS = [field.column for field in ArchivedProduct._meta.concrete_fields if field.name != 'archived_at']
+IMAGE_FIELDS = ['product_id', 'image', 'is_main', 'order', 'alt_text', 'created_at']
+
+
+def archive_sold_listings(older_than=None, batch_size=1000):
+    """Move listings sold before ``older_than`` ago into the archive; returns how many moved"""
+    cutoff = timezone.now() - (older_than or settings.ARCHIVE_SOLD_AFTER)
+    candidates = Product.objects.filter(is_sold=True, updated_at__lt=cutoff).order_by('id')
+    archived, last_id = 0, 0
+    while True:
+        ids = list(candidates.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return archived
+        last_id = ids[-1]
+        archived += _archive_batch(ids, cutoff)
+
+
+def _copy_rows(cursor, source, target, columns, ids_column, ids, **extra):
+    # INSERT ... SELECT keeps the row data in the database instead of building model instances
+    quote = connection.ops.quote_name
+    column_sql = ', '.join(quote(column) for column in [*columns, *extra])
+    select_sql = ', '.join([*(quote(column) for column in columns), *['%s'] * len(extra)])
+    cursor.execute(
+        f'INSERT INTO {quote(target._meta.db_table)} ({column_sql}) '
+        f'SELECT {select_sql} FROM {quote(source._meta.db_table)} '
+        f'WHERE {quote(ids_column)} IN ({", ".join(["%s"] * len(ids))})',
+        [*extra.values(), *ids]
+    )
+
+
+def _archive_batch(ids, cutoff):
+    with transaction.atomic(), batched_facet_updates():
+        # Checked again under the lock: a listing restocked since the scan stays live
+        ids = list(Product.objects.select_for_update().filter(
+            id__in=ids, is_sold=True, updated_at__lt=cutoff
+        ).values_list('id', flat=True))
+        return _move_to_archive(ids)
+
+
+def _move_to_archive(ids):
+    # Call inside a transaction
+    if not ids:
+        return 0
+    with connection.cursor() as cursor:
+        archived_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        _copy_rows(cursor, Product, ArchivedProduct, PRODUCT_FIELDS, 'id', ids, archived_at=archived_at)
+        _copy_rows(cursor, ProductImage, ArchivedProductImage, IMAGE_FIELDS, 'product_id', ids)
+    # The archived rows reference the files too; the delete below releases the live rows' references
+    add_references([
+        *ProductImage.objects.filter(product_id__in=ids).values_list('image', flat=True),
+        *Product.objects.filter(id__in=ids).values_list('image', flat=True),
+    ])
+    # Cascades to images, carts, reservations, event buckets and neighbours; signals update the indexes
+    Product.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def delete_listings(products):
+    """
+    Delete the ``products`` queryset; listings that were bought are archived instead.
+
+    Purchase history keeps showing those, as off the market. Returns the
+    number of listings archived.
+    """
+    with transaction.atomic(), batched_facet_updates():
+        ids = list(products.select_for_update().order_by('id').values_list('id', flat=True))
+        purchased = sorted(set(PurchaseItem.objects.filter(product_id__in=ids).values_list('product_id', flat=True)))
+        archived = _move_to_archive(purchased)
+        # A deleted listing is no longer for sale, whatever stock it had left
+        ArchivedProduct.objects.filter(id__in=purchased).update(quantity=0, is_sold=True)
+        Product.objects.filter(id__in=ids).exclude(id__in=purchased).delete()
+    return archived
+
+
+def resolve_listings(ids, select_related=('seller', 'category')):
+    """{id: Product or ArchivedProduct} for ``ids``, reading the archive only for ids no longer live"""
+    listings = Product.objects.select_related(*select_related).in_bulk(ids)
+    missing = [id for id in ids if id not in listings]
+    if missing:
+        listings.update(ArchivedProduct.objects.select_related(*select_related).in_bulk(missing))
+    return listings
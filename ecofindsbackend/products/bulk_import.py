@@ -0,0 +1,158 @@
+"""
+Bulk listing import from CSV or JSON Lines.
+
+Images are referenced by file name and read from an optional zip archive.
+Rows are validated a chunk at a time with ProductImportSerializer, using
+categories that are loaded once per import. Each chunk's valid rows are
+inserted with bulk_create inside their own transaction. Failed rows are
+reported by row number and do not stop the rest of the import.
+"""
+import csv
+import io
+import json
+import os
+import zipfile
+from itertools import islice
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from .geo import apply_geocode
+from .models import Category, Product, ProductChange, ProductImage
+from .serializers import ProductImportSerializer
+from .signals import index_created_products
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+class ImportReport:
+    def __init__(self):
+        self.product_ids = []
+        self.errors = []
+
+    def error(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': len(self.product_ids),
+            'failed': len(self.errors),
+            'product_ids': self.product_ids,
+            'errors': self.errors,
+        }
+
+
+def import_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return 'jsonl' if extension == 'ndjson' else extension if extension in IMPORT_FORMATS else None
+
+
+def read_rows(file, file_format):
+    """Yield parsed rows; a line that cannot be parsed yields an error string instead"""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        for row in csv.DictReader(text):
+            # Blank cells mean "not given" so optional numeric fields stay valid
+            data = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            if 'images' in data:
+                data['images'] = [name.strip() for name in data['images'].split('|') if name.strip()]
+            yield data
+    else:
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield f'Invalid JSON: {e}'
+                continue
+            yield data if isinstance(data, dict) else 'Each line must be a JSON object'
+
+
+def _category_lookup():
+    categories = {}
+    for category in Category.objects.all():
+        categories[str(category.id)] = categories[category.slug.lower()] = categories[category.name.lower()] = category
+    return categories
+
+
+def _verify_image(archive, name):
+    # Same check ImageField runs on a regular upload
+    try:
+        Image.open(archive.open(name)).verify()
+    except Exception:
+        raise ValueError(f'{name} is not a valid image')
+
+
+def _store_image(archive, name):
+    return default_storage.save(f'product_images/{os.path.basename(name)}', ContentFile(archive.read(name)))
+
+
+def import_listings(seller, rows, images=None, chunk_size=500):
+    """Import ``rows`` (from read_rows) as listings owned by ``seller``; returns an ImportReport"""
+    report = ImportReport()
+    archive = zipfile.ZipFile(images) if images else None
+    context = {
+        'categories': _category_lookup(),
+        'image_names': {name for name in archive.namelist() if not name.endswith('/')} if archive else set(),
+    }
+    # One serializer validates every row, as ListSerializer does, so its fields are built once
+    serializer = ProductImportSerializer(context=context)
+    numbered = enumerate(rows, start=1)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return report
+        _import_chunk(seller, chunk, archive, serializer, report)
+
+
+def _import_chunk(seller, chunk, archive, serializer, report):
+    products, image_names = [], []
+    for row_number, row in chunk:
+        if isinstance(row, str):
+            report.error(row_number, {'non_field_errors': [row]})
+            continue
+        try:
+            attrs = serializer.run_validation(row)
+        except ValidationError as e:
+            report.error(row_number, e.detail)
+            continue
+        try:
+            for name in attrs.get('images', []):
+                _verify_image(archive, name)
+        except ValueError as e:
+            report.error(row_number, {'images': [str(e)]})
+            continue
+        product = Product(seller=seller, **{key: value for key, value in attrs.items() if key != 'images'})
+        # bulk_create skips Product.save, so derive what it would
+        product.is_sold = product.quantity == 0
+        apply_geocode(product, product.location)
+        products.append((row_number, product))
+        image_names.append(attrs.get('images', []))
+    if not products:
+        return
+
+    try:
+        with transaction.atomic():
+            paths = []
+            for (_, product), names in zip(products, image_names):
+                product_paths = [_store_image(archive, name) for name in names]
+                paths.append(product_paths)
+                # The same summary set_images would write
+                product.main_image_path = product_paths[0] if product_paths else ''
+                product.image_count = len(product_paths)
+            created = Product.objects.bulk_create([product for _, product in products])
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=path, is_main=index == 0, order=index)
+                for product, product_paths in zip(created, paths)
+                for index, path in enumerate(product_paths)
+            ])
+            ProductChange.record([product.pk for product in created])
+            index_created_products(created)
+    except Exception as e:
+        # The storage's references roll back with the chunk; `manage.py gc_media` removes files nothing uses
+        for row_number, _ in products:
+            report.error(row_number, {'non_field_errors': [f'Chunk rolled back: {e}']})
+        return
+    report.product_ids.extend(product.pk for product in created)
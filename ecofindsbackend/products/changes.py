@@ -0,0 +1,80 @@
+"""
+Product change feed for incremental client sync.
+
+Every write that changes a listing appends a ProductChange row in the same
+transaction: Product.save and the delete signal log saves and deletions,
+and the queryset updates that bypass them (stock changes, admin bulk
+actions, bulk import) call ProductChange.record themselves. View and
+trending counters are not logged.
+
+Clients keep the cursor from their last sync and read the listings changed
+since, each once in its current state, instead of refetching every page of
+the product list. A cursor is the last change id read plus a time no later
+than the entries after it (the issue time once caught up, otherwise the last
+entry's); once older than PRODUCT_CHANGE_RETENTION those entries may have
+been compacted away, and the client starts over.
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Exists, Max, OuterRef, Q
+from django.utils import timezone
+from .models import ProductChange
+
+
+def encode_cursor(change_id, issued_at=None):
+    return f'{change_id}.{int((issued_at or timezone.now()).timestamp())}'
+
+
+def decode_cursor(cursor):
+    """(change id, issue time); raises ValueError for a malformed cursor"""
+    change_id, issued = cursor.split('.')
+    return int(change_id), datetime.fromtimestamp(int(issued), tz=dt_timezone.utc)
+
+
+def cursor_expired(issued_at):
+    # Entries after the cursor were created at most PRODUCT_CHANGE_SETTLE before it was issued
+    return issued_at - settings.PRODUCT_CHANGE_SETTLE < timezone.now() - settings.PRODUCT_CHANGE_RETENTION
+
+
+def latest_change_id():
+    settled = timezone.now() - settings.PRODUCT_CHANGE_SETTLE
+    return ProductChange.objects.filter(created_at__lte=settled).aggregate(last=Max('id'))['last'] or 0
+
+
+def read_changes(since_id, limit):
+    """
+    Up to ``limit`` log entries after ``since_id``, collapsed per product.
+
+    Returns ({product_id: deleted}, cursor after the last entry read, whether
+    more remain). Entries younger than PRODUCT_CHANGE_SETTLE are held back:
+    ids are handed out before commit, so a recent entry can still be followed
+    by a lower one committing late.
+    """
+    now = timezone.now()
+    entries = list(
+        ProductChange.objects.filter(id__gt=since_id, created_at__lte=now - settings.PRODUCT_CHANGE_SETTLE)
+        .order_by('id').values_list('id', 'product_id', 'deleted', 'created_at')[:limit]
+    )
+    latest = {}
+    for _, product_id, deleted, _ in entries:
+        latest[product_id] = deleted
+    has_more = len(entries) == limit
+    if not has_more:
+        # Caught up: everything after the cursor is newer than this request
+        return latest, encode_cursor(entries[-1][0] if entries else since_id, now), False
+    # Part way through the backlog, the entries after the cursor are only as recent as the last one read;
+    # stamping the cursor with now would let it outlive their retention
+    return latest, encode_cursor(entries[-1][0], entries[-1][3]), True
+
+
+def compact_changes(batch_size=10000):
+    """Delete entries superseded by a later one for the same product, or past retention; returns the number removed"""
+    cutoff = timezone.now() - settings.PRODUCT_CHANGE_RETENTION
+    superseded = ProductChange.objects.filter(product_id=OuterRef('product_id'), id__gt=OuterRef('id'))
+    stale = ProductChange.objects.filter(Q(created_at__lt=cutoff) | Q(Exists(superseded)))
+    compacted = 0
+    while True:
+        ids = list(stale.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return compacted
+        compacted += ProductChange.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,73 @@
+"""
+Streaming CSV / JSON Lines exports.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` and encoded
+one line at a time into a StreamingHttpResponse. Memory stays flat however
+many rows are exported, and the first bytes go out before the query
+finishes. Both the API endpoints and the admin actions use
+``export_response``.
+"""
+import csv
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+LISTING_COLUMNS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('category', 'category__name'),
+    ('price', 'price'),
+    ('quantity', 'quantity'),
+    ('condition', 'condition'),
+    ('brand', 'brand'),
+    ('model', 'model'),
+    ('location', 'location'),
+    ('is_sold', 'is_sold'),
+    ('view_count', 'view_count'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back to the generator"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _jsonl_lines(headers, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(headers, row))) + '\n'
+
+
+def export_response(queryset, columns, export_format, filename):
+    """Stream ``queryset`` as CSV or JSON Lines; ``columns`` is a list of (header, lookup)"""
+    headers = [header for header, _ in columns]
+    rows = queryset.values_list(*[lookup for _, lookup in columns]).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+    lines = _csv_lines(headers, rows) if export_format == 'csv' else _jsonl_lines(headers, rows)
+
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    # Let reverse proxies pass chunks through instead of buffering the whole file
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def export_listings(products, export_format, filename='listings'):
+    return export_response(products.order_by('id'), LISTING_COLUMNS, export_format, filename)
@@ -0,0 +1,133 @@
+"""
+Facet counts (category, condition, price bucket, location) for search.
+
+Counts for an arbitrary query come from a single grouped aggregate over the
+filtered queryset. The unfiltered catalogue, which is what the search page
+shows before the user types anything, is served from the FacetCount table
+that product signals keep up to date incrementally.
+"""
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Value, When
+from .models import Category, FacetCount, Product
+
+FACETS = ('category', 'condition', 'price', 'location')
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('0-25', 0, 25),
+    ('25-50', 25, 50),
+    ('50-100', 50, 100),
+    ('100-250', 100, 250),
+    ('250-500', 250, 500),
+    ('500-1000', 500, 1000),
+    ('1000+', 1000, None),
+]
+
+MAX_LOCATIONS = 20
+
+
+def price_bucket_expression():
+    return Case(
+        *[When(price__lt=upper, then=Value(label)) for label, lower, upper in PRICE_BUCKETS if upper is not None],
+        default=Value(PRICE_BUCKETS[-1][0]),
+        output_field=CharField()
+    )
+
+
+def price_bucket(price):
+    for label, lower, upper in PRICE_BUCKETS:
+        if upper is None or price < upper:
+            return label
+
+
+def facet_values(product):
+    """The facet values one product contributes to"""
+    return {
+        ('category', str(product.category_id)),
+        ('condition', product.condition),
+        ('price', price_bucket(product.price)),
+        ('location', product.location),
+    }
+
+
+def compute_facets(queryset):
+    """Facet counts for ``queryset`` in one grouped aggregate query"""
+    return _format(_grouped_counts(queryset))
+
+
+def cached_facets():
+    """Facet counts for the whole catalogue, read from the maintained table"""
+    counts = defaultdict(Counter)
+    for facet, value, count in FacetCount.objects.filter(count__gt=0).values_list('facet', 'value', 'count'):
+        counts[facet][value] = count
+    return _format(counts)
+
+
+def apply_facet_deltas(deltas):
+    """Add ``{(facet, value): delta}`` to the cached counts"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        FacetCount.objects.bulk_create(
+            [FacetCount(facet=facet, value=value, count=0) for facet, value in deltas],
+            ignore_conflicts=True
+        )
+        for (facet, value), delta in deltas.items():
+            FacetCount.objects.filter(facet=facet, value=value).update(count=F('count') + delta)
+
+
+def rebuild_facet_counts():
+    counts = _grouped_counts(Product.objects.all())
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create([
+            FacetCount(facet=facet, value=value, count=count)
+            for facet, values in counts.items()
+            for value, count in values.items()
+        ], batch_size=1000)
+
+
+def _grouped_counts(queryset):
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=price_bucket_expression())
+        .values('category_id', 'condition', 'price_bucket', 'location')
+        .annotate(n=Count('id'))
+    )
+    counts = defaultdict(Counter)
+    for row in rows:
+        counts['category'][str(row['category_id'])] += row['n']
+        counts['condition'][row['condition']] += row['n']
+        counts['price'][row['price_bucket']] += row['n']
+        counts['location'][row['location']] += row['n']
+    return counts
+
+
+def _format(counts):
+    categories = {
+        str(category['id']): category
+        for category in Category.objects.values('id', 'slug', 'name')
+    }
+    condition_labels = dict(Product.CONDITION_CHOICES)
+    bucket_order = [label for label, lower, upper in PRICE_BUCKETS]
+
+    return {
+        'category': [
+            {'value': categories[value]['slug'], 'label': categories[value]['name'], 'count': count}
+            for value, count in counts['category'].most_common() if value in categories
+        ],
+        'condition': [
+            {'value': value, 'label': condition_labels.get(value, value), 'count': count}
+            for value, count in counts['condition'].most_common()
+        ],
+        'price': [
+            {'value': value, 'label': value, 'count': counts['price'][value]}
+            for value in bucket_order if counts['price'][value]
+        ],
+        'location': [
+            {'value': value, 'label': value, 'count': count}
+            for value, count in counts['location'].most_common(MAX_LOCATIONS + 1) if value
+        ][:MAX_LOCATIONS],
+    }
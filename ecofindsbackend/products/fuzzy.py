@@ -0,0 +1,181 @@
+"""
+Typo-tolerant matching over listing titles, brands and models.
+
+Matching happens at the word level. Every distinct word in the catalogue is
+indexed by its trigrams; a misspelt query word ("samsng") finds vocabulary
+words sharing trigrams with it through the trigram posting lists, their
+Jaccard similarity is computed from the shared-trigram counts, and listings
+are ranked by the best similarity of each query word. Per-query work is
+bounded by MAX_QUERY_WORDS, MAX_WORD_CANDIDATES and MAX_DOCS_PER_WORD.
+
+Like the suggest index, each process keeps its own copy, patched by product
+signals and rebuilt once older than FUZZY_INDEX_TTL. Postings are exact:
+removing or renaming a listing takes it out of its old words' postings, and
+a word no listing uses any more leaves the trigram postings and vocabulary.
+"""
+import heapq
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+from django.conf import settings
+from .models import Product
+
+MAX_QUERY_WORDS = 5
+MAX_WORD_CANDIDATES = 20
+MAX_DOCS_PER_WORD = 5000
+
+WORD_RE = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD_RE.findall(text.casefold())
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def listing_text(product):
+    return ' '.join([product.title, product.brand, product.model])
+
+
+class TrigramIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._word_ids = {}
+        self._words = []
+        self._word_trigram_counts = []
+        self._trigram_words = defaultdict(set)
+        # Insertion-ordered dicts used as sets: O(1) removal, newest documents last
+        self._word_docs = []
+        self._doc_words = {}
+        self._free_word_ids = []
+        self.built_at = None
+
+    def build(self, docs):
+        """Replace the contents with ``(doc_id, text)`` pairs"""
+        fresh = TrigramIndex()
+        for doc_id, text in docs:
+            fresh._add(doc_id, text)
+        with self._lock:
+            self._word_ids = fresh._word_ids
+            self._words = fresh._words
+            self._word_trigram_counts = fresh._word_trigram_counts
+            self._trigram_words = fresh._trigram_words
+            self._word_docs = fresh._word_docs
+            self._doc_words = fresh._doc_words
+            self._free_word_ids = fresh._free_word_ids
+            self.built_at = time.monotonic()
+
+    def add(self, doc_id, text):
+        with self._lock:
+            self._add(doc_id, text)
+
+    def remove(self, doc_id):
+        with self._lock:
+            for word_id in self._doc_words.pop(doc_id, ()):
+                self._unlink(word_id, doc_id)
+
+    def search(self, query, limit=50):
+        """Ids of the best matching documents, best first"""
+        query_words = words(query)[:MAX_QUERY_WORDS]
+        if not query_words:
+            return []
+        min_similarity = settings.FUZZY_MIN_SIMILARITY
+
+        with self._lock:
+            scores = Counter()
+            for query_word in query_words:
+                best = {}
+                for word_id, similarity in self._similar_words(query_word, min_similarity):
+                    for doc_id in islice(reversed(self._word_docs[word_id]), MAX_DOCS_PER_WORD):
+                        if similarity > best.get(doc_id, 0):
+                            best[doc_id] = similarity
+                scores.update(best)
+
+        return [
+            doc_id for doc_id, score in
+            heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        ]
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > settings.FUZZY_INDEX_TTL
+
+    def _add(self, doc_id, text):
+        current = frozenset(self._word_id(word) for word in set(words(text)))
+        previous = self._doc_words.get(doc_id, frozenset())
+        for word_id in previous - current:
+            self._unlink(word_id, doc_id)
+        for word_id in current - previous:
+            self._word_docs[word_id][doc_id] = None
+        self._doc_words[doc_id] = current
+
+    def _word_id(self, word):
+        word_id = self._word_ids.get(word)
+        if word_id is not None:
+            return word_id
+        grams = trigrams(word)
+        if self._free_word_ids:
+            word_id = self._free_word_ids.pop()
+            self._words[word_id] = word
+            self._word_trigram_counts[word_id] = len(grams)
+        else:
+            word_id = len(self._words)
+            self._words.append(word)
+            self._word_trigram_counts.append(len(grams))
+            self._word_docs.append({})
+        self._word_ids[word] = word_id
+        for gram in grams:
+            self._trigram_words[gram].add(word_id)
+        return word_id
+
+    def _unlink(self, word_id, doc_id):
+        docs = self._word_docs[word_id]
+        docs.pop(doc_id, None)
+        if docs:
+            return
+        # Last listing using the word: drop it so renames and deletions don't grow the vocabulary
+        word = self._words[word_id]
+        del self._word_ids[word]
+        for gram in trigrams(word):
+            postings = self._trigram_words[gram]
+            postings.discard(word_id)
+            if not postings:
+                del self._trigram_words[gram]
+        self._words[word_id] = None
+        self._free_word_ids.append(word_id)
+
+    def _similar_words(self, word, min_similarity):
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigram_words.get(gram, ()))
+        # Jaccard from the shared count: |A & B| / (|A| + |B| - |A & B|)
+        similar = (
+            (word_id, count / (len(grams) + self._word_trigram_counts[word_id] - count))
+            for word_id, count in shared.items()
+        )
+        return heapq.nlargest(
+            MAX_WORD_CANDIDATES,
+            (item for item in similar if item[1] >= min_similarity),
+            key=lambda item: item[1]
+        )
+
+
+fuzzy_index = TrigramIndex()
+_build_lock = threading.Lock()
+
+
+def get_fuzzy_index():
+    if fuzzy_index.is_stale():
+        with _build_lock:
+            if fuzzy_index.is_stale():
+                fuzzy_index.build(
+                    (doc_id, f'{title} {brand} {model}')
+                    for doc_id, title, brand, model in
+                    Product.objects.values_list('id', 'title', 'brand', 'model').iterator(chunk_size=5000)
+                )
+    return fuzzy_index
@@ -0,0 +1,157 @@
+"""
+Offline geocoding and geohash-indexed radius search.
+
+Locations are resolved against a gazetteer CSV (``place,latitude,longitude``,
+where place may also be a postal code) at GAZETTEER_PATH; no network calls.
+Geocoded rows store a geohash so that a radius query becomes a handful of
+index range scans (the covering cell and its eight neighbours) followed by a
+bounding-box and distance check in SQL.
+"""
+import csv
+import math
+from functools import lru_cache, reduce
+from operator import or_
+from django.conf import settings
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Q, When
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LNG = 111.320
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees"""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def covering_cells(latitude, longitude, radius_km, max_cells=16):
+    """Geohash prefixes whose cells together contain the circle's bounding box"""
+    dlat, dlng = _bounding_deltas(latitude, radius_km)
+    south, north = max(latitude - dlat, -89.999999), min(latitude + dlat, 89.999999)
+    west, east = longitude - dlng, longitude + dlng
+    # Finest precision that still covers the box in at most max_cells cells
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if (math.ceil((north - south) / height) + 1) * (math.ceil((east - west) / width) + 1) <= max_cells:
+            break
+    cells = set()
+    for lat in _steps(south, north, height):
+        for lng in _steps(west, east, width):
+            cells.add(encode_geohash(lat, (lng + 180) % 360 - 180, precision))
+    return sorted(cells)
+
+
+def _steps(start, stop, step):
+    value = start
+    while value < stop:
+        yield value
+        value += step
+    yield stop
+
+
+def _bounding_deltas(latitude, radius_km):
+    km_per_lng = KM_PER_DEGREE_LNG * max(math.cos(math.radians(latitude)), 0.01)
+    return radius_km / KM_PER_DEGREE_LAT, radius_km / km_per_lng
+
+
+def _longitude_ranges(west, east):
+    """Longitude ranges covering west..east, split in two where the box crosses ±180°"""
+    if east - west >= 360:
+        return [(-180.0, 180.0)]
+    if west < -180:
+        return [(west + 360, 180.0), (-180.0, east)]
+    if east > 180:
+        return [(west, 180.0), (-180.0, east - 360)]
+    return [(west, east)]
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """Filter to rows within ``radius_km`` and annotate ``distance_sq`` (km squared)"""
+    cells = covering_cells(latitude, longitude, radius_km)
+    # Range scans rather than LIKE so every backend can use the geohash index
+    in_cells = reduce(or_, [Q(geohash__gte=cell, geohash__lt=cell + '{') for cell in cells])
+
+    dlat, dlng = _bounding_deltas(latitude, radius_km)
+    in_box = reduce(or_, [
+        Q(longitude__range=lng_range) for lng_range in _longitude_ranges(longitude - dlng, longitude + dlng)
+    ])
+    km_per_lng = radius_km / dlng
+    # Equirectangular distance: plain arithmetic, so it runs in SQL on any backend.
+    # Longitude differences are taken the short way round the antimeridian
+    dlongitude = Case(
+        When(longitude__gt=longitude + 180, then=F('longitude') - (longitude + 360)),
+        When(longitude__lt=longitude - 180, then=F('longitude') - (longitude - 360)),
+        default=F('longitude') - longitude,
+        output_field=FloatField()
+    )
+    dx = dlongitude * km_per_lng
+    dy = (F('latitude') - latitude) * KM_PER_DEGREE_LAT
+    return queryset.filter(
+        in_cells,
+        in_box,
+        latitude__range=(latitude - dlat, latitude + dlat),
+    ).annotate(
+        distance_sq=ExpressionWrapper(dx * dx + dy * dy, output_field=FloatField())
+    ).filter(distance_sq__lte=radius_km * radius_km)
+
+
+def _normalise(text):
+    return ' '.join(text.casefold().split())
+
+
+@lru_cache(maxsize=1)
+def gazetteer():
+    places = {}
+    with open(settings.GAZETTEER_PATH, newline='', encoding='utf-8') as gazetteer_file:
+        for row in csv.DictReader(gazetteer_file):
+            places[_normalise(row['place'])] = (float(row['latitude']), float(row['longitude']))
+    return places
+
+
+def geocode(*texts):
+    """Coordinates of the first text found in the gazetteer, trying "City, State" then "City" """
+    places = gazetteer()
+    for text in texts:
+        if not text:
+            continue
+        key = _normalise(text)
+        if key in places:
+            return places[key]
+        city = _normalise(key.split(',')[0])
+        if city in places:
+            return places[city]
+    return None
+
+
+def apply_geocode(instance, *texts):
+    """Set latitude/longitude/geohash on ``instance`` from its location text"""
+    coordinates = geocode(*texts)
+    if coordinates is None:
+        instance.latitude = instance.longitude = None
+        instance.geohash = ''
+    else:
+        instance.latitude, instance.longitude = coordinates
+        instance.geohash = encode_geohash(*coordinates)
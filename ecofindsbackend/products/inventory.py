@@ -0,0 +1,189 @@
+"""
+Stock bookkeeping for listings.
+
+``Product.quantity`` is the stock not yet sold and ``Product.reserved`` the
+part of it held by live checkout reservations. Only a sale takes from
+``quantity``, so a hold never makes a listing look sold; ``is_sold`` is
+derived from ``quantity`` in the same statement as the sale.
+
+Every stock change is a single conditional UPDATE (``... WHERE quantity >=
+reserved + n``) instead of SELECT ... FOR UPDATE followed by a write, so
+concurrent buyers of a popular listing never queue behind each other's row
+locks: the losing UPDATE simply matches zero rows. Stock columns only change
+here; seller edits go through ``adjust_stock``.
+"""
+import copy
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Product, ProductChange, StockReservation
+from .signals import index_updated_products
+
+# Written only by the functions below, never by a model save
+STOCK_FIELDS = {'quantity', 'reserved', 'is_sold'}
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__(f'Product {product_id} does not have enough stock')
+
+
+def decrement_stock(product_id, quantity, held=0):
+    """
+    Sell ``quantity`` units of a listing; returns False if not enough is free.
+
+    ``held`` units of the sale come from reservations the caller has just
+    consumed: they stop counting as reserved, and only the rest has to be free.
+    """
+    with transaction.atomic():
+        # Whatever other buyers hold must still be in stock after the sale.
+        # is_sold is assigned first: MySQL evaluates SET clauses left to right
+        updated = Product.objects.filter(pk=product_id, quantity__gte=F('reserved') - held + quantity).update(
+            is_sold=Case(When(quantity=quantity, then=Value(True)), default=Value(False)),
+            quantity=F('quantity') - quantity,
+            reserved=F('reserved') - held,
+            updated_at=timezone.now()
+        )
+        if updated:
+            ProductChange.record([product_id])
+    return updated == 1
+
+
+def adjust_stock(product_id, delta):
+    """
+    Add ``delta`` (possibly negative) units to a listing's stock, as a seller edit.
+
+    Applied as a difference rather than written as a value, so sales made
+    since the seller loaded the listing still count. Returns False if the
+    stock would drop below what buyers currently hold.
+    """
+    if not delta:
+        return True
+    with transaction.atomic():
+        updated = Product.objects.filter(pk=product_id, quantity__gte=F('reserved') - delta).update(
+            is_sold=Case(When(quantity=-delta, then=Value(True)), default=Value(False)),
+            quantity=F('quantity') + delta,
+            updated_at=timezone.now()
+        )
+        if updated:
+            ProductChange.record([product_id])
+            current = Product.objects.only(*Product.INDEXED_FIELDS).get(pk=product_id)
+            previous = copy.copy(current)
+            previous.is_sold = current.quantity == delta
+            if previous.is_sold != current.is_sold:
+                # queryset.update() sends no post_save; listings leave or rejoin search suggestions here
+                index_updated_products([(previous, current)])
+    return updated == 1
+
+
+def save_listing(product, fields, loaded_quantity):
+    """
+    Save a seller's edit of ``fields`` without writing the stock columns back.
+
+    A new ``quantity`` is applied with ``adjust_stock`` as the difference
+    from ``loaded_quantity``, and the stock columns of ``product`` are
+    reloaded; raises InsufficientStock if buyers hold more than would remain.
+    """
+    fields = set(fields) - STOCK_FIELDS
+    with transaction.atomic():
+        if product.quantity != loaded_quantity:
+            if not adjust_stock(product.pk, product.quantity - loaded_quantity):
+                raise InsufficientStock(product.pk)
+            for field, value in Product.objects.values(*STOCK_FIELDS).get(pk=product.pk).items():
+                setattr(product, field, value)
+            if getattr(product, '_indexed_state', None):
+                # adjust_stock has already indexed the stock change
+                product._indexed_state['is_sold'] = product.is_sold
+        product.save(update_fields={*fields, 'updated_at'})
+
+
+def reserve_stock(user, quantities, ttl=None):
+    """
+    Hold ``{product_id: quantity}`` for ``user`` until the reservation expires.
+
+    Either every product is reserved or none is (InsufficientStock is raised
+    and the transaction rolled back).
+    """
+    expires_at = timezone.now() + (ttl or settings.STOCK_RESERVATION_TTL)
+    with transaction.atomic():
+        # Sorted so concurrent multi-item reservations lock rows in the same order
+        for product_id in sorted(quantities):
+            _retry_after_sweep(product_id, lambda: _hold(product_id, quantities[product_id]))
+        return StockReservation.objects.bulk_create([
+            StockReservation(product_id=product_id, user=user, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ])
+
+
+def _hold(product_id, quantity):
+    # A hold is not a sale: quantity and is_sold stay as they are, so nothing is logged
+    return Product.objects.filter(pk=product_id, quantity__gte=F('reserved') + quantity).update(
+        reserved=F('reserved') + quantity
+    ) == 1
+
+
+def _unhold(product_id, quantity):
+    Product.objects.filter(pk=product_id).update(reserved=Greatest(F('reserved') - quantity, 0))
+
+
+def release_reservations(reservations):
+    """Delete reservations and free the stock they held; safe against concurrent release"""
+    released = defaultdict(int)
+    # One transaction, so a reservation is never deleted while its hold stays counted
+    with transaction.atomic():
+        for reservation in reservations:
+            # Only the caller that actually deletes the row frees the stock
+            deleted, _ = StockReservation.objects.filter(pk=reservation.pk).delete()
+            if deleted:
+                released[reservation.product_id] += reservation.quantity
+        for product_id, quantity in released.items():
+            _unhold(product_id, quantity)
+    return sum(released.values())
+
+
+def release_expired_reservations(product_ids=None, batch_size=500):
+    """Sweep expired reservations in batches; returns the number of units released"""
+    expired = StockReservation.objects.filter(expires_at__lte=timezone.now()).order_by('pk')
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+
+    released = 0
+    while True:
+        batch = list(expired.only('pk', 'product_id', 'quantity')[:batch_size])
+        if not batch:
+            return released
+        released += release_reservations(batch)
+
+
+def commit_stock(user, product_id, quantity):
+    """
+    Permanently take ``quantity`` units for a purchase.
+
+    The buyer's live reservations for the product are consumed first (any
+    surplus is freed); the remainder has to be free stock. Must run inside
+    the checkout transaction.
+    """
+    reservations = list(
+        StockReservation.objects.filter(
+            user=user, product_id=product_id, expires_at__gt=timezone.now()
+        ).only('pk', 'product_id', 'quantity')
+    )
+    held = 0
+    for reservation in reservations:
+        deleted, _ = StockReservation.objects.filter(pk=reservation.pk).delete()
+        if deleted:
+            held += reservation.quantity
+    _retry_after_sweep(product_id, lambda: decrement_stock(product_id, quantity, held=held))
+
+
+def _retry_after_sweep(product_id, attempt):
+    if attempt():
+        return
+    # Stock may only be held by reservations that expired but were not swept yet
+    if release_expired_reservations(product_ids=[product_id]) and attempt():
+        return
+    raise InsufficientStock(product_id)
@@ -0,0 +1,24 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from products.archive import archive_sold_listings
+
+class Command(BaseCommand):
+    help = 'Move long-sold listings out of the products table into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help='Days since the sale (defaults to ARCHIVE_SOLD_AFTER)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep archiving every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        older_than = timedelta(days=options['older_than']) if options['older_than'] is not None else None
+        while True:
+            archived = archive_sold_listings(older_than=older_than, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Archived {archived} sold listing(s)'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
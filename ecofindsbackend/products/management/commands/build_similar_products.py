@@ -0,0 +1,84 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cart.models import CartItem
+from products.models import Product, SimilarProduct
+from purchases.models import PurchaseItem
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed "similar items" neighbour table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Neighbours stored per product')
+        parser.add_argument('--window', type=int, default=30, help='Price-ordered neighbours compared within a category')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+            from products import similarity
+        except ImportError:
+            raise CommandError('build_similar_products requires numpy (pip install numpy)')
+
+        started = time.perf_counter()
+        rows = list(Product.objects.order_by('id').values_list(
+            'id', 'category_id', 'brand', 'condition', 'price', 'view_count', 'is_sold'
+        ).iterator(chunk_size=options['batch_size']))
+        if not rows:
+            self.stdout.write('No products to index')
+            return
+
+        ids, categories, brands, conditions, prices, views, sold = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        brand_codes = {}
+        condition_codes = {value: code for code, (value, _) in enumerate(Product.CONDITION_CHOICES)}
+        views = np.array(views, dtype=np.float32)
+        features = {
+            'category': np.array(categories, dtype=np.int64),
+            'brand': np.array([brand_codes.setdefault(brand.casefold(), len(brand_codes)) if brand else -1 for brand in brands], dtype=np.int64),
+            'condition': np.array([condition_codes.get(condition, -1) for condition in conditions], dtype=np.int8),
+            'log_price': np.log1p(np.array(prices, dtype=np.float64)).astype(np.float32),
+            'popularity': np.log1p(views) / max(np.log1p(views.max()), 1.0),
+            'available': ~np.array(sold, dtype=bool),
+        }
+        del rows
+
+        # Purchases and carts are both baskets; keep their ids apart
+        baskets = [(purchase_id * 2, product_id) for purchase_id, product_id in PurchaseItem.objects.values_list('purchase_id', 'product_id').iterator()]
+        baskets += [(cart_id * 2 + 1, product_id) for cart_id, product_id in CartItem.objects.values_list('cart_id', 'product_id').iterator()]
+        basket_ids = np.array([basket for basket, _ in baskets], dtype=np.int64)
+        basket_products = np.array([product for _, product in baskets], dtype=np.int64)
+        product_index = np.searchsorted(ids, basket_products)
+        # Purchases can point at archived listings, which are not in ids
+        known = ids[np.minimum(product_index, len(ids) - 1)] == basket_products
+        basket_ids, product_index = basket_ids[known], product_index[known]
+        co_src, co_dst, co_score = similarity.co_occurrence(basket_ids, product_index, len(ids))
+
+        neighbours, scores = similarity.nearest_neighbours(
+            features, co_src, co_dst, co_score, k=options['k'], window=options['window']
+        )
+        computed = time.perf_counter() - started
+
+        links = (
+            SimilarProduct(product_id=int(ids[row]), similar_id=int(ids[column]), rank=rank, score=float(score))
+            for row in range(len(ids))
+            for rank, (column, score) in enumerate(zip(neighbours[row], scores[row]))
+            if column >= 0
+        )
+        written = 0
+        with transaction.atomic():
+            SimilarProduct.objects.all().delete()
+            batch = []
+            for link in links:
+                batch.append(link)
+                if len(batch) == options['batch_size']:
+                    SimilarProduct.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            SimilarProduct.objects.bulk_create(batch)
+            written += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {written} neighbour(s) for {len(ids)} product(s) '
+            f'(computed in {computed:.1f}s, total {time.perf_counter() - started:.1f}s)'
+        ))
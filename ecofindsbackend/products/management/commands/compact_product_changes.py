@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from products.changes import compact_changes
+
+class Command(BaseCommand):
+    help = 'Drop product change log entries that are superseded or past PRODUCT_CHANGE_RETENTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep compacting every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            compacted = compact_changes(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Removed {compacted} product change log entries'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from products.trending import compute_trending_scores
+
+class Command(BaseCommand):
+    help = 'Recompute time-decayed trending scores from recorded view and add-to-cart events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep recomputing every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            scored, pruned = compute_trending_scores(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Scored {scored} product(s), pruned {pruned} old event bucket(s)'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from products.geo import apply_geocode, gazetteer
+from products.models import Product
+
+GEO_FIELDS = ['latitude', 'longitude', 'geohash']
+
+class Command(BaseCommand):
+    help = 'Geocode product locations and user city/zip codes from the offline gazetteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        gazetteer.cache_clear()
+        batch_size = options['batch_size']
+        products = self.backfill(
+            Product.objects.only('id', 'location', *GEO_FIELDS),
+            lambda product: apply_geocode(product, product.location),
+            batch_size
+        )
+        users = self.backfill(
+            get_user_model().objects.only('id', 'city', 'zip_code', *GEO_FIELDS),
+            lambda user: apply_geocode(user, user.zip_code, user.city),
+            batch_size
+        )
+        self.stdout.write(self.style.SUCCESS(f'Geocoded {products} product(s) and {users} user(s)'))
+
+    def backfill(self, queryset, geocode_row, batch_size):
+        located = 0
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                return located
+            for row in batch:
+                geocode_row(row)
+                located += row.latitude is not None
+            queryset.model.objects.bulk_update(batch, GEO_FIELDS)
+            last_id = batch[-1].id
@@ -0,0 +1,49 @@
+import json
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.bulk_import import import_format, import_listings, read_rows
+
+class Command(BaseCommand):
+    help = 'Bulk import listings for a seller from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path to a .csv or .jsonl file')
+        parser.add_argument('--seller', required=True, help='Email of the seller who will own the listings')
+        parser.add_argument('--images', help='Zip archive containing the image files referenced by the rows')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per bulk insert transaction')
+        parser.add_argument('--errors', help='Write per-row errors to this JSON Lines file')
+
+    def handle(self, *args, **options):
+        file_format = import_format(options['file'])
+        if file_format is None:
+            raise CommandError('file must be a .csv or .jsonl file')
+        try:
+            seller = get_user_model().objects.get(email=options['seller'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["seller"]}')
+
+        started = time.perf_counter()
+        images = open(options['images'], 'rb') if options['images'] else None
+        try:
+            with open(options['file'], 'rb') as source:
+                report = import_listings(
+                    seller, read_rows(source, file_format), images=images, chunk_size=options['chunk_size']
+                )
+        finally:
+            if images:
+                images.close()
+        elapsed = time.perf_counter() - started
+
+        if options['errors']:
+            with open(options['errors'], 'w') as errors_file:
+                for error in report.errors:
+                    errors_file.write(json.dumps(error) + '\n')
+        else:
+            for error in report.errors[:20]:
+                self.stderr.write(f'Row {error["row"]}: {json.dumps(error["errors"])}')
+        created = len(report.product_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} listing(s), {len(report.errors)} row(s) failed, '
+            f'{elapsed:.1f}s ({created / elapsed if elapsed else 0:.0f} listings/s)'
+        ))
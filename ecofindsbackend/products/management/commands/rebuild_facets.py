@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.facets import rebuild_facet_counts
+from products.models import FacetCount
+
+class Command(BaseCommand):
+    help = 'Recompute the cached search facet counts from scratch'
+
+    def handle(self, *args, **options):
+        rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {FacetCount.objects.count()} facet count(s)'))
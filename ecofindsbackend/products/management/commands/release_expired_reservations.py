@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from products.inventory import release_expired_reservations
+
+class Command(BaseCommand):
+    help = 'Return stock held by expired checkout reservations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep sweeping every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_reservations(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Released {released} reserved unit(s)'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
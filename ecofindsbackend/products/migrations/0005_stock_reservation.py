@@ -0,0 +1,38 @@
+# Generated by Django 4.2.24 on 2026-10-19 09:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def derive_is_sold_from_stock(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    # Listings flagged sold had their whole stock bought
+    Product.objects.filter(is_sold=True).update(quantity=0)
+    Product.objects.filter(quantity=0).update(is_sold=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0004_productimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'product'], name='products_st_user_id_afe6d8_idx')],
+            },
+        ),
+        migrations.RunPython(derive_is_sold_from_stock, migrations.RunPython.noop),
+    ]
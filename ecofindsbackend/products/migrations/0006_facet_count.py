@@ -0,0 +1,62 @@
+# Generated by Django 4.2.24 on 2026-10-19 09:36
+
+from collections import Counter
+from django.db import migrations, models
+from django.db.models import Count
+
+# Copied from products/facets.py as it was when this migration was written,
+# so later changes to the buckets cannot change what the migration computes
+PRICE_BUCKETS = [
+    ('0-25', 0, 25),
+    ('25-50', 25, 50),
+    ('50-100', 50, 100),
+    ('100-250', 100, 250),
+    ('250-500', 250, 500),
+    ('500-1000', 500, 1000),
+    ('1000+', 1000, None),
+]
+
+
+def price_bucket(price):
+    for label, lower, upper in PRICE_BUCKETS:
+        if upper is None or price < upper:
+            return label
+
+
+def populate_facet_counts(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    FacetCount = apps.get_model('products', 'FacetCount')
+    counts = Counter()
+    for row in Product.objects.order_by().values('category_id', 'condition', 'price', 'location').annotate(n=Count('id')):
+        counts['category', str(row['category_id'])] += row['n']
+        counts['condition', row['condition']] += row['n']
+        counts['price', price_bucket(row['price'])] += row['n']
+        counts['location', row['location']] += row['n']
+    FacetCount.objects.bulk_create([
+        FacetCount(facet=facet, value=value, count=count)
+        for (facet, value), count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=200)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='facetcount',
+            constraint=models.UniqueConstraint(fields=('facet', 'value'), name='unique_facet_value'),
+        ),
+        migrations.RunPython(populate_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-19 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_facet_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.24 on 2026-10-19 09:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_similar_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='ProductEventBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('view', 'View'), ('cart', 'Added to cart')], max_length=10)),
+                ('bucket_start', models.DateTimeField(db_index=True)),
+                ('count', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_buckets', to='products.product')),
+            ],
+        ),
+    ]
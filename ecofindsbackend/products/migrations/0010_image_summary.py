@@ -0,0 +1,54 @@
+# Generated by Django 4.2.24 on 2026-10-19 11:01
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 10000
+
+
+def backfill_image_summary(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductImage = apps.get_model('products', 'ProductImage')
+
+    # Older rows can have several main images; keep the first by order ahead of the unique constraint
+    duplicates, previous = [], None
+    mains = ProductImage.objects.filter(is_main=True).order_by('product_id', 'order', 'id').values_list('id', 'product_id')
+    for image_id, product_id in mains.iterator(chunk_size=BATCH_SIZE):
+        if product_id == previous:
+            duplicates.append(image_id)
+        previous = product_id
+    for offset in range(0, len(duplicates), BATCH_SIZE):
+        ProductImage.objects.filter(id__in=duplicates[offset:offset + BATCH_SIZE]).update(is_main=False)
+
+    # One UPDATE per id range, so a large table is never held in a single statement
+    images = ProductImage.objects.filter(product=OuterRef('pk')).order_by()
+    image_count = images.values('product').annotate(n=Count('id')).values('n')
+    main_image_path = images.filter(is_main=True).values('image')[:1]
+    high = Product.objects.aggregate(high=Max('id'))['high'] or 0
+    for low in range(0, high, BATCH_SIZE):
+        Product.objects.filter(id__gt=low, id__lte=low + BATCH_SIZE).update(
+            image_count=Coalesce(Subquery(image_count), 0),
+            main_image_path=Coalesce(Subquery(main_image_path), Value(''))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='main_image_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(backfill_image_summary, migrations.RunPython.noop),
+    ]
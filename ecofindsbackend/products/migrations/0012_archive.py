@@ -0,0 +1,68 @@
+# Generated by Django 4.2.24 on 2026-10-19 11:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('products', '0011_unique_main_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedProduct',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('condition', models.CharField(choices=[('new', 'New'), ('like_new', 'Like New'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor')], max_length=20)),
+                ('year_of_manufacture', models.PositiveIntegerField(blank=True, null=True)),
+                ('brand', models.CharField(blank=True, max_length=100)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('length', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('width', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('height', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('weight', models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True)),
+                ('material', models.CharField(blank=True, max_length=100)),
+                ('color', models.CharField(blank=True, max_length=50)),
+                ('original_packaging', models.BooleanField(default=False)),
+                ('manual_instructions', models.BooleanField(default=False)),
+                ('working_condition_description', models.TextField(blank=True)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='product_images/')),
+                ('main_image_path', models.CharField(blank=True, max_length=255)),
+                ('image_count', models.PositiveIntegerField(default=0)),
+                ('location', models.CharField(blank=True, max_length=200)),
+                ('is_sold', models.BooleanField(default=True)),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(db_index=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to='products.category')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_products', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedProductImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='product_images/')),
+                ('is_main', models.BooleanField(default=False)),
+                ('order', models.PositiveIntegerField(default=0)),
+                ('alt_text', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='products.archivedproduct')),
+            ],
+            options={
+                'ordering': ['order'],
+            },
+        ),
+    ]
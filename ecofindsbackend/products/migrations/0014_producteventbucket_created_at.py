@@ -0,0 +1,20 @@
+# Generated by Django 4.2.24 on 2026-10-19 13:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_product_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producteventbucket',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.24 on 2026-10-19 12:53
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def move_holds_to_reserved(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    StockReservation = apps.get_model('products', 'StockReservation')
+    # Holds used to be taken out of quantity; put them back and count them as reserved.
+    # Expired but unswept reservations too, since the sweeper now only lowers reserved
+    held = StockReservation.objects.values('product').annotate(total=Sum('quantity')).values_list('product', 'total')
+    for product_id, total in held:
+        Product.objects.filter(pk=product_id).update(quantity=F('quantity') + total, reserved=total, is_sold=False)
+
+
+def move_reserved_to_holds(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Product.objects.filter(reserved__gt=0).update(quantity=F('quantity') - F('reserved'))
+    Product.objects.filter(quantity=0).update(is_sold=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_producteventbucket_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(move_holds_to_reserved, move_reserved_to_holds),
+    ]
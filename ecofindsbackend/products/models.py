@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from .geo import apply_geocode
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -33,6 +34,8 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
+    # Part of quantity held by checkout reservations; only products/inventory.py writes it
+    reserved = models.PositiveIntegerField(default=0, editable=False)
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES, default='good')
     
     # Product Details
@@ -55,32 +58,85 @@ class Product(models.Model):
     
     # Media and Location (keep main image for backward compatibility)
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
+    # Copied from the images so listings never have to read them; set_images keeps them in step
+    main_image_path = models.CharField(max_length=255, blank=True)
+    image_count = models.PositiveIntegerField(default=0)
     location = models.CharField(max_length=200, blank=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)
     
     # Seller and Status
     seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='products')
     is_sold = models.BooleanField(default=False)
     view_count = models.PositiveIntegerField(default=0)
+    trending_score = models.FloatField(default=0, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Fields the search indexes read; products/signals.py diffs each save against their previous values
+    INDEXED_FIELDS = ('category_id', 'condition', 'price', 'location', 'title', 'brand', 'model', 'is_sold')
+
     class Meta:
         ordering = ['-created_at']
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._indexed_state = instance.indexed_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._indexed_state = self.indexed_state()
+
+    def indexed_state(self):
+        """Current values of INDEXED_FIELDS, or None if any of them is deferred"""
+        if any(field not in self.__dict__ for field in self.INDEXED_FIELDS):
+            return None
+        return {field: self.__dict__[field] for field in self.INDEXED_FIELDS}
+
+    def save(self, *args, **kwargs):
+        # Stock is the source of truth; a listing is sold once nothing is left
+        self.is_sold = self.quantity == 0
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'quantity' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'is_sold'}
+        if update_fields is None or 'location' in update_fields:
+            apply_geocode(self, self.location)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'latitude', 'longitude', 'geohash'}
+        # Logged in the same transaction, so the change feed never misses a committed save
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ProductChange.record([self.pk])
+
     @property
     def image_url(self):
-        # First try to get main image from ProductImage model
-        main_image = self.images.filter(is_main=True).first()
-        if main_image and main_image.image:
-            return main_image.image.url
-        # Fallback to the original image field
+        # Main image from ProductImage first, then the original image field
+        if self.main_image_path:
+            return self.image.storage.url(self.main_image_path)
         if self.image:
             return self.image.url
         return None
 
+    def set_images(self, files, main_index=0):
+        """Replace the listing's images with ``files``; returns the names of the files replaced"""
+        with transaction.atomic():
+            old_files = [name for name in self.images.values_list('image', flat=True) if name]
+            self.images.all().delete()
+            images = ProductImage.objects.bulk_create([
+                ProductImage(product=self, image=file, is_main=index == main_index, order=index)
+                for index, file in enumerate(files)
+            ])
+            self.main_image_path = next((image.image.name for image in images if image.is_main), '')
+            self.image_count = len(images)
+            self.save(update_fields=['main_image_path', 'image_count'])
+        return old_files
+
     @property
     def all_images(self):
         """Get all product images ordered by main image first"""
@@ -96,6 +152,9 @@ class ProductImage(models.Model):
 
     class Meta:
         ordering = ['order']
+        constraints = [
+            models.UniqueConstraint(fields=['product'], condition=models.Q(is_main=True), name='unique_main_image_per_product'),
+        ]
 
     def __str__(self):
         return f"{self.product.title} - Image {self.order}"
@@ -106,8 +165,143 @@ class ProductImage(models.Model):
             return self.image.url
         return None
 
-    def save(self, *args, **kwargs):
-        # Ensure only one main image per product
-        if self.is_main:
-            ProductImage.objects.filter(product=self.product, is_main=True).update(is_main=False)
-        super().save(*args, **kwargs)
+class StockReservation(models.Model):
+    """Stock held for a buyer during checkout; released by the sweeper once expired"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'product']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held for {self.user_id}"
+
+class FacetCount(models.Model):
+    """Cached search facet counts for the whole catalogue, kept current by product signals"""
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=200)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='unique_facet_value'),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
+
+class SimilarProduct(models.Model):
+    """Precomputed top-K neighbours of a product, rebuilt by `manage.py build_similar_products`"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_products')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_similar_product_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.similar_id} (#{self.rank})"
+
+class ProductEventBucket(models.Model):
+    """Append-only per-interval event counts; summed and decayed by `manage.py compute_trending`"""
+    KIND_CHOICES = [
+        ('view', 'View'),
+        ('cart', 'Added to cart'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='event_buckets')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    bucket_start = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField()
+    # When the row was written (bucket_start is the interval it counts); analytics rollups wait for it to settle
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.count} {self.kind} of {self.product_id} at {self.bucket_start}"
+
+class ProductChange(models.Model):
+    """Append-only log behind GET /api/v1/products/changes/; compacted by `manage.py compact_product_changes`"""
+    # Not a foreign key: deletions are logged too and must outlive the product
+    product_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product_id', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {'deleted' if self.deleted else 'changed'} (#{self.pk})"
+
+    @classmethod
+    def record(cls, product_ids, deleted=False):
+        """Log that ``product_ids`` changed; call inside the transaction that changes them"""
+        cls.objects.bulk_create([cls(product_id=product_id, deleted=deleted) for product_id in product_ids])
+
+class ArchivedProduct(models.Model):
+    """Sold (or bought, then deleted) listing moved out of the hot products table; keeps its original id"""
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='archived_products')
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=0)
+    condition = models.CharField(max_length=20, choices=Product.CONDITION_CHOICES)
+    year_of_manufacture = models.PositiveIntegerField(blank=True, null=True)
+    brand = models.CharField(max_length=100, blank=True)
+    model = models.CharField(max_length=100, blank=True)
+    length = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+    width = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+    height = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+    weight = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True)
+    material = models.CharField(max_length=100, blank=True)
+    color = models.CharField(max_length=50, blank=True)
+    original_packaging = models.BooleanField(default=False)
+    manual_instructions = models.BooleanField(default=False)
+    working_condition_description = models.TextField(blank=True)
+    image = models.ImageField(upload_to='product_images/', blank=True, null=True)
+    main_image_path = models.CharField(max_length=255, blank=True)
+    image_count = models.PositiveIntegerField(default=0)
+    location = models.CharField(max_length=200, blank=True)
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_products')
+    is_sold = models.BooleanField(default=True)
+    view_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.title
+
+    # Same shape as a live listing, so the product serializers render either
+    image_url = Product.image_url
+    all_images = Product.all_images
+
+class ArchivedProductImage(models.Model):
+    product = models.ForeignKey(ArchivedProduct, on_delete=models.CASCADE, related_name='images')
+    image = models.ImageField(upload_to='product_images/')
+    is_main = models.BooleanField(default=False)
+    order = models.PositiveIntegerField(default=0)
+    alt_text = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['order']
+
+    def __str__(self):
+        return f"{self.product.title} - Image {self.order}"
+
+    image_url = ProductImage.image_url
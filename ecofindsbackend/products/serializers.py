@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from .models import Product, Category, ProductImage
 from users.serializers import UserProfileSerializer
+from mediafiles.storage import is_blob_name
+from .inventory import InsufficientStock, save_listing
+from .tasks import delete_media_files
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image_url = serializers.ReadOnlyField()
@@ -68,22 +71,23 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
             'images', 'main_image_index'
         )
 
+    def validate(self, attrs):
+        # is_sold is derived from stock: marking sold empties it, relisting restores one unit
+        is_sold = attrs.pop('is_sold', None)
+        if is_sold:
+            attrs['quantity'] = 0
+        elif is_sold is False and attrs.get('quantity', getattr(self.instance, 'quantity', 1)) == 0:
+            attrs['quantity'] = 1
+        return attrs
+
     def create(self, validated_data):
         images_data = validated_data.pop('images', [])
         main_image_index = validated_data.pop('main_image_index', 0)
         validated_data['seller'] = self.context['request'].user
         
         product = super().create(validated_data)
-        
-        # Create ProductImage instances
-        for index, image in enumerate(images_data):
-            is_main = (index == main_image_index)
-            ProductImage.objects.create(
-                product=product,
-                image=image,
-                is_main=is_main,
-                order=index
-            )
+        if images_data:
+            product.set_images(images_data, main_image_index)
         
         return product
 
@@ -91,26 +95,49 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
         images_data = validated_data.pop('images', None)
         main_image_index = validated_data.pop('main_image_index', None)
         
-        # Update the product instance
-        instance = super().update(instance, validated_data)
+        # Only the edited columns are written; stock goes through the inventory functions
+        loaded_quantity = instance.quantity
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        try:
+            save_listing(instance, validated_data, loaded_quantity)
+        except InsufficientStock:
+            raise serializers.ValidationError({'quantity': 'Stock cannot go below the units buyers are holding in checkout'})
         
         # Handle images update if provided
         if images_data is not None:
-            # Delete existing images
-            instance.images.all().delete()
-            
-            # Create new images
-            for index, image in enumerate(images_data):
-                is_main = (index == main_image_index) if main_image_index is not None else (index == 0)
-                ProductImage.objects.create(
-                    product=instance,
-                    image=image,
-                    is_main=is_main,
-                    order=index
-                )
+            # Replace existing images; files from before content addressing are removed in the background
+            old_files = instance.set_images(images_data, main_image_index if main_image_index is not None else 0)
+            legacy = [name for name in old_files if not is_blob_name(name)]
+            if legacy:
+                delete_media_files.delay(legacy)
         
         return instance
 
+class ProductImportSerializer(ProductCreateUpdateSerializer):
+    """One row of a bulk import; images are file names inside the uploaded zip"""
+    category = serializers.CharField()
+    images = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+
+    class Meta(ProductCreateUpdateSerializer.Meta):
+        fields = tuple(
+            field for field in ProductCreateUpdateSerializer.Meta.fields
+            if field not in ('image', 'main_image_index')
+        )
+
+    def validate_category(self, value):
+        # Categories are preloaded once per import instead of queried per row
+        category = self.context['categories'].get(value.strip().lower())
+        if category is None:
+            raise serializers.ValidationError(f'Unknown category "{value}"')
+        return category
+
+    def validate_images(self, value):
+        missing = [name for name in value if name not in self.context['image_names']]
+        if missing:
+            raise serializers.ValidationError(f'Not found in the images archive: {", ".join(missing)}')
+        return value
+
 class MyListingSerializer(serializers.ModelSerializer):
     image_url = serializers.ReadOnlyField()
     category_name = serializers.CharField(source='category.name', read_only=True)
@@ -0,0 +1,164 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
+from types import SimpleNamespace
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .facets import apply_facet_deltas, facet_values
+from .models import Category, Product, ProductChange, ProductImage
+from .suggest import listing_terms, suggest_index
+from .fuzzy import fuzzy_index, listing_text
+
+FACET_FIELDS = {'category', 'condition', 'price', 'location'}
+SUGGEST_FIELDS = {'title', 'brand', 'is_sold', 'quantity'}
+FUZZY_FIELDS = {'title', 'brand', 'model'}
+INDEXED_NAMES = FACET_FIELDS | SUGGEST_FIELDS | FUZZY_FIELDS
+
+_batch = threading.local()
+
+@contextmanager
+def batched_facet_updates():
+    """Collect the facet deltas product signals send inside the block and apply them once at the end"""
+    _batch.deltas = deltas = Counter()
+    try:
+        yield deltas
+    finally:
+        _batch.deltas = None
+    apply_facet_deltas(deltas)
+
+def _apply_facet_deltas(deltas):
+    pending = getattr(_batch, 'deltas', None)
+    if pending is None:
+        apply_facet_deltas(deltas)
+    else:
+        pending.update(deltas)
+
+# FacetCount rows are written in the saving transaction and roll back with it;
+# the in-memory suggest and fuzzy indexes only change once it has committed
+
+@receiver(pre_save, sender=Product)
+def remember_previous_state(sender, instance, update_fields=None, **kwargs):
+    instance._previous = None
+    if update_fields and not INDEXED_NAMES & set(update_fields):
+        return
+    if instance.pk:
+        state = getattr(instance, '_indexed_state', None)
+        if state is not None:
+            # Loaded (or last saved) with every indexed field, so no need to read the row again
+            instance._previous = SimpleNamespace(**state)
+        else:
+            instance._previous = Product.objects.filter(pk=instance.pk).only(*Product.INDEXED_FIELDS).first()
+
+@receiver(post_save, sender=Product)
+def update_facet_counts(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and not FACET_FIELDS & set(update_fields):
+        return
+    previous = facet_values(instance._previous) if instance._previous else set()
+    current = facet_values(instance)
+    deltas = Counter()
+    for key in previous - current:
+        deltas[key] -= 1
+    for key in current - previous:
+        deltas[key] += 1
+    _apply_facet_deltas(deltas)
+
+@receiver(post_save, sender=Product)
+def update_suggest_index(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and not SUGGEST_FIELDS & set(update_fields):
+        return
+    previous = listing_terms(instance._previous) if instance._previous else []
+    current = listing_terms(instance)
+    if previous != current:
+        transaction.on_commit(partial(_replace_terms, previous, current))
+
+@receiver(post_save, sender=Product)
+def update_fuzzy_index(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and not FUZZY_FIELDS & set(update_fields):
+        return
+    text = listing_text(instance)
+    if instance._previous is None or listing_text(instance._previous) != text:
+        transaction.on_commit(partial(fuzzy_index.add, instance.pk, text))
+
+@receiver(post_save, sender=Product)
+def remember_saved_state(sender, instance, update_fields=None, **kwargs):
+    # Registered last: the next save of this instance diffs against what this one wrote.
+    # Until this one commits the row is read back instead, so a rollback leaves no wrong baseline
+    if update_fields and not INDEXED_NAMES & set(update_fields):
+        return
+    if update_fields is None:
+        saved = instance.indexed_state()
+    else:
+        previous = instance._previous
+        baseline = vars(previous) if isinstance(previous, SimpleNamespace) else previous and previous.indexed_state()
+        saved = baseline and {**baseline, **{
+            field: getattr(instance, field) for field in Product.INDEXED_FIELDS
+            if Product._meta.get_field(field).name in update_fields
+        }}
+    instance._indexed_state = None
+    if saved:
+        transaction.on_commit(partial(setattr, instance, '_indexed_state', saved))
+
+def _replace_terms(previous, current):
+    for kind, text in previous:
+        suggest_index.remove(kind, text)
+    for kind, text in current:
+        suggest_index.add(kind, text)
+
+def _index_text(changes):
+    for product_id, text in changes:
+        fuzzy_index.add(product_id, text)
+
+def index_created_products(products):
+    # bulk_create sends no post_save, so bulk imports apply the same index updates here;
+    # call it inside the creating transaction
+    deltas = Counter()
+    terms = []
+    for product in products:
+        for key in facet_values(product):
+            deltas[key] += 1
+        terms += listing_terms(product)
+    apply_facet_deltas(deltas)
+    transaction.on_commit(partial(_replace_terms, [], terms))
+    transaction.on_commit(partial(_index_text, [(product.pk, listing_text(product)) for product in products]))
+
+def index_updated_products(changes):
+    # queryset.update() sends no post_save either; ``changes`` is [(previous, current)] per row
+    deltas = Counter()
+    removed_terms, added_terms, texts = [], [], []
+    for previous, current in changes:
+        for key in facet_values(previous) - facet_values(current):
+            deltas[key] -= 1
+        for key in facet_values(current) - facet_values(previous):
+            deltas[key] += 1
+        if listing_terms(previous) != listing_terms(current):
+            removed_terms += listing_terms(previous)
+            added_terms += listing_terms(current)
+        if listing_text(previous) != listing_text(current):
+            texts.append((current.pk, listing_text(current)))
+    apply_facet_deltas(deltas)
+    transaction.on_commit(partial(_replace_terms, removed_terms, added_terms))
+    transaction.on_commit(partial(_index_text, texts))
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_indexes(sender, instance, **kwargs):
+    _apply_facet_deltas({key: -1 for key in facet_values(instance)})
+    transaction.on_commit(partial(_replace_terms, listing_terms(instance), []))
+    transaction.on_commit(partial(fuzzy_index.remove, instance.pk))
+
+@receiver(post_delete, sender=Product)
+def log_product_deletion(sender, instance, **kwargs):
+    # Sent inside the delete's transaction; saves log themselves in Product.save
+    ProductChange.record([instance.pk], deleted=True)
+
+@receiver(post_save, sender=ProductImage)
+def log_image_change(sender, instance, **kwargs):
+    # Image deletions need no entry: they only happen with the product saved or deleted alongside
+    ProductChange.record([instance.product_id])
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_suggest_index(sender, **kwargs):
+    # Category changes are rare; rebuild on the next suggest request
+    suggest_index.invalidate()
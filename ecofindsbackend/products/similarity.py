@@ -0,0 +1,119 @@
+"""
+Item-item similarity for the "similar items" index.
+
+Candidates come from two places:
+- Co-occurrence: products bought or carted together. These are scored by
+  cosine similarity over basket membership.
+- Attributes: each product's neighbours in (category, price) order.
+  These are scored on category, brand, condition, price band and popularity.
+
+Every step is a vectorised pass over flat NumPy arrays. The running top-K is
+kept in two (N, K) arrays, so memory stays at O(N * K) whatever the window
+size or basket count.
+"""
+import numpy as np
+
+CO_OCCURRENCE_WEIGHT = 2.0
+MAX_BASKET_SIZE = 50
+# Price ratio at which price closeness drops to zero (4x cheaper or dearer)
+PRICE_BAND = np.log(4.0)
+
+
+def attribute_scores(features, src, dst):
+    """Attribute similarity in [0, 1] (plus a small popularity bonus) for index pairs"""
+    same_category = features['category'][src] == features['category'][dst]
+    brand = features['brand']
+    same_brand = (brand[src] == brand[dst]) & (brand[src] >= 0)
+    same_condition = features['condition'][src] == features['condition'][dst]
+    price_gap = np.abs(features['log_price'][src] - features['log_price'][dst])
+    price_closeness = np.clip(1.0 - price_gap / PRICE_BAND, 0.0, 1.0)
+    return (
+        0.35 * same_category + 0.25 * same_brand + 0.15 * same_condition
+        + 0.25 * price_closeness + 0.05 * features['popularity'][dst]
+    ).astype(np.float32)
+
+
+def co_occurrence(basket_ids, product_index, size):
+    """Directed (src, dst, cosine) triples for products sharing a basket"""
+    if not len(basket_ids):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    pairs = np.unique(np.stack([basket_ids, product_index], axis=1).astype(np.int64), axis=0)
+    baskets, members = pairs[:, 0], pairs[:, 1]
+    _, starts, counts = np.unique(baskets, return_index=True, return_counts=True)
+    keep = counts <= MAX_BASKET_SIZE
+    frequency = np.bincount(members, minlength=size)
+
+    # Self-join every basket: element i is paired with each member of its basket
+    group_of = np.repeat(np.arange(len(counts)), counts)[np.repeat(keep, counts)]
+    element = np.flatnonzero(np.repeat(keep, counts))
+    repeats = counts[group_of]
+    left = np.repeat(element, repeats)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right = starts[np.repeat(group_of, repeats)] + offsets
+    distinct = left != right
+    src, dst = members[left[distinct]], members[right[distinct]]
+
+    keys, together = np.unique(src * size + dst, return_counts=True)
+    src, dst = keys // size, keys % size
+    cosine = together / np.sqrt(frequency[src] * frequency[dst])
+    return src, dst, cosine.astype(np.float32)
+
+
+class TopK:
+    """Running top-K (index, score) per row, merged one candidate column at a time"""
+
+    def __init__(self, size, k):
+        self.ids = np.full((size, k), -1, dtype=np.int64)
+        self.scores = np.full((size, k), -np.inf, dtype=np.float32)
+
+    def merge(self, rows, candidates, scores):
+        # Callers guarantee each row appears at most once per merge
+        if not len(rows):
+            return
+        matches = self.ids[rows] == candidates[:, None]
+        seen = matches.any(axis=1)
+        if seen.any():
+            seen_rows, seen_cols = rows[seen], matches[seen].argmax(axis=1)
+            self.scores[seen_rows, seen_cols] = np.maximum(self.scores[seen_rows, seen_cols], scores[seen])
+        rows, candidates, scores = rows[~seen], candidates[~seen], scores[~seen]
+        weakest = self.scores[rows].argmin(axis=1)
+        better = scores > self.scores[rows, weakest]
+        rows, weakest = rows[better], weakest[better]
+        self.ids[rows, weakest] = candidates[better]
+        self.scores[rows, weakest] = scores[better]
+
+    def ranked(self):
+        order = np.argsort(-self.scores, axis=1, kind='stable')
+        return np.take_along_axis(self.ids, order, axis=1), np.take_along_axis(self.scores, order, axis=1)
+
+
+def nearest_neighbours(features, co_src, co_dst, co_score, k=10, window=30):
+    """Top-k (index, score) neighbours per product; index -1 marks an empty slot"""
+    size = len(features['category'])
+    available = features['available']
+    top = TopK(size, k)
+
+    order = np.lexsort((features['log_price'], features['category']))
+    for distance in range(1, min(window, size - 1) + 1):
+        left, right = order[:-distance], order[distance:]
+        same = features['category'][left] == features['category'][right]
+        left, right = left[same], right[same]
+        for src, dst in ((left, right), (right, left)):
+            usable = available[dst]
+            src, dst = src[usable], dst[usable]
+            top.merge(src, dst, attribute_scores(features, src, dst))
+
+    usable = available[co_dst]
+    co_src, co_dst, co_score = co_src[usable], co_dst[usable], co_score[usable]
+    scores = CO_OCCURRENCE_WEIGHT * co_score + attribute_scores(features, co_src, co_dst)
+    # Strongest first within each source, then merge one rank layer at a time
+    order = np.lexsort((-scores, co_src))
+    co_src, co_dst, scores = co_src[order], co_dst[order], scores[order]
+    _, starts, counts = np.unique(co_src, return_index=True, return_counts=True)
+    layer = np.arange(len(co_src)) - np.repeat(starts, counts)
+    for rank in range(min(k, int(layer.max(initial=-1)) + 1)):
+        in_layer = layer == rank
+        top.merge(co_src[in_layer], co_dst[in_layer], scores[in_layer])
+
+    return top.ranked()
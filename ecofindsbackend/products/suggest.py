@@ -0,0 +1,181 @@
+"""
+In-memory typeahead index over product titles, brands and category names.
+
+Completions are kept in a sorted list of normalised keys. The best completions
+for every one- and two-character prefix are precomputed, longer prefixes are
+ranked with two bisects and a short scan on first use and then memoised, so
+answering never touches the database.
+
+Each process holds its own copy: product signals update it in place, and it is
+rebuilt from the database once it is older than SUGGEST_INDEX_TTL so that
+changes made by other processes (or by bulk updates that skip signals) show up
+eventually.
+"""
+import bisect
+import heapq
+import threading
+import time
+from itertools import groupby
+from django.conf import settings
+from django.db.models import Count
+from .models import Category, Product
+
+# Completions kept per prefix; also the largest ``limit`` that can be asked for
+TOP_K = 20
+# Prefixes up to this length have their completions precomputed at build time
+PRECOMPUTED_PREFIX_LENGTH = 2
+# Longer prefixes are ranked on first use and memoised, up to this many
+MAX_MEMOISED = 50000
+
+
+def normalise(text):
+    return ' '.join(text.casefold().split())
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._entries = {}
+        self._top = {}
+        self.built_at = None
+
+    def build(self, terms):
+        """Replace the contents with ``(kind, text, weight)`` terms"""
+        entries = {}
+        for kind, text, weight in terms:
+            key = (normalise(text), kind)
+            if not key[0]:
+                continue
+            if key in entries:
+                entries[key][1] += weight
+            else:
+                entries[key] = [text, weight]
+        keys = sorted(entries)
+
+        # Keys sharing a short prefix are contiguous in sorted order
+        top = {}
+        for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+            for prefix, group in groupby(keys, key=lambda key: key[0][:length]):
+                top[prefix] = heapq.nsmallest(TOP_K, (self._rank(key, entries) for key in group))
+
+        with self._lock:
+            self._keys = keys
+            self._entries = entries
+            self._top = top
+            self.built_at = time.monotonic()
+
+    def add(self, kind, text, weight=1):
+        key = (normalise(text), kind)
+        if not key[0]:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            old_rank = self._rank(key) if entry else None
+            if entry:
+                entry[1] += weight
+            else:
+                self._entries[key] = [text, weight]
+                bisect.insort(self._keys, key)
+            new_rank = self._rank(key)
+
+            # A heavier key can only move up, so ranked prefixes are patched in place
+            for prefix in self._prefixes(key):
+                top = self._top[prefix]
+                if old_rank in top:
+                    top.remove(old_rank)
+                bisect.insort(top, new_rank)
+                del top[TOP_K:]
+
+    def remove(self, kind, text, weight=1):
+        key = (normalise(text), kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            old_rank = self._rank(key)
+            entry[1] -= weight
+            if entry[1] <= 0:
+                del self._entries[key]
+                index = bisect.bisect_left(self._keys, key)
+                if index < len(self._keys) and self._keys[index] == key:
+                    del self._keys[index]
+
+            # Something below the cut may now belong in the top; re-rank those prefixes
+            for prefix in self._prefixes(key):
+                if old_rank in self._top[prefix]:
+                    if len(prefix) > PRECOMPUTED_PREFIX_LENGTH:
+                        del self._top[prefix]
+                    else:
+                        self._top[prefix] = self._compute_top(prefix)
+
+    def suggest(self, prefix, limit=10):
+        prefix = normalise(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None:
+                top = self._compute_top(prefix)
+                if len(self._top) >= MAX_MEMOISED:
+                    self._top = {
+                        key: value for key, value in self._top.items()
+                        if len(key) <= PRECOMPUTED_PREFIX_LENGTH
+                    }
+                self._top[prefix] = top
+            return [
+                {'text': self._entries[key][0], 'type': key[1]}
+                for weight, length, key in top[:limit]
+            ]
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > settings.SUGGEST_INDEX_TTL
+
+    def invalidate(self):
+        self.built_at = None
+
+    def _rank(self, key, entries=None):
+        # Sorts ascending: most used first, then shortest, then alphabetical
+        return (-(entries or self._entries)[key][1], len(key[0]), key)
+
+    def _compute_top(self, prefix):
+        lo = bisect.bisect_left(self._keys, (prefix,))
+        hi = bisect.bisect_left(self._keys, (prefix + '\uffff',), lo)
+        return heapq.nsmallest(TOP_K, (self._rank(key) for key in self._keys[lo:hi]))
+
+    def _prefixes(self, key):
+        text = key[0]
+        return [text[:length] for length in range(1, len(text) + 1) if text[:length] in self._top]
+
+
+suggest_index = SuggestIndex()
+_build_lock = threading.Lock()
+
+
+def catalogue_terms():
+    listings = Product.objects.filter(is_sold=False).values_list('title', 'brand')
+    for title, brand in listings.iterator(chunk_size=5000):
+        yield 'title', title, 1
+        if brand:
+            yield 'brand', brand, 1
+    for name, product_count in Category.objects.annotate(n=Count('products')).values_list('name', 'n'):
+        # +1 so empty categories can still be completed
+        yield 'category', name, product_count + 1
+
+
+def get_suggest_index():
+    if suggest_index.is_stale():
+        with _build_lock:
+            if suggest_index.is_stale():
+                suggest_index.build(catalogue_terms())
+    return suggest_index
+
+
+def listing_terms(product):
+    """Terms one listing contributes while it is for sale"""
+    if product.is_sold:
+        return []
+    terms = [('title', product.title)]
+    if product.brand:
+        terms.append(('brand', product.brand))
+    return terms
@@ -0,0 +1,15 @@
+from django.core.files.storage import default_storage
+from django.db.models import F
+from taskqueue.registry import task
+from .models import Product
+
+@task()
+def increment_view_count(product_id):
+    Product.objects.filter(pk=product_id).update(view_count=F('view_count') + 1)
+
+@task()
+def delete_media_files(names):
+    # Files of replaced or deleted images; rows are already gone. Content-addressed files were
+    # released with their rows (mediafiles.signals), so only older uploads are passed here
+    for name in names:
+        default_storage.delete(name)
@@ -1,3 +1,1030 @@
-from django.test import TestCase
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from cart.models import CartItem
+from purchases.models import Purchase, PurchaseItem
+from .facets import PRICE_BUCKETS, cached_facets, compute_facets, rebuild_facet_counts
+from .archive import archive_sold_listings
+from .changes import decode_cursor, encode_cursor
+from .fuzzy import TrigramIndex, fuzzy_index
+from .geo import KM_PER_DEGREE_LAT, KM_PER_DEGREE_LNG, encode_geohash, within_radius
+from .inventory import InsufficientStock, commit_stock, decrement_stock, release_reservations, reserve_stock
+from .models import (
+    ArchivedProduct, Category, Product, ProductChange, ProductEventBucket, ProductImage, SimilarProduct,
+    StockReservation
+)
+from .serializers import ProductCreateUpdateSerializer
+from .suggest import suggest_index
+from .trending import EventBuffer, bucket_start, compute_trending_scores
 
-# Create your tests here.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+User = get_user_model()
+
+
+def _create_user(username):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='password')
+
+
+def _create_product(seller, **kwargs):
+    category, _ = Category.objects.get_or_create(name='Furniture', slug='furniture')
+    fields = {
+        'title': 'Oak chair', 'description': 'Solid oak', 'category': category,
+        'price': Decimal('25.00'), 'quantity': 1, 'seller': seller,
+    }
+    fields.update(kwargs)
+    return Product.objects.create(**fields)
+
+
+class ReleaseReservationsTests(TestCase):
+    def setUp(self):
+        self.seller = _create_user('seller')
+        self.buyer = _create_user('buyer')
+        self.product = _create_product(self.seller, quantity=5)
+
+    def _stock(self):
+        return Product.objects.values_list('quantity', 'reserved', 'is_sold').get(pk=self.product.pk)
+
+    def test_release_returns_stock(self):
+        reserve_stock(self.buyer, {self.product.id: 3})
+
+        released = release_reservations(StockReservation.objects.filter(user=self.buyer))
+
+        self.assertEqual(released, 3)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self._stock(), (5, 0, False))
+
+    def test_failed_release_keeps_reservation(self):
+        reserve_stock(self.buyer, {self.product.id: 3})
+
+        with mock.patch('products.inventory._unhold', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                release_reservations(StockReservation.objects.filter(user=self.buyer))
+
+        # The delete rolled back with the release, so the stock is still accounted for
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+        self.assertEqual(self._stock(), (5, 3, False))
+
+    def test_hold_does_not_mark_listing_sold(self):
+        ProductChange.objects.all().delete()
+
+        reserve_stock(self.buyer, {self.product.id: 5})
+
+        self.assertEqual(self._stock(), (5, 5, False))
+        self.assertFalse(ProductChange.objects.exists())
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(_create_user('other'), {self.product.id: 1})
+
+    def test_commit_sells_held_units(self):
+        reserve_stock(self.buyer, {self.product.id: 5})
+
+        with transaction.atomic():
+            commit_stock(self.buyer, self.product.id, 5)
+
+        self.assertEqual(self._stock(), (0, 0, True))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_commit_cannot_take_units_held_by_others(self):
+        reserve_stock(_create_user('other'), {self.product.id: 4})
+
+        with self.assertRaises(InsufficientStock):
+            with transaction.atomic():
+                commit_stock(self.buyer, self.product.id, 2)
+
+        self.assertEqual(self._stock(), (5, 4, False))
+
+
+class StockEditTests(TestCase):
+    def setUp(self):
+        self.seller = _create_user('seller')
+        self.product = _create_product(self.seller, quantity=5)
+
+    def _edit(self, product, **data):
+        serializer = ProductCreateUpdateSerializer(product, data=data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_edit_keeps_sale_made_since_loading(self):
+        loaded = Product.objects.get(pk=self.product.pk)
+        self.assertTrue(decrement_stock(self.product.pk, 2))
+
+        self._edit(loaded, title='Walnut chair')
+
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.title, product.quantity, product.is_sold), ('Walnut chair', 3, False))
+
+    def test_quantity_edit_applies_difference(self):
+        loaded = Product.objects.get(pk=self.product.pk)
+        self.assertTrue(decrement_stock(self.product.pk, 2))
+
+        edited = self._edit(loaded, quantity=8)
+
+        # The seller added three units to the five they saw; the two sold meanwhile stay sold
+        self.assertEqual(Product.objects.get(pk=self.product.pk).quantity, 6)
+        self.assertEqual(edited.quantity, 6)
+
+    def test_edit_cannot_drop_below_held_units(self):
+        reserve_stock(_create_user('buyer'), {self.product.id: 4})
+        loaded = Product.objects.get(pk=self.product.pk)
+
+        with self.assertRaises(ValidationError):
+            self._edit(loaded, quantity=1)
+
+        self.assertEqual(Product.objects.values_list('quantity', 'reserved').get(pk=self.product.pk), (5, 4))
+
+    def test_marking_sold_leaves_suggestions(self):
+        suggest_index.build([])
+        suggest_index.add('title', self.product.title)
+        loaded = Product.objects.get(pk=self.product.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._edit(loaded, is_sold=True)
+
+        self.assertEqual(Product.objects.values_list('quantity', 'is_sold').get(pk=self.product.pk), (0, True))
+        self.assertEqual(suggest_index.suggest('oak'), [])
+
+
+class IndexSignalTests(TestCase):
+    def setUp(self):
+        self.seller = _create_user('seller')
+        suggest_index.build([])
+
+    def _price_counts(self):
+        return {facet['value']: facet['count'] for facet in cached_facets()['price']}
+
+    def test_save_of_loaded_product_does_not_read_it_back(self):
+        product = _create_product(self.seller)
+        product = Product.objects.get(pk=product.pk)
+        product.price = Decimal('300.00')
+
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+
+        table = Product._meta.db_table
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT') and table in query['sql']])
+        self.assertEqual(self._price_counts(), {'250-500': 1})
+
+    def test_rolled_back_save_leaves_indexes_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = _create_product(self.seller)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    product.title = 'Pine table'
+                    product.price = Decimal('300.00')
+                    product.save()
+                    raise RuntimeError
+
+        self.assertEqual(self._price_counts(), {'25-50': 1})
+        self.assertEqual(suggest_index.suggest('pine'), [])
+        self.assertEqual(suggest_index.suggest('oak'), [{'text': 'Oak chair', 'type': 'title'}])
+
+        # The instance still holds the rolled back values; saving them now is diffed against the row
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+
+        self.assertEqual(self._price_counts(), {'250-500': 1})
+        self.assertEqual(suggest_index.suggest('pine'), [{'text': 'Pine table', 'type': 'title'}])
+        self.assertEqual(suggest_index.suggest('oak'), [])
+
+    def test_consecutive_saves_of_one_instance(self):
+        product = _create_product(self.seller)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = Decimal('60.00')
+            product.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = Decimal('600.00')
+            product.save(update_fields=['price'])
+
+        self.assertEqual(self._price_counts(), {'500-1000': 1})
+
+
+class TrigramIndexTests(TestCase):
+    def test_rename_moves_postings(self):
+        index = TrigramIndex()
+        index.add(1, 'Samsung Galaxy')
+        index.add(1, 'Google Pixel')
+
+        self.assertEqual(index.search('samsng'), [])
+        self.assertEqual(index.search('pixle'), [1])
+        # Words no listing uses any more leave the vocabulary and trigram postings
+        self.assertEqual(set(index._word_ids), {'google', 'pixel'})
+        self.assertNotIn('sam', {gram.strip() for gram in index._trigram_words})
+
+    def test_remove_frees_words_for_reuse(self):
+        index = TrigramIndex()
+        for doc_id in range(100):
+            index.add(doc_id, f'word{doc_id}')
+        for doc_id in range(100):
+            index.remove(doc_id)
+        index.add(200, 'fresh listing')
+
+        self.assertEqual(len(index._words), 100)
+        self.assertEqual(index.search('fresh'), [200])
+        self.assertEqual(sum(len(docs) for docs in index._word_docs), 2)
+
+
+class SuggestIndexTests(TestCase):
+    def setUp(self):
+        suggest_index.build([
+            ('title', 'Oak chair', 1), ('title', 'Oak chair', 1), ('title', 'Oak dining table', 3),
+            ('title', 'Oak', 1), ('brand', 'Oakley', 2), ('category', 'Outdoor', 1),
+        ])
+
+    def _texts(self, prefix, limit=10):
+        return [suggestion['text'] for suggestion in suggest_index.suggest(prefix, limit=limit)]
+
+    def test_prefix_ranking(self):
+        # Most used first, then shortest, then alphabetical; short prefixes are precomputed, longer ones ranked on demand
+        self.assertEqual(self._texts('o'), ['Oak dining table', 'Oakley', 'Oak chair', 'Oak', 'Outdoor'])
+        self.assertEqual(self._texts('OAK  D'), ['Oak dining table'])
+        self.assertEqual(self._texts('oak', limit=2), ['Oak dining table', 'Oakley'])
+        self.assertEqual(self._texts('pine'), [])
+        self.assertEqual(self._texts(''), [])
+
+    def test_add_and_remove_rerank(self):
+        for _ in range(3):
+            suggest_index.add('title', 'Oak')
+        suggest_index.remove('title', 'Oak dining table', weight=3)
+
+        self.assertEqual(self._texts('oa'), ['Oak', 'Oakley', 'Oak chair'])
+        self.assertEqual(suggest_index.suggest('oak d'), [])
+
+    def test_endpoint_follows_saves(self):
+        seller = _create_user('seller')
+        with self.captureOnCommitCallbacks(execute=True):
+            product = _create_product(seller, title='Teak bench', brand='Ercol')
+        client = APIClient()
+        client.force_authenticate(seller)
+
+        # Creating the category invalidated the index; the first request rebuilds it, later ones read memory only
+        client.get('/api/v1/search/suggest/', {'q': 'te'})
+        with self.assertNumQueries(0):
+            response = client.get('/api/v1/search/suggest/', {'q': 'te'})
+        self.assertEqual(response.data['suggestions'], [{'text': 'Teak bench', 'type': 'title'}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.title = 'Teak stool'
+            product.save()
+        self.assertEqual(client.get('/api/v1/search/suggest/', {'q': 'teak'}).data['suggestions'], [
+            {'text': 'Teak stool', 'type': 'title'}
+        ])
+
+        # Sold listings stop being suggested
+        with self.captureOnCommitCallbacks(execute=True):
+            product.quantity = 0
+            product.save()
+        self.assertEqual(client.get('/api/v1/search/suggest/', {'q': 'e'}).data['suggestions'], [])
+
+
+class SearchQueryTests(TestCase):
+    def setUp(self):
+        seller = _create_user('seller')
+        for index in range(6):
+            _create_product(seller, title=f'Oak chair {index}')
+        _create_product(seller, title='Samsung Galaxy')
+        self.client = APIClient()
+        self.client.force_authenticate(seller)
+        # Rebuilt from this test's rows on the next search
+        fuzzy_index.built_at = None
+
+    def test_exact_matches_count_once(self):
+        # Count (shared by the fallback check and the paginator), page, images
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/v1/search/?q=chair')
+
+        self.assertEqual(response.data['count'], 6)
+        self.assertNotIn('fuzzy', response.data)
+
+    def test_fallback_to_fuzzy_matches(self):
+        response = self.client.get('/api/v1/search/?q=samsng')
+
+        self.assertTrue(response.data['fuzzy'])
+        self.assertEqual([item['title'] for item in response.data['results']], ['Samsung Galaxy'])
+
+
+class RadiusSearchTests(TestCase):
+    def setUp(self):
+        self.seller = _create_user('seller')
+
+    def _place(self, title, latitude, longitude):
+        product = _create_product(self.seller, title=title)
+        Product.objects.filter(pk=product.pk).update(
+            latitude=latitude, longitude=longitude, geohash=encode_geohash(latitude, longitude)
+        )
+
+    def _titles_near(self, latitude, longitude, radius_km):
+        products = within_radius(Product.objects.all(), latitude, longitude, radius_km)
+        return sorted(product.title for product in products)
+
+    def test_radius_crosses_antimeridian(self):
+        # Taveuni (Fiji) and Rabi island sit either side of 180°, about 60 km apart
+        self._place('east', -16.85, 179.95)
+        self._place('west', -16.45, -179.95)
+        self._place('far', -16.45, -178.0)
+
+        self.assertEqual(self._titles_near(-16.85, 179.95, 100), ['east', 'west'])
+        self.assertEqual(self._titles_near(-16.45, -179.95, 100), ['east', 'west'])
+
+    def test_radius_away_from_antimeridian(self):
+        self._place('near', 51.50, -0.12)
+        self._place('far', 48.85, 2.35)
+
+        self.assertEqual(self._titles_near(51.45, -0.10, 20), ['near'])
+
+
+@skipUnless(numpy, 'build_similar_products requires numpy')
+class SimilarProductsTests(TestCase):
+    def setUp(self):
+        self.seller = _create_user('seller')
+        self.buyer = _create_user('buyer')
+        books = Category.objects.create(name='Books', slug='books')
+        self.chair = _create_product(self.seller, brand='Ercol')
+        self.stool = _create_product(self.seller, title='Oak stool', brand='Ercol', price=Decimal('30.00'))
+        self.sofa = _create_product(self.seller, title='Sofa', price=Decimal('500.00'))
+        self.book = _create_product(self.seller, title='Joinery book', category=books)
+        self.sold = _create_product(self.seller, title='Oak bench', brand='Ercol', quantity=0)
+        # Bought together, so the book outranks listings in the chair's own category
+        CartItem.objects.add_products(self.buyer, {self.chair.id: 1, self.book.id: 1})
+
+    def _build(self):
+        call_command('build_similar_products', k=3, stdout=StringIO())
+
+    def test_build_ranks_neighbours(self):
+        self._build()
+
+        neighbours = list(SimilarProduct.objects.filter(product=self.chair).values_list('similar_id', 'rank'))
+        self.assertEqual(neighbours, [(self.book.id, 0), (self.stool.id, 1), (self.sofa.id, 2)])
+        # Sold listings are never stored as neighbours
+        self.assertFalse(SimilarProduct.objects.filter(similar=self.sold).exists())
+
+        # A rebuild replaces the table instead of adding to it
+        self._build()
+        self.assertEqual(SimilarProduct.objects.filter(product=self.chair).count(), 3)
+
+    def test_endpoint(self):
+        self._build()
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+
+        response = client.get(f'/api/v1/products/{self.chair.id}/similar/', {'limit': 2})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.book.id, self.stool.id])
+
+        # Neighbours that sold since the build are skipped, and a seller is not shown their own listings
+        Product.objects.filter(pk=self.book.pk).update(quantity=0, is_sold=True)
+        response = client.get(f'/api/v1/products/{self.chair.id}/similar/', {'limit': 2})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.stool.id, self.sofa.id])
+        client.force_authenticate(self.seller)
+        response = client.get(f'/api/v1/products/{self.chair.id}/similar/')
+        self.assertEqual(response.data['results'], [])
+
+    def test_endpoint_falls_back_to_category(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+
+        response = client.get(f'/api/v1/products/{self.chair.id}/similar/')
+        self.assertEqual(
+            sorted(product['id'] for product in response.data['results']), [self.stool.id, self.sofa.id]
+        )
+        self.assertEqual(client.get('/api/v1/products/999999/similar/').status_code, 404)
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        seller = _create_user('seller')
+        self.chair = _create_product(seller)
+        self.table = _create_product(seller, title='Pine table')
+        self.buffer = EventBuffer()
+
+    def _record(self, product_id, kind, count=1):
+        # No background flush thread: the test flushes by hand
+        with mock.patch.object(EventBuffer, '_run'):
+            for _ in range(count):
+                self.buffer.record(product_id, kind)
+
+    def _buckets(self):
+        return sorted(ProductEventBucket.objects.values_list('product_id', 'kind', 'count'))
+
+    def test_flush_writes_buckets_and_view_count(self):
+        self._record(self.chair.id, 'view', 3)
+        self._record(self.table.id, 'view', 3)
+        self._record(self.chair.id, 'cart')
+        # Deleted before the flush; its events are dropped
+        self._record(999999, 'view')
+
+        self.assertEqual(self.buffer.flush(), 4)
+
+        self.assertEqual(self._buckets(), [
+            (self.chair.id, 'cart', 1), (self.chair.id, 'view', 3), (self.table.id, 'view', 3)
+        ])
+        self.assertEqual(dict(Product.objects.values_list('id', 'view_count')), {self.chair.id: 3, self.table.id: 3})
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_events(self):
+        self._record(self.chair.id, 'view', 2)
+
+        with mock.patch.object(EventBuffer, '_write', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self._record(self.chair.id, 'view')
+        self.buffer.flush()
+
+        self.assertEqual(self._buckets(), [(self.chair.id, 'view', 3)])
+        self.assertEqual(Product.objects.get(pk=self.chair.pk).view_count, 3)
+
+    def test_scores_decay_and_old_buckets_are_pruned(self):
+        now = bucket_start(timezone.now())
+        half_life = settings.TRENDING_HALF_LIFE
+        ProductEventBucket.objects.bulk_create([
+            ProductEventBucket(product=self.chair, kind='view', bucket_start=now, count=4),
+            ProductEventBucket(product=self.chair, kind='cart', bucket_start=now - half_life, count=2),
+            ProductEventBucket(product=self.table, kind='view', bucket_start=now - settings.TRENDING_WINDOW - half_life, count=50),
+        ])
+        Product.objects.filter(pk=self.table.pk).update(trending_score=10)
+
+        self.assertEqual(compute_trending_scores(now=now), (1, 1))
+
+        scores = dict(Product.objects.values_list('id', 'trending_score'))
+        weights = settings.TRENDING_EVENT_WEIGHTS
+        # A cart event a half-life old counts half
+        self.assertAlmostEqual(scores[self.chair.id], 4 * weights['view'] + 2 * weights['cart'] / 2)
+        # Its only events fell out of the window
+        self.assertEqual(scores[self.table.id], 0)
+        self.assertEqual(ProductEventBucket.objects.count(), 2)
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, BULK_IMPORT_CHUNK_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.seller = _create_user('seller')
+        Category.objects.create(name='Furniture', slug='furniture')
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def _images(self):
+        photo = BytesIO()
+        PILImage.new('RGB', (4, 4)).save(photo, 'PNG')
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zipped:
+            zipped.writestr('chair.png', photo.getvalue())
+            zipped.writestr('notes.png', b'not an image')
+        return SimpleUploadedFile('images.zip', archive.getvalue(), content_type='application/zip')
+
+    def _import(self, name, content, images=None):
+        files = {'file': SimpleUploadedFile(name, content.encode())}
+        if images:
+            files['images'] = images
+        return self.client.post('/api/v1/products/import/', files, format='multipart')
+
+    def test_failed_rows_are_reported_and_the_rest_imported(self):
+        content = (
+            'title,description,category,price,quantity,images\n'
+            'Oak chair,Solid oak,furniture,25.00,2,chair.png\n'
+            'Pine table,Pine,Garden,40.00,1,\n'
+            'Elm stool,Elm,Furniture,cheap,1,\n'
+            'Ash desk,Ash,furniture,90.00,1,notes.png\n'
+            'Beech shelf,Beech,furniture,30.00,1,missing.png\n'
+            'Yew bench,Yew,FURNITURE,55.00,0,\n'
+        )
+
+        response = self._import('listings.csv', content, self._images())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 4))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3, 4, 5])
+        self.assertIn('category', response.data['errors'][0]['errors'])
+        self.assertIn('price', response.data['errors'][1]['errors'])
+        self.assertIn('images', response.data['errors'][2]['errors'])
+        self.assertIn('images', response.data['errors'][3]['errors'])
+
+        chair, bench = Product.objects.order_by('id')
+        self.assertEqual((chair.title, chair.image_count, chair.is_sold), ('Oak chair', 1, False))
+        self.assertEqual(chair.main_image_path, chair.images.get().image.name)
+        self.assertEqual((bench.title, bench.is_sold), ('Yew bench', True))
+        self.assertEqual(ProductChange.objects.filter(product_id__in=response.data['product_ids']).count(), 2)
+
+    def test_rows_are_inserted_a_chunk_at_a_time(self):
+        content = ''.join(
+            json.dumps({'title': f'Chair {i}', 'description': 'Oak', 'category': 'furniture', 'price': '25.00'}) + '\n'
+            for i in range(5)
+        ) + '{not json\n'
+
+        with mock.patch.object(Product.objects, 'bulk_create', wraps=Product.objects.bulk_create) as bulk_create:
+            response = self._import('listings.jsonl', content)
+
+        # Five valid rows in chunks of two; the broken line is reported, not fatal
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 2, 1])
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(response.data['errors'][0]['row'], 6)
+
+    def test_failed_chunk_rolls_back_only_its_rows(self):
+        content = ''.join(
+            json.dumps({'title': f'Chair {i}', 'description': 'Oak', 'category': 'furniture', 'price': '25.00'}) + '\n'
+            for i in range(4)
+        )
+        bulk_create = Product.objects.bulk_create
+        chunks = []
+
+        def fail_second_chunk(products):
+            chunks.append(products)
+            if len(chunks) == 2:
+                raise RuntimeError('disk full')
+            return bulk_create(products)
+
+        with mock.patch.object(Product.objects, 'bulk_create', side_effect=fail_second_chunk):
+            response = self._import('listings.jsonl', content)
+
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertEqual(list(Product.objects.order_by('id').values_list('title', flat=True)), ['Chair 0', 'Chair 1'])
+
+
+class ProductBatchTests(TestCase):
+    def setUp(self):
+        seller = _create_user('seller')
+        self.products = [_create_product(seller, title=f'Chair {i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(seller)
+
+    def _get(self, ids):
+        return self.client.get('/api/v1/products/batch/', {'ids': ids})
+
+    def test_requested_order_and_missing_ids(self):
+        first, second, third = (product.id for product in self.products)
+
+        # The products and their images, however many ids are asked for
+        with self.assertNumQueries(2):
+            response = self._get(f'{third},999999,{first},{third}, {second}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.data['results']], [third, first, second])
+        self.assertEqual(response.data['missing_ids'], [999999])
+
+    @override_settings(PRODUCT_BATCH_MAX_IDS=2)
+    def test_limit(self):
+        self.assertEqual(self._get(f'{self.products[0].id},{self.products[1].id}').status_code, 200)
+        # Duplicates do not count towards the limit
+        self.assertEqual(self._get(f'{self.products[0].id},{self.products[0].id},{self.products[1].id}').status_code, 200)
+        self.assertEqual(self._get(','.join(str(product.id) for product in self.products)).status_code, 400)
+
+    def test_invalid_ids(self):
+        self.assertEqual(self._get('').status_code, 400)
+        self.assertEqual(self._get('1,two').status_code, 400)
+
+
+class ImageSummaryTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = _create_product(_create_user('seller'))
+
+    def _files(self, *contents):
+        return [SimpleUploadedFile(f'photo{index}.jpg', content) for index, content in enumerate(contents)]
+
+    def _summary(self):
+        return Product.objects.values_list('main_image_path', 'image_count').get(pk=self.product.pk)
+
+    def test_set_images_keeps_summary_in_sync(self):
+        self.assertEqual(self.product.set_images(self._files(b'a', b'b', b'c'), main_index=1), [])
+        main = ProductImage.objects.get(product=self.product, is_main=True)
+        self.assertEqual(main.order, 1)
+        self.assertEqual(self._summary(), (main.image.name, 3))
+
+        replaced = self.product.set_images(self._files(b'd'))
+        self.assertEqual(len(replaced), 3)
+        self.assertEqual(self._summary(), (ProductImage.objects.get(product=self.product).image.name, 1))
+
+        self.product.set_images([])
+        self.assertEqual(self._summary(), ('', 0))
+
+    def test_one_main_image_per_product(self):
+        self.product.set_images(self._files(b'a', b'b'))
+        # Other listings' main images do not conflict
+        other = _create_product(self.product.seller)
+        other.set_images(self._files(b'c'))
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                ProductImage.objects.filter(product=self.product).update(is_main=True)
+        # Any number of non-main images is fine
+        ProductImage.objects.filter(product=self.product).update(is_main=False)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.seller = _create_user('seller')
+        self.buyer = _create_user('buyer')
+        self.product = _create_product(self.seller, quantity=3)
+        purchase = Purchase.objects.create(
+            buyer=self.buyer, shipping_address='1 Main St', payment_method='card', total_amount=Decimal('25.00')
+        )
+        PurchaseItem.objects.create(purchase=purchase, product=self.product, price_at_purchase=Decimal('25.00'))
+        self.client = APIClient()
+
+    def _sell_out(self):
+        Product.objects.filter(pk=self.product.pk).update(
+            quantity=0, is_sold=True, updated_at=timezone.now() - timedelta(days=1)
+        )
+
+    def _history_titles(self):
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get('/api/v1/purchases/history/')
+        return [item['product'] and item['product']['title'] for item in response.data['results'][0]['items']]
+
+    def test_rerun_is_idempotent(self):
+        self._sell_out()
+        # Not sold long enough ago yet
+        self.assertEqual(archive_sold_listings(older_than=timedelta(days=2)), 0)
+
+        self.assertEqual(archive_sold_listings(older_than=timedelta(hours=1)), 1)
+        self.assertEqual(archive_sold_listings(older_than=timedelta(hours=1)), 0)
+
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(ArchivedProduct.objects.get().pk, self.product.pk)
+
+    def test_archived_detail_is_readable_but_not_editable(self):
+        self._sell_out()
+        archive_sold_listings(older_than=timedelta(hours=1))
+        self.client.force_authenticate(self.seller)
+
+        response = self.client.get(f'/api/v1/products/{self.product.pk}/')
+        self.assertEqual((response.status_code, response.data['title']), (200, 'Oak chair'))
+        self.assertEqual(self.client.patch(f'/api/v1/products/{self.product.pk}/', {'title': 'Pine'}).status_code, 404)
+
+    def test_order_history_falls_back_to_archive(self):
+        self._sell_out()
+        archive_sold_listings(older_than=timedelta(hours=1))
+
+        self.assertEqual(self._history_titles(), ['Oak chair'])
+
+    def test_deleting_bought_listing_archives_it(self):
+        unsold = _create_product(self.seller, title='Pine table')
+        self.client.force_authenticate(self.seller)
+
+        self.assertEqual(self.client.delete(f'/api/v1/products/{self.product.pk}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'/api/v1/products/{unsold.pk}/').status_code, 204)
+
+        self.assertFalse(Product.objects.exists())
+        # Off the market, but purchase history still shows what was bought
+        archived = ArchivedProduct.objects.get()
+        self.assertEqual((archived.pk, archived.quantity, archived.is_sold), (self.product.pk, 0, True))
+        self.assertEqual(self._history_titles(), ['Oak chair'])
+
+
+class ProductChangesTests(TestCase):
+    def setUp(self):
+        seller = _create_user('seller')
+        for index in range(3):
+            _create_product(seller, title=f'Oak chair {index}')
+        self.written_at = timezone.now() - timedelta(days=20)
+        ProductChange.objects.update(created_at=self.written_at)
+        self.client = APIClient()
+        self.client.force_authenticate(seller)
+
+    def _changes(self, cursor, limit):
+        response = self.client.get('/api/v1/products/changes/', {'since': cursor, 'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_cursor_part_way_through_backlog_keeps_entry_time(self):
+        page = self._changes(encode_cursor(0), limit=2)
+
+        self.assertTrue(page['has_more'])
+        issued_at = decode_cursor(page['cursor'])[1]
+        self.assertEqual(issued_at, self.written_at.replace(microsecond=0))
+
+        # Past retention by then, so the client starts over rather than missing compacted entries
+        with self.settings(PRODUCT_CHANGE_RETENTION=timedelta(days=15)):
+            response = self.client.get('/api/v1/products/changes/', {'since': page['cursor']})
+        self.assertEqual(response.status_code, 410)
+
+    def test_caught_up_cursor_is_issued_now(self):
+        page = self._changes(encode_cursor(0), limit=10)
+
+        self.assertFalse(page['has_more'])
+        self.assertEqual(len(page['updated']), 3)
+        self.assertLess(timezone.now() - decode_cursor(page['cursor'])[1], timedelta(minutes=1))
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.client.force_login(admin_user)
+        buyer = _create_user('buyer')
+        for index in range(3):
+            seller = _create_user(f'seller{index}')
+            category = Category.objects.create(name=f'Category {index}', slug=f'category-{index}')
+            product = _create_product(seller, title=f'Oak chair {index}', category=category, quantity=5)
+            reserve_stock(buyer, {product.id: 1})
+            sold = _create_product(seller, title=f'Pine table {index}', category=category, quantity=0)
+            Product.objects.filter(pk=sold.pk).update(updated_at=sold.updated_at - timedelta(days=1))
+        archive_sold_listings(older_than=timedelta(hours=1))
+
+    def _assert_changelist_queries(self, url, num):
+        # Session, user, filtered and total count and the page, plus any filter or action choices;
+        # a query per row would fail with the three rows of each model created in setUp
+        with self.assertNumQueries(num):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_category_changelist(self):
+        self._assert_changelist_queries('/admin/products/category/', 5)
+
+    def test_product_changelist(self):
+        # Category filter and the reassign action's category choices
+        self._assert_changelist_queries('/admin/products/product/', 7)
+
+    def test_stock_reservation_changelist(self):
+        self._assert_changelist_queries('/admin/products/stockreservation/', 5)
+
+    def test_archived_product_changelist(self):
+        self._assert_changelist_queries('/admin/products/archivedproduct/', 6)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class FacetBenchmark(TestCase):
+    """Facet computation over BENCHMARK_LISTINGS listings (1M by default)"""
+    listings = int(os.environ.get('BENCHMARK_LISTINGS', 1000000))
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = _create_user('seller')
+        categories = Category.objects.bulk_create([Category(name=f'Category {i}', slug=f'category-{i}') for i in range(15)])
+        conditions = [value for value, label in Product.CONDITION_CHOICES]
+        locations = [f'City {i}' for i in range(200)]
+        rng = random.Random(0)
+        for start in range(0, cls.listings, 50000):
+            Product.objects.bulk_create([
+                Product(
+                    title=f'Listing {i}', description='', category=rng.choice(categories),
+                    condition=rng.choice(conditions), price=Decimal(rng.randint(1, 150000)) / 100,
+                    location=rng.choice(locations), seller=seller
+                )
+                for i in range(start, min(start + 50000, cls.listings))
+            ], batch_size=5000)
+        rebuild_facet_counts()
+
+    def _time(self, label, func, repeat=3):
+        best = min(self._once(func) for _ in range(repeat))
+        print(f'{label}: {best * 1000:.1f} ms')
+
+    def _once(self, func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    def test_facets(self):
+        print(f'\n{self.listings} listings')
+        self._time('grouped aggregate, whole catalogue', lambda: compute_facets(Product.objects.all()))
+        self._time('grouped aggregate, one category', lambda: compute_facets(
+            Product.objects.filter(category=Category.objects.first())
+        ))
+        self._time('grouped aggregate, price filter', lambda: compute_facets(
+            Product.objects.filter(price__lt=PRICE_BUCKETS[1][2])
+        ))
+        self._time('cached table, whole catalogue', cached_facets, repeat=20)
+        self._time('full rebuild', rebuild_facet_counts, repeat=1)
+        product = Product.objects.first()
+
+        def save():
+            product.price = Decimal(random.randint(1, 150000)) / 100
+            product.save()
+        self._time('incremental update on save', save, repeat=20)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class ReservationContentionBenchmark(TransactionTestCase):
+    """
+    Reserve/release throughput of concurrent buyers of one listing: conditional UPDATE against SELECT ... FOR UPDATE.
+
+    SQLite has no row locks, so run it against PostgreSQL or MySQL for meaningful numbers.
+    """
+    workers = 8
+    cycles = 100
+
+    def setUp(self):
+        seller = _create_user('seller')
+        self.buyers = [_create_user(f'buyer{index}') for index in range(self.workers)]
+        self.product = _create_product(seller, quantity=10 ** 6)
+
+    def _locked_reserve(self, buyer):
+        with transaction.atomic():
+            product = Product.objects.select_for_update().get(pk=self.product.pk)
+            product.reserved += 1
+            product.save(update_fields=['reserved'])
+            return StockReservation.objects.create(
+                product=product, user=buyer, quantity=1, expires_at=timezone.now() + timedelta(minutes=5)
+            )
+
+    def _locked_release(self, reservation):
+        with transaction.atomic():
+            product = Product.objects.select_for_update().get(pk=self.product.pk)
+            reservation.delete()
+            product.reserved -= 1
+            product.save(update_fields=['reserved'])
+
+    def _time(self, reserve, release):
+        barrier = threading.Barrier(self.workers + 1)
+
+        def retry(call):
+            # SQLite fails the losing writer instead of queueing it
+            while True:
+                try:
+                    return call()
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    time.sleep(0.001)
+
+        def run(buyer):
+            try:
+                barrier.wait()
+                for _ in range(self.cycles):
+                    held = retry(lambda: reserve(buyer))
+                    retry(lambda: release(held))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(buyer,)) for buyer in self.buyers]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return self.workers * self.cycles / (time.perf_counter() - start)
+
+    def test_contention(self):
+        locked = self._time(self._locked_reserve, self._locked_release)
+        # Without row locks (SQLite) the read-modify-write path loses updates; start the second run clean
+        Product.objects.filter(pk=self.product.pk).update(reserved=0)
+        conditional = self._time(
+            lambda buyer: reserve_stock(buyer, {self.product.pk: 1}), release_reservations
+        )
+        self.assertEqual(Product.objects.get(pk=self.product.pk).reserved, 0)
+        print(f'\n{self.workers} buyers of one listing: select_for_update {locked:.0f}, conditional update {conditional:.0f} reserve/release cycles per second')
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class FuzzySearchBenchmark(TestCase):
+    """Recall and latency of one-typo queries over BENCHMARK_FUZZY_LISTINGS synthetic listings (100k by default)"""
+    listings = int(os.environ.get('BENCHMARK_FUZZY_LISTINGS', 100000))
+    vocabulary = 30000
+    queries = 1000
+
+    def test_typo_recall(self):
+        rng = random.Random(0)
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        vocabulary = sorted({
+            ''.join(rng.choice(letters) for _ in range(rng.randint(5, 10))) for _ in range(self.vocabulary)
+        })
+        docs = [' '.join(rng.sample(vocabulary, 3)) for _ in range(self.listings)]
+        index = TrigramIndex()
+        start = time.perf_counter()
+        index.build(enumerate(docs))
+        built = time.perf_counter() - start
+
+        hits = 0
+        elapsed = 0
+        for _ in range(self.queries):
+            word = rng.choice(rng.choice(docs).split())
+            position = rng.randrange(len(word))
+            typo = word[:position] + rng.choice(letters) + word[position + 1:]
+            start = time.perf_counter()
+            results = index.search(typo, limit=10)
+            elapsed += time.perf_counter() - start
+            # A hit when a top-10 listing contains the word the typo was made from
+            hits += any(word in docs[doc_id].split() for doc_id in results)
+        print(f'\n{self.listings} listings, {len(vocabulary)} words: built in {built:.1f} s, '
+              f'recall@10 {hits / self.queries:.2f}, {elapsed / self.queries * 1000:.2f} ms/query')
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class RadiusSearchBenchmark(TestCase):
+    """Radius queries over BENCHMARK_LISTINGS geocoded listings (1M by default), checked against a full scan"""
+    listings = int(os.environ.get('BENCHMARK_LISTINGS', 1000000))
+    centre = (52.5, -1.5)
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = _create_user('seller')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        rng = random.Random(0)
+        for start in range(0, cls.listings, 50000):
+            batch = []
+            for i in range(start, min(start + 50000, cls.listings)):
+                latitude, longitude = rng.uniform(49.9, 58.7), rng.uniform(-7.6, 1.8)
+                batch.append(Product(
+                    title=f'Listing {i}', description='', category=category, price=Decimal('25.00'),
+                    location='', seller=seller, latitude=latitude, longitude=longitude,
+                    geohash=encode_geohash(latitude, longitude)
+                ))
+            Product.objects.bulk_create(batch, batch_size=5000)
+
+    def _scan(self, points, radius_km):
+        latitude, longitude = self.centre
+        km_per_lng = KM_PER_DEGREE_LNG * math.cos(math.radians(latitude))
+        return {
+            pk for pk, lat, lng in points
+            if ((lng - longitude) * km_per_lng) ** 2 + ((lat - latitude) * KM_PER_DEGREE_LAT) ** 2 <= radius_km ** 2
+        }
+
+    def test_radius_queries(self):
+        points = list(Product.objects.values_list('pk', 'latitude', 'longitude'))
+        print(f'\n{self.listings} listings')
+        for radius_km in (20, 50, 150):
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                found = set(within_radius(Product.objects.all(), *self.centre, radius_km).values_list('pk', flat=True))
+                timings.append(time.perf_counter() - start)
+            self.assertEqual(found, self._scan(points, radius_km))
+            print(f'{radius_km} km: {min(timings) * 1000:.1f} ms, {len(found)} rows')
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class ChangeFeedBenchmark(TestCase):
+    """Bytes and time to resync BENCHMARK_SYNC_LISTINGS listings (10k by default) from the change feed against refetching every page"""
+    listings = int(os.environ.get('BENCHMARK_SYNC_LISTINGS', 10000))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = _create_user('seller')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        for start in range(0, cls.listings, 5000):
+            Product.objects.bulk_create([
+                Product(
+                    title=f'Listing {i}', description='Solid oak', category=category,
+                    price=Decimal('25.00'), location='City', seller=cls.seller
+                )
+                for i in range(start, min(start + 5000, cls.listings))
+            ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def _fetch(self, url, params=None):
+        # Pages are followed until the last, as a client would
+        total, requests = 0, 0
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            total += len(response.content)
+            requests += 1
+            url, params = response.data.get('next'), None
+            if response.data.get('has_more'):
+                url, params = '/api/v1/products/changes/', {'since': response.data['cursor']}
+        return total, requests
+
+    def _time(self, url, params=None):
+        start = time.perf_counter()
+        total, requests = self._fetch(url, params)
+        return total, requests, time.perf_counter() - start
+
+    def test_sync_payload(self):
+        ids = list(Product.objects.values_list('pk', flat=True))
+        full = self._time('/api/v1/products/')
+        print(f'\n{self.listings} listings; full refetch: {full[0] / 1024:.0f} KiB in {full[1]} requests, {full[2]:.2f} s')
+        rng = random.Random(0)
+        for fraction in (0.001, 0.01, 0.1):
+            ProductChange.objects.all().delete()
+            cursor = encode_cursor(0, timezone.now() - timedelta(minutes=1))
+            ProductChange.record(rng.sample(ids, max(1, int(self.listings * fraction))))
+            # Settled, so the feed returns them
+            ProductChange.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+            synced = self._time('/api/v1/products/changes/', {'since': cursor})
+            print(f'{fraction:.1%} changed; change feed: {synced[0] / 1024:.0f} KiB in {synced[1]} requests, '
+                  f'{synced[2]:.2f} s ({synced[0] / full[0]:.1%} of the refetch)')
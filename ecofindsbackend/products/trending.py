@@ -0,0 +1,126 @@
+"""
+Trending scores from time-bucketed view and add-to-cart events.
+
+Requests only bump an in-process counter. A background thread flushes the
+counters every TRENDING_FLUSH_INTERVAL seconds: it appends one
+ProductEventBucket row per (product, kind, bucket) and batches the lifetime
+view_count increments. `compute_trending_scores` then decays the buckets
+into Product.trending_score.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.utils import timezone
+from .models import Product, ProductEventBucket
+
+logger = logging.getLogger(__name__)
+
+
+def bucket_start(moment):
+    size = settings.TRENDING_BUCKET.total_seconds()
+    return datetime.fromtimestamp(moment.timestamp() // size * size, tz=dt_timezone.utc)
+
+
+class EventBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._thread = None
+
+    def record(self, product_id, kind, count=1):
+        with self._lock:
+            self._counts[product_id, kind, bucket_start(timezone.now())] += count
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='trending-flush', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(settings.TRENDING_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing trending events failed')
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        views = Counter()
+        for (product_id, kind, _), count in counts.items():
+            if kind == 'view':
+                views[product_id] += count
+        # One UPDATE per distinct increment rather than one per product
+        by_increment = defaultdict(list)
+        for product_id, count in views.items():
+            by_increment[count].append(product_id)
+
+        try:
+            self._write(counts, by_increment)
+        except Exception:
+            # Keep the events for the next flush rather than dropping them
+            with self._lock:
+                self._counts.update(counts)
+            raise
+        return len(counts)
+
+    def _write(self, counts, by_increment):
+        with transaction.atomic():
+            existing = set(Product.objects.filter(id__in={key[0] for key in counts}).values_list('id', flat=True))
+            ProductEventBucket.objects.bulk_create([
+                ProductEventBucket(product_id=product_id, kind=kind, bucket_start=start, count=count)
+                for (product_id, kind, start), count in counts.items()
+                if product_id in existing
+            ], batch_size=1000)
+            for increment, product_ids in by_increment.items():
+                Product.objects.filter(id__in=product_ids).update(view_count=F('view_count') + increment)
+
+
+event_buffer = EventBuffer()
+
+
+def record_event(product_id, kind):
+    event_buffer.record(product_id, kind)
+
+
+def compute_trending_scores(now=None, batch_size=1000):
+    """Recompute Product.trending_score from the event window and prune older buckets"""
+    now = now or timezone.now()
+    half_life = settings.TRENDING_HALF_LIFE.total_seconds()
+    weights = settings.TRENDING_EVENT_WEIGHTS
+
+    scores = defaultdict(float)
+    window = ProductEventBucket.objects.filter(bucket_start__gte=now - settings.TRENDING_WINDOW)
+    for product_id, kind, start, count in window.values('product_id', 'kind', 'bucket_start').annotate(
+        total=Sum('count')
+    ).values_list('product_id', 'kind', 'bucket_start', 'total').iterator():
+        age = max((now - start).total_seconds(), 0)
+        scores[product_id] += weights.get(kind, 0) * count * 0.5 ** (age / half_life)
+
+    ranked = list(scores.items())
+    for offset in range(0, len(ranked), batch_size):
+        batch = ranked[offset:offset + batch_size]
+        Product.objects.filter(id__in=[product_id for product_id, _ in batch]).update(trending_score=Case(
+            *[When(id=product_id, then=Value(score)) for product_id, score in batch],
+            output_field=FloatField()
+        ))
+
+    # Products whose events all aged out of the window drop back to zero
+    stale = [
+        product_id for product_id in Product.objects.filter(trending_score__gt=0).values_list('id', flat=True).iterator()
+        if product_id not in scores
+    ]
+    for offset in range(0, len(stale), batch_size):
+        Product.objects.filter(id__in=stale[offset:offset + batch_size]).update(trending_score=0)
+
+    pruned, _ = ProductEventBucket.objects.filter(bucket_start__lt=now - settings.TRENDING_WINDOW).delete()
+    return len(scores), pruned
@@ -3,6 +3,11 @@ from . import views
 
 urlpatterns = [
     path('', views.product_list_create, name='product_list_create'),
+    path('batch/', views.product_batch, name='product_batch'),
+    path('changes/', views.product_changes, name='product_changes'),
     path('<int:id>/', views.product_detail, name='product_detail'),
+    path('<int:id>/similar/', views.similar_products, name='similar_products'),
     path('my-listings/', views.my_listings, name='my_listings'),
+    path('my-listings/export/', views.my_listings_export, name='my_listings_export'),
+    path('import/', views.bulk_import_products, name='bulk_import_products'),
 ]
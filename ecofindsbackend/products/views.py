@@ -1,24 +1,51 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from django.db.models import Q
-from .models import Product, Category
+import csv
+import zipfile
+from functools import partial
+from itertools import islice
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Case, IntegerField, Q, Value, When
+from ecofindsbackend.throttling import SearchRateThrottle
+from .models import ArchivedProduct, Product, Category, SimilarProduct
+from .trending import record_event
+from .facets import cached_facets, compute_facets
+from .suggest import TOP_K, get_suggest_index
+from .fuzzy import get_fuzzy_index
+from .geo import within_radius
+from .exports import EXPORT_FORMATS, export_listings
+from .bulk_import import import_format, import_listings, read_rows
+from .archive import delete_listings
+from .changes import cursor_expired, decode_cursor, encode_cursor, latest_change_id, read_changes
 from .serializers import (
     ProductListSerializer, ProductDetailSerializer, 
     ProductCreateUpdateSerializer, CategorySerializer, MyListingSerializer
 )
 
+class KnownCountPaginator(Paginator):
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+
 class ProductPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+    def paginate_queryset(self, queryset, request, view=None, count=None):
+        """``count``, when the caller has already counted the queryset, saves the paginator's COUNT query"""
+        if count is not None:
+            self.django_paginator_class = partial(KnownCountPaginator, count=count)
+        return super().paginate_queryset(queryset, request, view)
+
 @api_view(['GET', 'POST'])
 def product_list_create(request):
     if request.method == 'GET':
-        products = Product.objects.select_related('seller', 'category').all()
+        products = Product.objects.select_related('seller', 'category').prefetch_related('images')
         
         # Apply filters
         search = request.GET.get('search')
@@ -47,6 +74,8 @@ def product_list_create(request):
             products = products.order_by('-price')
         elif sort_by == 'date_asc':
             products = products.order_by('created_at')
+        elif sort_by == 'trending':
+            products = products.order_by('-trending_score', '-created_at')
         else:  # date_desc
             products = products.order_by('-created_at')
         
@@ -73,12 +102,16 @@ def product_detail(request, id):
     try:
         product = Product.objects.select_related('seller', 'category').get(id=id)
     except Product.DoesNotExist:
+        # Archived listings stay readable (e.g. from purchase history) but can no longer change
+        archived = ArchivedProduct.objects.select_related('seller', 'category').prefetch_related('images').filter(id=id).first()
+        if archived and request.method == 'GET':
+            return Response(ProductDetailSerializer(archived).data, status=status.HTTP_200_OK)
         return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        # Increment view count
+        # Buffered in memory and flushed in batches; reflect it in this response
+        record_event(product.id, 'view')
         product.view_count += 1
-        product.save(update_fields=['view_count'])
         
         serializer = ProductDetailSerializer(product)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -91,7 +124,8 @@ def product_detail(request, id):
             return Response({'detail': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
         
         if request.method == 'DELETE':
-            product.delete()
+            # Bought listings move to the archive so purchase history still shows them
+            delete_listings(Product.objects.filter(pk=product.pk))
             return Response(status=status.HTTP_204_NO_CONTENT)
         
         partial = request.method == 'PATCH'
@@ -103,15 +137,100 @@ def product_detail(request, id):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def my_listings(request):
-    products = Product.objects.filter(seller=request.user)
+def product_batch(request):
+    try:
+        # Duplicates are dropped but the requested order is kept
+        ids = list(dict.fromkeys(int(part) for part in request.GET.get('ids', '').split(',') if part.strip()))
+    except ValueError:
+        return Response({'message': 'ids must be a comma-separated list of product ids'}, status=status.HTTP_400_BAD_REQUEST)
+    if not ids:
+        return Response({'message': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > settings.PRODUCT_BATCH_MAX_IDS:
+        return Response({
+            'message': f'At most {settings.PRODUCT_BATCH_MAX_IDS} ids per request'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
+    # One id__in query plus one for images; read-only, so no view counting
+    products = Product.objects.select_related('seller', 'category').prefetch_related('images').in_bulk(ids)
+    serializer = ProductListSerializer([products[id] for id in ids if id in products], many=True)
+    return Response({
+        'results': serializer.data,
+        'missing_ids': [id for id in ids if id not in products]
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+def product_changes(request):
+    since = request.GET.get('since')
+    if not since:
+        # Starting point: take the cursor first, then fetch the list
+        return Response({'updated': [], 'deleted': [], 'cursor': encode_cursor(latest_change_id()), 'has_more': False})
+    try:
+        since_id, issued_at = decode_cursor(since)
+    except ValueError:
+        return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    if cursor_expired(issued_at):
+        return Response({
+            'message': 'Cursor expired; refetch the product list and sync from a new cursor'
+        }, status=status.HTTP_410_GONE)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', settings.PRODUCT_CHANGE_PAGE_SIZE)), settings.PRODUCT_CHANGE_PAGE_SIZE))
+    except ValueError:
+        limit = settings.PRODUCT_CHANGE_PAGE_SIZE
+    
+    latest, cursor, has_more = read_changes(since_id, limit)
+    changed = [product_id for product_id, deleted in latest.items() if not deleted]
+    products = Product.objects.select_related('seller', 'category').prefetch_related('images').in_bulk(changed)
+    return Response({
+        'updated': ProductListSerializer([products[id] for id in changed if id in products], many=True).data,
+        # Gone since the entry was written: its deletion is further on in the log
+        'deleted': [product_id for product_id in latest if product_id not in products],
+        'cursor': cursor,
+        'has_more': has_more
+    }, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+def similar_products(request, id):
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    
+    # One indexed query on (product, rank) against the precomputed neighbour table
+    links = SimilarProduct.objects.filter(
+        product_id=id, similar__is_sold=False
+    ).exclude(similar__seller_id=request.user.id).select_related(
+        'similar__seller', 'similar__category'
+    ).prefetch_related('similar__images').order_by('rank')[:limit]
+    products = [link.similar for link in links]
+    
+    if not products:
+        # Not indexed yet (e.g. listed since the last build): fall back to the same category
+        try:
+            product = Product.objects.only('category_id').get(id=id)
+        except Product.DoesNotExist:
+            return Response({'detail': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        products = Product.objects.select_related('seller', 'category').prefetch_related('images').filter(
+            category_id=product.category_id, is_sold=False
+        ).exclude(id=id).exclude(seller_id=request.user.id)[:limit]
+    
+    serializer = ProductListSerializer(products, many=True)
+    return Response({
+        'product_id': id,
+        'results': serializer.data
+    }, status=status.HTTP_200_OK)
+
+def _filter_listings(request, products):
     status_filter = request.GET.get('status', 'all')
     if status_filter == 'active':
         products = products.filter(is_sold=False)
     elif status_filter == 'sold':
         products = products.filter(is_sold=True)
+    return products
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def my_listings(request):
+    products = _filter_listings(request, Product.objects.filter(seller=request.user))
     
     # Pagination
     paginator = ProductPagination()
@@ -120,6 +239,48 @@ def my_listings(request):
     
     return paginator.get_paginated_response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def my_listings_export(request):
+    # Not ?format=, which DRF reserves for renderer selection
+    export_format = request.GET.get('export_format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({
+            'message': f'export_format must be one of: {", ".join(EXPORT_FORMATS)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    products = _filter_listings(request, Product.objects.filter(seller=request.user))
+    return export_listings(products, export_format)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_import_products(request):
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'message': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    file_format = import_format(upload.name)
+    if file_format is None:
+        return Response({'message': 'file must be a .csv or .jsonl file'}, status=status.HTTP_400_BAD_REQUEST)
+    images = request.FILES.get('images')
+    if images is not None and not zipfile.is_zipfile(images):
+        return Response({'message': 'images must be a zip archive'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    max_rows = settings.BULK_IMPORT_MAX_ROWS
+    try:
+        rows = list(islice(read_rows(upload, file_format), max_rows + 1))
+    except (UnicodeDecodeError, csv.Error) as e:
+        return Response({'message': f'Could not read file: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(rows) > max_rows:
+        return Response({
+            'message': f'At most {max_rows} rows per request; use manage.py import_listings for larger files'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    report = import_listings(request.user, rows, images=images, chunk_size=settings.BULK_IMPORT_CHUNK_SIZE)
+    return Response(
+        report.as_dict(),
+        status=status.HTTP_201_CREATED if report.product_ids else status.HTTP_400_BAD_REQUEST
+    )
+
 @api_view(['GET'])
 def category_list(request):
     categories = Category.objects.all()
@@ -127,16 +288,10 @@ def category_list(request):
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
+@throttle_classes([SearchRateThrottle])
 def search_products(request):
     query = request.GET.get('q', '')
-    products = Product.objects.select_related('seller', 'category').all()
-    
-    if query:
-        products = products.filter(
-            Q(title__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        )
+    products = Product.objects.select_related('seller', 'category').prefetch_related('images')
     
     # Apply additional filters
     category = request.GET.get('category')
@@ -159,6 +314,48 @@ def search_products(request):
     if location:
         products = products.filter(location__icontains=location)
     
+    near = request.GET.get('near')
+    radius = None
+    if near:
+        try:
+            latitude, longitude = (float(part) for part in near.split(','))
+            radius = float(request.GET.get('radius', 20))
+        except ValueError:
+            return Response({'message': 'near must be "lat,lng" and radius a number of km'}, status=status.HTTP_400_BAD_REQUEST)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius <= 500):
+            return Response({'message': 'near or radius out of range'}, status=status.HTTP_400_BAD_REQUEST)
+        products = within_radius(products, latitude, longitude, radius)
+    
+    fuzzy = False
+    count = None
+    if query:
+        exact = Q(title__icontains=query) | Q(description__icontains=query) | Q(category__name__icontains=query)
+        threshold = settings.FUZZY_FALLBACK_THRESHOLD
+        # The exact matches' count doubles as the paginator's, so only the fallback costs another query
+        count = products.filter(exact).count() if threshold else None
+        fuzzy_ids = get_fuzzy_index().search(query) if count is not None and count < threshold else []
+        if fuzzy_ids:
+            fuzzy = True
+            count = None
+            products = products.filter(exact | Q(id__in=fuzzy_ids)).annotate(
+                relevance=Case(
+                    When(exact, then=Value(-1)),
+                    *[When(id=product_id, then=Value(rank)) for rank, product_id in enumerate(fuzzy_ids)],
+                    default=Value(len(fuzzy_ids)),
+                    output_field=IntegerField()
+                )
+            ).order_by('relevance')
+        else:
+            products = products.filter(exact)
+    
+    # Facet counts for the filtered result set, before sorting and pagination
+    facets = None
+    if request.GET.get('facets') in ('1', 'true'):
+        if any([query, category, min_price, max_price, condition, location, near]):
+            facets = compute_facets(products)
+        else:
+            facets = cached_facets()
+    
     # Sorting
     sort_by = request.GET.get('sort_by', 'relevance')
     if sort_by == 'price_asc':
@@ -169,13 +366,20 @@ def search_products(request):
         products = products.order_by('created_at')
     elif sort_by == 'date_desc':
         products = products.order_by('-created_at')
+    elif sort_by == 'trending':
+        products = products.order_by('-trending_score', '-created_at')
+    elif sort_by == 'distance' and near:
+        products = products.order_by('distance_sq')
     
     # Pagination
     paginator = ProductPagination()
-    page = paginator.paginate_queryset(products, request)
+    page = paginator.paginate_queryset(products, request, count=count)
     serializer = ProductListSerializer(page, many=True)
     
     response_data = paginator.get_paginated_response(serializer.data).data
+    if near:
+        for item, product in zip(response_data['results'], page):
+            item['distance_km'] = round(product.distance_sq ** 0.5, 2)
     response_data['query'] = query
     response_data['filters_applied'] = {
         'category': category,
@@ -183,7 +387,28 @@ def search_products(request):
             'min': min_price,
             'max': max_price
         } if min_price or max_price else None,
-        'condition': condition
+        'condition': condition,
+        'near': {'lat': latitude, 'lng': longitude, 'radius_km': radius} if near else None
     }
+    if facets is not None:
+        response_data['facets'] = facets
+    if fuzzy:
+        response_data['fuzzy'] = True
     
     return Response(response_data, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@throttle_classes([SearchRateThrottle])
+def search_suggest(request):
+    query = request.GET.get('q', '')
+    try:
+        limit = min(int(request.GET.get('limit', 10)), TOP_K)
+    except ValueError:
+        limit = 10
+    
+    # Served from the in-memory prefix index; no database query on the hot path
+    suggestions = get_suggest_index().suggest(query, limit=max(limit, 1))
+    return Response({
+        'query': query,
+        'suggestions': suggestions
+    }, status=status.HTTP_200_OK)
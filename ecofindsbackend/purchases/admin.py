@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Purchase, PurchaseItem
+from django.db.models import OuterRef, Subquery
+from products.models import ArchivedProduct, Product
+from .exports import export_purchases
+from .models import IdempotencyKey, Purchase, PurchaseItem
 
 class PurchaseItemInline(admin.TabularInline):
     model = PurchaseItem
@@ -10,11 +13,42 @@ class PurchaseItemInline(admin.TabularInline):
 class PurchaseAdmin(admin.ModelAdmin):
     list_display = ('order_number', 'buyer', 'total_amount', 'status', 'created_at')
     list_filter = ('status', 'created_at')
+    list_select_related = ('buyer',)
     search_fields = ('order_number', 'buyer__username', 'buyer__email')
     readonly_fields = ('order_number', 'created_at')
     inlines = [PurchaseItemInline]
+    actions = ('export_csv', 'export_jsonl')
+
+    @admin.action(description='Export selected purchases as CSV')
+    def export_csv(self, request, queryset):
+        return export_purchases(queryset, 'csv')
+
+    @admin.action(description='Export selected purchases as JSON Lines')
+    def export_jsonl(self, request, queryset):
+        return export_purchases(queryset, 'jsonl')
 
 @admin.register(PurchaseItem)
 class PurchaseItemAdmin(admin.ModelAdmin):
-    list_display = ('purchase', 'product', 'quantity', 'price_at_purchase')
+    list_display = ('purchase', 'listing', 'quantity', 'price_at_purchase')
+    # The product is prefetched, not joined, so items of archived listings still show
+    list_select_related = ('purchase__buyer',)
     search_fields = ('purchase__order_number', 'product__title')
+
+    def get_queryset(self, request):
+        # Archived listings' titles come from the same query rather than one lookup per row
+        archived_title = ArchivedProduct.objects.filter(pk=OuterRef('product_id')).values('title')[:1]
+        return super().get_queryset(request).prefetch_related('product').annotate(_archived_title=Subquery(archived_title))
+
+    @admin.display(description='Product')
+    def listing(self, obj):
+        try:
+            product = obj.product
+        except Product.DoesNotExist:
+            product = None
+        return product or obj._archived_title or obj.product_id
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'response_status', 'created_at', 'expires_at')
+    list_select_related = ('user',)
+    search_fields = ('key', 'user__email')
@@ -0,0 +1,26 @@
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from products.exports import export_response
+from products.models import ArchivedProduct, Product
+from .models import PurchaseItem
+
+# One row per purchased item, with the order's fields repeated
+PURCHASE_COLUMNS = [
+    ('order_number', 'purchase__order_number'),
+    ('created_at', 'purchase__created_at'),
+    ('status', 'purchase__status'),
+    ('payment_method', 'purchase__payment_method'),
+    ('total_amount', 'purchase__total_amount'),
+    ('product_id', 'product_id'),
+    ('product_title', 'product_title'),
+    ('quantity', 'quantity'),
+    ('price_at_purchase', 'price_at_purchase'),
+]
+
+def export_purchases(purchases, export_format, filename='purchases'):
+    # Looked up rather than joined, so items of archived listings are still exported
+    items = PurchaseItem.objects.filter(purchase__in=purchases).annotate(product_title=Coalesce(
+        Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('title')),
+        Subquery(ArchivedProduct.objects.filter(pk=OuterRef('product_id')).values('title'))
+    )).order_by('purchase_id', 'id')
+    return export_response(items, PURCHASE_COLUMNS, export_format, filename)
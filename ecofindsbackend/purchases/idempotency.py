@@ -0,0 +1,101 @@
+"""
+Idempotency-Key support for unsafe endpoints.
+
+The first request with a given key inserts its row and runs the view in the
+same transaction, storing the response before commit, so the key and the
+work it guards commit or roll back together. A duplicate that arrives
+meanwhile blocks on the unique constraint (user+key) until that transaction
+ends, then replays the stored response, or runs the view itself if the
+first one rolled back. Other transactions never see a key before its
+response is stored, so there is no "still being processed" state to report.
+"""
+import hashlib
+import json
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+
+def idempotent(view_func):
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view_func(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({
+                'message': 'Idempotency-Key must be at most 255 characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = hashlib.sha256(
+            json.dumps(request.data, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+        while True:
+            record = _existing(request.user, key)
+            if record is None:
+                response = _run_claimed(view_func, request, args, kwargs, key, fingerprint)
+                if response is not None:
+                    return response
+                # Another request committed the key first; replay its outcome
+                continue
+            if record.request_fingerprint != fingerprint:
+                return Response({
+                    'message': 'Idempotency-Key was already used with a different request'
+                }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            response = Response(record.response_body, status=record.response_status)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+    return wrapper
+
+
+def _existing(user, key):
+    """The committed record for the key, or None; expired records are deleted"""
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is not None and record.expires_at <= timezone.now():
+        # Conditional delete so only one request replaces an expired key
+        IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+        return None
+    return record
+
+
+def _run_claimed(view_func, request, args, kwargs, key, fingerprint):
+    """Claim the key and run the view in one transaction; returns None if another request claimed it"""
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                # Blocks while a concurrent transaction holds an uncommitted row for the same key
+                record = IdempotencyKey.objects.create(
+                    user=request.user, key=key, request_fingerprint=fingerprint,
+                    expires_at=timezone.now() + settings.IDEMPOTENCY_KEY_TTL
+                )
+        except IntegrityError:
+            return None
+
+        response = view_func(request, *args, **kwargs)
+        if response.status_code >= 500:
+            # Server errors are not a final outcome; drop the key with the work so the client can retry
+            transaction.set_rollback(True)
+            return response
+        record.response_status = response.status_code
+        record.response_body = response.data
+        record.save(update_fields=['response_status', 'response_body'])
+    return response
+
+
+def purge_expired_keys(batch_size=1000):
+    """Delete expired keys in batches; returns the number removed"""
+    purged = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from purchases.idempotency import purge_expired_keys
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses that have expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        purged = purge_expired_keys(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired idempotency key(s)'))
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.24 on 2026-10-19 11:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_archive'),
+        ('purchases', '0003_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchaseitem',
+            name='product',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='products.product'),
+        ),
+    ]
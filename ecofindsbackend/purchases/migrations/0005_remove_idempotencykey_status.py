@@ -0,0 +1,17 @@
+# Generated by Django 4.2.24 on 2026-10-19 12:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchases', '0004_unconstrained_product'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='idempotencykey',
+            name='status',
+        ),
+    ]
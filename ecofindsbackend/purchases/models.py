@@ -1,7 +1,12 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
-from products.models import Product
-import uuid
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.functional import cached_property
+from products.models import ArchivedProduct, Product
+from .order_numbers import next_order_number
+
+# Order numbers generated per save before giving up on unique constraint conflicts
+ORDER_NUMBER_ATTEMPTS = 3
 
 class Purchase(models.Model):
     STATUS_CHOICES = [
@@ -23,18 +28,58 @@ class Purchase(models.Model):
         ordering = ['-created_at']
 
     def save(self, *args, **kwargs):
-        if not self.order_number:
-            self.order_number = f"ECO-{uuid.uuid4().hex[:8].upper()}"
-        super().save(*args, **kwargs)
+        if self.order_number:
+            return super().save(*args, **kwargs)
+        for attempt in range(ORDER_NUMBER_ATTEMPTS):
+            self.order_number = next_order_number()
+            try:
+                # Savepoint, so a conflict leaves the surrounding checkout transaction usable
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # Another process with the same node id drew the same number; draw again
+                self.order_number = ''
+                if attempt == ORDER_NUMBER_ATTEMPTS - 1:
+                    raise
 
     def __str__(self):
         return f"Purchase {self.order_number} by {self.buyer.username}"
 
 class PurchaseItem(models.Model):
     purchase = models.ForeignKey(Purchase, on_delete=models.CASCADE, related_name='items')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # No database constraint: the id stays valid after the listing moves to the archive
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False)
     quantity = models.PositiveIntegerField(default=1)
     price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.title} in {self.purchase.order_number}"
+        title = self.listing.title if self.listing else self.product_id
+        return f"{self.quantity} x {title} in {self.purchase.order_number}"
+
+    @cached_property
+    def listing(self):
+        """The purchased product, from the archive once it has been archived"""
+        try:
+            product = self.product
+        except Product.DoesNotExist:
+            product = None
+        # A prefetch caches None for a missing product instead of raising
+        return product or ArchivedProduct.objects.select_related('seller', 'category').filter(pk=self.product_id).first()
+
+class IdempotencyKey(models.Model):
+    """Outcome of a request sent with an Idempotency-Key header, replayed on retries"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.response_status})"
@@ -0,0 +1,82 @@
+"""
+Time-ordered order numbers generated without a database round trip.
+
+Each number packs a Snowflake-style 64-bit id: 42 bits of milliseconds since
+ORDER_NUMBER_EPOCH, 10 bits of node id and a 12-bit per-millisecond sequence.
+It is rendered as 13 Crockford base32 characters, so sorting order numbers
+as strings sorts them by creation time and new rows always land at the right
+edge of the unique index instead of at random pages.
+
+Node ids are not coordinated between processes, so two of them can rarely
+draw the same number in the same millisecond; Purchase.save draws again
+when the unique constraint rejects one.
+"""
+import os
+import random
+import threading
+import time
+from django.conf import settings
+
+PREFIX = 'ECO-'
+ORDER_NUMBER_EPOCH = 1735689600000  # 2025-01-01T00:00:00Z in milliseconds
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+WIDTH = 13
+
+
+class OrderNumberGenerator:
+    def __init__(self, node_id):
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f'node_id must be between 0 and {MAX_NODE_ID}')
+        self.node_id = node_id
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            now = int(time.time() * 1000)
+            if now <= self._last_ms:
+                # Same millisecond, or the clock stepped back: never go backwards
+                now = self._last_ms
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    # Sequence exhausted; borrow the next millisecond
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return ((now - ORDER_NUMBER_EPOCH) << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+    def next_order_number(self):
+        return PREFIX + encode(self.next_id())
+
+
+def encode(value):
+    chars = []
+    for _ in range(WIDTH):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def next_order_number():
+    global _generator
+    # Rebuild after a fork so child processes don't inherit the parent's node id
+    if _generator is None or _generator.pid != os.getpid():
+        with _generator_lock:
+            if _generator is None or _generator.pid != os.getpid():
+                node_id = settings.ORDER_NUMBER_NODE_ID
+                if node_id is None:
+                    # Random, not pid-derived: containers on different hosts run the same pids
+                    node_id = random.SystemRandom().randrange(MAX_NODE_ID + 1)
+                _generator = OrderNumberGenerator(node_id)
+    return _generator.next_order_number()
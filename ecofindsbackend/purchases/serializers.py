@@ -4,7 +4,7 @@ from products.serializers import ProductListSerializer
 from users.serializers import UserProfileSerializer
 
 class PurchaseItemSerializer(serializers.ModelSerializer):
-    product = ProductListSerializer(read_only=True)
+    product = ProductListSerializer(source='listing', read_only=True)
 
     class Meta:
         model = PurchaseItem
@@ -55,3 +55,10 @@ class CreatePurchaseSerializer(serializers.ModelSerializer):
             )
         
         return purchase
+
+class StockReservationItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(default=1, min_value=1)
+
+class StockReservationSerializer(serializers.Serializer):
+    items = StockReservationItemSerializer(many=True, allow_empty=False, max_length=100)
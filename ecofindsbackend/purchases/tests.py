@@ -1,3 +1,277 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from cart.models import Cart, CartItem
+from products.archive import archive_sold_listings
+from products.models import Category, Product
+from .exports import PURCHASE_COLUMNS
+from .models import IdempotencyKey, Purchase, PurchaseItem
+from .order_numbers import next_order_number
 
-# Create your tests here.
+User = get_user_model()
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username='seller', email='seller@example.com', password='password')
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        self.product = Product.objects.create(
+            title='Oak chair', description='Solid oak', category=category,
+            price=Decimal('25.00'), quantity=5, seller=seller
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def _checkout(self, key, quantity=2):
+        return self.client.post('/api/v1/purchases/', {
+            'items': [{'product_id': self.product.id, 'quantity': quantity, 'price_at_purchase': '25.00'}],
+            'shipping_address': '1 Main St',
+            'payment_method': 'card',
+            'total_amount': str(25 * quantity),
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        first = self._checkout('key-1')
+        retry = self._checkout('key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['order_number'], first.data['order_number'])
+        self.assertEqual(Purchase.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).quantity, 3)
+
+    def test_key_reused_with_different_request(self):
+        self._checkout('key-1')
+
+        response = self._checkout('key-1', quantity=1)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Purchase.objects.count(), 1)
+
+    def test_failure_after_purchase_rolls_back_key_with_purchase(self):
+        # Fails after the purchase and stock writes, as a crash before commit would
+        with mock.patch('purchases.views.PurchaseDetailSerializer', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self._checkout('key-1')
+
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).quantity, 5)
+
+        response = self._checkout('key-1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Purchase.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).quantity, 3)
+
+    def test_checkout_clears_cart_in_same_transaction(self):
+        CartItem.objects.add_products(self.buyer, {self.product.id: 2})
+        cart = Cart.objects.get(user=self.buyer)
+
+        response = self.client.post('/api/v1/purchases/', {
+            'cart_id': cart.id,
+            'items': [{'product_id': self.product.id, 'quantity': 2, 'price_at_purchase': '25.00'}],
+            'shipping_address': '1 Main St',
+            'payment_method': 'card',
+            'total_amount': '50.00',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(Cart.objects.get(pk=cart.pk).items_count, 0)
+
+    def test_failed_checkout_keeps_cart(self):
+        CartItem.objects.add_products(self.buyer, {self.product.id: 2})
+        cart = Cart.objects.get(user=self.buyer)
+        Product.objects.filter(pk=self.product.pk).update(quantity=1)
+
+        response = self.client.post('/api/v1/purchases/', {
+            'cart_id': cart.id,
+            'items': [{'product_id': self.product.id, 'quantity': 2, 'price_at_purchase': '25.00'}],
+            'shipping_address': '1 Main St',
+            'payment_method': 'card',
+            'total_amount': '50.00',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        self.assertEqual(Cart.objects.get(pk=cart.pk).items_count, 2)
+
+    def test_completed_key_is_stored_with_response(self):
+        response = self._checkout('key-1')
+
+        record = IdempotencyKey.objects.get()
+        self.assertEqual(record.response_status, 201)
+        self.assertEqual(record.response_body['order_number'], response.data['order_number'])
+
+
+class OrderNumberTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+
+    def _create(self):
+        return Purchase.objects.create(
+            buyer=self.buyer, shipping_address='1 Main St', payment_method='card', total_amount=Decimal('10.00')
+        )
+
+    def test_numbers_are_time_ordered(self):
+        numbers = [self._create().order_number for _ in range(5)]
+
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(len(set(numbers)), 5)
+
+    def test_colliding_number_is_redrawn(self):
+        taken = self._create().order_number
+
+        with mock.patch('purchases.models.next_order_number', side_effect=[taken, 'ECO-0000000000001']):
+            purchase = self._create()
+
+        self.assertEqual(purchase.order_number, 'ECO-0000000000001')
+        self.assertEqual(Purchase.objects.count(), 2)
+
+
+class PurchaseExportTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user(username='seller', email='seller@example.com', password='password')
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        self.purchases = []
+        for index in range(3):
+            purchase = Purchase.objects.create(
+                buyer=self.buyer, shipping_address='1 Main St', payment_method='card', total_amount=Decimal('50.00')
+            )
+            for title, quantity in ((f'Oak chair {index}', 1), (f'Pine table {index}', 0)):
+                product = Product.objects.create(
+                    title=title, description='Solid oak', category=category,
+                    price=Decimal('25.00'), quantity=quantity, seller=seller
+                )
+                PurchaseItem.objects.create(purchase=purchase, product=product, price_at_purchase=Decimal('25.00'))
+            self.purchases.append(purchase)
+        # The tables are archived; their items are still exported with their titles
+        Product.objects.filter(is_sold=True).update(updated_at=timezone.now() - timedelta(days=1))
+        archive_sold_listings(older_than=timedelta(hours=1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def _export(self, **params):
+        response = self.client.get('/api/v1/purchases/history/export/', params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_csv_streams_every_item_in_one_query(self):
+        # The items are read through one cursor however many chunks they span
+        with self.assertNumQueries(1):
+            content = self._export()
+
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], [header for header, _ in PURCHASE_COLUMNS])
+        self.assertEqual([(row[0], row[6]) for row in rows[1:]], [
+            (purchase.order_number, f'{title} {index}')
+            for index, purchase in enumerate(self.purchases)
+            for title in ('Oak chair', 'Pine table')
+        ])
+
+    def test_jsonl(self):
+        lines = self._export(export_format='jsonl').splitlines()
+
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(json.loads(lines[0])['product_title'], 'Oak chair 0')
+        self.assertEqual(json.loads(lines[0])['price_at_purchase'], '25.00')
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/v1/purchases/history/export/', {'export_format': 'xml'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='password')
+        self.client.force_login(admin_user)
+        seller = User.objects.create_user(username='seller', email='seller@example.com', password='password')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        for index in range(3):
+            buyer = User.objects.create_user(username=f'buyer{index}', email=f'buyer{index}@example.com', password='password')
+            purchase = Purchase.objects.create(
+                buyer=buyer, shipping_address='1 Main St', payment_method='card', total_amount=Decimal('50.00')
+            )
+            for quantity in (0, 1):
+                product = Product.objects.create(
+                    title=f'Oak chair {index}', description='Solid oak', category=category,
+                    price=Decimal('25.00'), quantity=quantity, seller=seller
+                )
+                PurchaseItem.objects.create(purchase=purchase, product=product, price_at_purchase=Decimal('25.00'))
+            IdempotencyKey.objects.create(
+                user=buyer, key=f'key-{index}', request_fingerprint='', response_status=201,
+                expires_at=timezone.now() + timedelta(hours=1)
+            )
+        # Half the items now point at archived listings
+        Product.objects.filter(is_sold=True).update(updated_at=timezone.now() - timedelta(days=1))
+        archive_sold_listings(older_than=timedelta(hours=1))
+
+    def _assert_changelist_queries(self, url, num):
+        # Session, user, filtered and total count and the page, plus any filter choices;
+        # a query per row would fail with the three rows of each model created in setUp
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_purchase_changelist(self):
+        self._assert_changelist_queries('/admin/purchases/purchase/', 5)
+
+    def test_purchase_item_changelist(self):
+        # The page and its live products; archived titles come with the page
+        response = self._assert_changelist_queries('/admin/purchases/purchaseitem/', 6)
+
+        self.assertContains(response, 'Oak chair 0', count=2)
+
+    def test_idempotency_key_changelist(self):
+        self._assert_changelist_queries('/admin/purchases/idempotencykey/', 5)
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class OrderNumberBenchmark(TestCase):
+    """Insert throughput of BENCHMARK_ORDERS orders (1M by default), random against time-ordered numbers"""
+    orders = int(os.environ.get('BENCHMARK_ORDERS', 1000000))
+    batch_size = 5000
+
+    def setUp(self):
+        self.buyer = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+
+    def _insert(self, number):
+        start = time.perf_counter()
+        for offset in range(0, self.orders, self.batch_size):
+            Purchase.objects.bulk_create([
+                Purchase(
+                    order_number=number(), buyer=self.buyer, shipping_address='1 Main St',
+                    payment_method='card', total_amount=Decimal('25.00')
+                )
+                for _ in range(min(self.batch_size, self.orders - offset))
+            ])
+        return self.orders / (time.perf_counter() - start)
+
+    def test_insert_throughput(self):
+        start = time.perf_counter()
+        for _ in range(100000):
+            next_order_number()
+        generated = 100000 / (time.perf_counter() - start)
+
+        random_keys = self._insert(lambda: f'ECO-{uuid.uuid4().hex[:12].upper()}')
+        Purchase.objects.all().delete()
+        ordered = self._insert(next_order_number)
+        print(f'\n{generated:.0f} order numbers/s generated; {self.orders} inserts: '
+              f'random {random_keys:.0f}/s, time-ordered {ordered:.0f}/s')
@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path('', views.create_purchase, name='create_purchase'),
+    path('reservations/', views.stock_reservations, name='stock_reservations'),
     path('history/', views.purchase_history, name='purchase_history'),
+    path('history/export/', views.purchase_history_export, name='purchase_history_export'),
     path('<int:id>/', views.purchase_detail, name='purchase_detail'),
 ]
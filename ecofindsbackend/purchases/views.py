@@ -2,15 +2,21 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.db import transaction
 from decimal import Decimal
 from .models import Purchase, PurchaseItem
-from products.models import Product
-from cart.models import Cart
+from .idempotency import idempotent
+from .exports import export_purchases
+from products.models import Product, StockReservation
+from products.exports import EXPORT_FORMATS
+from products.inventory import InsufficientStock, commit_stock, release_reservations, reserve_stock
+from cart.models import CartItem
 from .serializers import (
-    PurchaseListSerializer, PurchaseDetailSerializer, CreatePurchaseSerializer
+    PurchaseListSerializer, PurchaseDetailSerializer, CreatePurchaseSerializer,
+    StockReservationSerializer
 )
 
 class PurchasePagination(PageNumberPagination):
@@ -18,23 +24,31 @@ class PurchasePagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+class PurchaseCursorPagination(CursorPagination):
+    # Order numbers are time-ordered, so the unique index doubles as the paging key
+    ordering = '-order_number'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_purchase(request):
     serializer = CreatePurchaseSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
-        # Validate items and check availability
+        # Validate items and compute the total from current prices in one query
         items_data = request.data.get('items', [])
+        products = Product.objects.in_bulk([item_data['product_id'] for item_data in items_data])
         total_calculated = 0
         
         for item_data in items_data:
-            try:
-                product = Product.objects.get(id=item_data['product_id'], is_sold=False)
-                total_calculated += product.price * item_data['quantity']
-            except Product.DoesNotExist:
+            product = products.get(item_data['product_id'])
+            if product is None:
                 return Response({
-                    'message': f'Product {item_data["product_id"]} not found or already sold'
+                    'message': f'Product {item_data["product_id"]} not found'
                 }, status=status.HTTP_400_BAD_REQUEST)
+            total_calculated += product.price * item_data['quantity']
         
         # Verify total amount
         total_from_request = Decimal(str(request.data.get('total_amount', 0)))
@@ -43,35 +57,65 @@ def create_purchase(request):
                 'message': 'Total amount mismatch'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create purchase
-        purchase = serializer.save()
-        
-        # Mark products as sold
+        quantities = {}
         for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            product.is_sold = True
-            product.save()
+            quantities[item_data['product_id']] = quantities.get(item_data['product_id'], 0) + item_data['quantity']
         
-        # Clear cart if cart_id provided
         cart_id = request.data.get('cart_id')
-        if cart_id:
-            try:
-                cart = Cart.objects.get(id=cart_id, user=request.user)
-                cart.items.all().delete()
-            except Cart.DoesNotExist:
-                pass
+        try:
+            with transaction.atomic():
+                purchase = serializer.save()
+                # Clear cart if cart_id provided, in the same transaction so a failed checkout keeps it
+                if cart_id:
+                    CartItem.objects.filter(cart_id=cart_id, cart__user=request.user).delete()
+                # Stock is taken last so product rows stay locked only until commit
+                for product_id in sorted(quantities):
+                    commit_stock(request.user, product_id, quantities[product_id])
+        except InsufficientStock as e:
+            return Response({
+                'message': f'Product {e.product_id} is sold out or does not have enough stock'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         response_serializer = PurchaseDetailSerializer(purchase)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['GET'])
+@api_view(['POST', 'DELETE'])
 @permission_classes([IsAuthenticated])
-def purchase_history(request):
-    purchases = Purchase.objects.filter(buyer=request.user)
+def stock_reservations(request):
+    if request.method == 'POST':
+        serializer = StockReservationSerializer(data=request.data)
+        if serializer.is_valid():
+            quantities = {}
+            for item in serializer.validated_data['items']:
+                quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+            
+            try:
+                reservations = reserve_stock(request.user, quantities)
+            except InsufficientStock as e:
+                return Response({
+                    'message': f'Product {e.product_id} is sold out or does not have enough stock'
+                }, status=status.HTTP_409_CONFLICT)
+            
+            return Response({
+                'reservations': [{
+                    'id': reservation.id,
+                    'product_id': reservation.product_id,
+                    'quantity': reservation.quantity,
+                    'expires_at': reservation.expires_at
+                } for reservation in reservations]
+            }, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    # Apply filters
+    elif request.method == 'DELETE':
+        # Abandoned checkout: hand everything back immediately instead of waiting for expiry
+        released = release_reservations(StockReservation.objects.filter(user=request.user))
+        return Response({
+            'message': f'{released} item(s) released'
+        }, status=status.HTTP_200_OK)
+
+def _filter_purchases(request, purchases):
     status_filter = request.GET.get('status')
     if status_filter:
         purchases = purchases.filter(status=status_filter)
@@ -83,14 +127,36 @@ def purchase_history(request):
     date_to = request.GET.get('date_to')
     if date_to:
         purchases = purchases.filter(created_at__date__lte=date_to)
+    return purchases
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def purchase_history(request):
+    purchases = _filter_purchases(request, Purchase.objects.filter(buyer=request.user))
     
-    # Pagination
-    paginator = PurchasePagination()
+    # Pagination; ?pagination=cursor pages by order number instead of OFFSET
+    if request.GET.get('pagination') == 'cursor' or 'cursor' in request.GET:
+        paginator = PurchaseCursorPagination()
+    else:
+        paginator = PurchasePagination()
     page = paginator.paginate_queryset(purchases, request)
     serializer = PurchaseListSerializer(page, many=True)
     
     return paginator.get_paginated_response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def purchase_history_export(request):
+    # Not ?format=, which DRF reserves for renderer selection
+    export_format = request.GET.get('export_format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return Response({
+            'message': f'export_format must be one of: {", ".join(EXPORT_FORMATS)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    purchases = _filter_purchases(request, Purchase.objects.filter(buyer=request.user))
+    return export_purchases(purchases, export_format)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def purchase_detail(request, id):
@@ -0,0 +1,120 @@
+"""
+In-process pub/sub for the event stream.
+
+Each open stream is an asyncio queue subscribed to topics: ``product:<id>``
+for listings being watched and ``cart:<user id>`` for a buyer's cart.
+Publishing is a put_nowait per subscriber, so idle connections cost a queue
+and nothing else.
+
+Events come from the product change log (see products/changes.py), not
+from the process that made the write, so a sale made by any worker reaches
+every server process. While anything is subscribed, one poller per process
+reads the log every REALTIME_POLL_INTERVAL seconds and turns new entries
+into events for the topics that have subscribers.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from cart.models import CartItem
+from products.models import Product, ProductChange
+
+logger = logging.getLogger(__name__)
+
+
+class Broker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._poller = None
+
+    def subscribe(self, topics):
+        queue = asyncio.Queue(maxsize=settings.REALTIME_QUEUE_SIZE)
+        for topic in topics:
+            self._subscribers[topic].add(queue)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue, topics):
+        for topic in topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def publish(self, topic, event):
+        for queue in list(self._subscribers.get(topic, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind to catch up: end its stream, the client reconnects and refetches
+                self.close(queue)
+
+    def close(self, queue):
+        """End the stream reading ``queue``; events still queued are dropped"""
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def watched(self, prefix):
+        return {int(topic[len(prefix):]) for topic in self._subscribers if topic.startswith(prefix)}
+
+    async def _poll(self):
+        since, seen = timezone.now(), {}
+        while self._subscribers:
+            await asyncio.sleep(settings.REALTIME_POLL_INTERVAL)
+            try:
+                events, since = await sync_to_async(collect_events, thread_sensitive=False)(
+                    since, seen, self.watched('product:'), self.watched('cart:')
+                )
+            except Exception:
+                logger.exception('Reading the product change log failed')
+                continue
+            for topic, event in events:
+                self.publish(topic, event)
+
+
+def collect_events(since, seen, product_ids, user_ids):
+    """
+    Events for log entries written since ``since``; returns (events, next since).
+
+    The window reaches PRODUCT_CHANGE_SETTLE back, so an entry committed
+    after a later-numbered one is still picked up; ``seen`` ({change id:
+    created_at}) keeps entries from being published twice.
+    """
+    now = timezone.now()
+    changed = {}
+    for change_id, product_id, deleted, created_at in ProductChange.objects.filter(
+        created_at__gte=since
+    ).values_list('id', 'product_id', 'deleted', 'created_at'):
+        if change_id not in seen:
+            seen[change_id] = created_at
+            changed[product_id] = deleted
+    next_since = now - settings.PRODUCT_CHANGE_SETTLE
+    for change_id in [change_id for change_id, created_at in seen.items() if created_at < next_since]:
+        del seen[change_id]
+
+    events = []
+    watched = changed.keys() & product_ids
+    if watched:
+        state = {
+            row['id']: row for row in
+            Product.objects.filter(id__in=watched).values('id', 'price', 'quantity', 'is_sold')
+        }
+        for product_id in watched:
+            if product_id in state:
+                events.append((f'product:{product_id}', ('product', state[product_id])))
+            else:
+                events.append((f'product:{product_id}', ('product_deleted', {'id': product_id})))
+    if changed and user_ids:
+        # A listing in the cart sold out or changed; cart rows of deleted listings are already gone
+        carts = set(CartItem.objects.filter(product_id__in=changed).values_list('cart__user_id', flat=True))
+        for user_id in carts & user_ids:
+            events.append((f'cart:{user_id}', ('cart_invalidated', {})))
+    return events, next_since
+
+
+broker = Broker()
@@ -0,0 +1,118 @@
+"""
+Server-Sent Events endpoint, served next to Django by ecofindsbackend/asgi.py.
+
+    GET /api/v1/events/?products=12,40&cart=1&token=<access token>
+
+streams ``product`` (price, quantity, is_sold), ``product_deleted`` and
+``cart_invalidated`` events. EventSource cannot send headers, so the access
+token may be given as ``token``; an Authorization header works too.
+
+It is a plain ASGI app rather than a Django view: Django 4.2 does not notice
+a client disconnecting from a streaming response, and an idle stream should
+hold no more than its queue.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from .broker import broker
+
+EVENTS_PATH = '/api/v1/events/'
+
+
+def with_event_stream(application):
+    """Wrap the Django ASGI application so EVENTS_PATH is answered by the event stream"""
+    async def dispatch(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+            return await event_stream(scope, receive, send)
+        return await application(scope, receive, send)
+    return dispatch
+
+
+async def event_stream(scope, receive, send):
+    headers = dict(scope['headers'])
+    origin = headers.get(b'origin', b'').decode('latin-1')
+    cors = [(b'access-control-allow-origin', origin.encode('latin-1'))] if origin in settings.CORS_ALLOWED_ORIGINS else []
+    if scope['method'] != 'GET':
+        return await _respond(send, 405, {'message': 'Method not allowed'}, cors)
+
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    raw_token = query.get('token', [None])[0]
+    authorization = headers.get(b'authorization', b'').decode('latin-1').split()
+    if len(authorization) == 2 and authorization[0] == 'Bearer':
+        raw_token = authorization[1]
+    if not raw_token:
+        return await _respond(send, 401, {'message': 'Authentication required'}, cors)
+    authentication = JWTAuthentication()
+    try:
+        user = await sync_to_async(authentication.get_user)(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return await _respond(send, 401, {'message': 'Invalid token'}, cors)
+
+    try:
+        product_ids = {int(part) for part in ','.join(query.get('products', [])).split(',') if part.strip()}
+    except ValueError:
+        return await _respond(send, 400, {'message': 'products must be a comma-separated list of product ids'}, cors)
+    if len(product_ids) > settings.REALTIME_MAX_PRODUCTS:
+        return await _respond(send, 400, {'message': f'At most {settings.REALTIME_MAX_PRODUCTS} products per stream'}, cors)
+    topics = [f'product:{product_id}' for product_id in product_ids]
+    if query.get('cart', ['0'])[0] not in ('', '0', 'false'):
+        topics.append(f'cart:{user.pk}')
+    if not topics:
+        return await _respond(send, 400, {'message': 'Subscribe to products and/or cart'}, cors)
+
+    queue = broker.subscribe(topics)
+    disconnected = asyncio.get_running_loop().create_task(_wait_for_disconnect(receive, queue))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Stop nginx from buffering the stream
+                (b'x-accel-buffering', b'no'),
+                *cors,
+            ],
+        })
+        await _send_chunk(send, f'retry: {settings.REALTIME_RETRY_MS}\n\n')
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), settings.REALTIME_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                await _send_chunk(send, ': keepalive\n\n')
+                continue
+            if event is None:
+                break
+            name, data = event
+            await _send_chunk(send, f'event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n')
+    finally:
+        broker.unsubscribe(queue, topics)
+        client_left = disconnected.done()
+        disconnected.cancel()
+    if not client_left:
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def _wait_for_disconnect(receive, queue):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    broker.close(queue)
+
+
+async def _send_chunk(send, text):
+    await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+
+async def _respond(send, status, data, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
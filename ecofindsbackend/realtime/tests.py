@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import tracemalloc
+from decimal import Decimal
+from unittest import skipUnless
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from ecofindsbackend.asgi import application
+from products.models import Category, Product
+from .broker import broker
+
+User = get_user_model()
+
+
+def _stream(query_string='', headers=()):
+    return ApplicationCommunicator(application, {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/api/v1/events/',
+        'query_string': query_string.encode(),
+        'headers': list(headers),
+    })
+
+
+async def _read_chunk(communicator):
+    message = await communicator.receive_output(timeout=5)
+    return message['body'].decode()
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def _refused(self, communicator):
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(timeout=5)
+        body = json.loads(await _read_chunk(communicator))
+        return start['status'], body['message']
+
+    async def test_requires_token(self):
+        status, message = await self._refused(_stream('products=1'))
+
+        self.assertEqual((status, message), (401, 'Authentication required'))
+
+    async def test_rejects_invalid_token(self):
+        status, message = await self._refused(_stream('products=1&token=not-a-token'))
+
+        self.assertEqual((status, message), (401, 'Invalid token'))
+
+    async def test_requires_a_subscription(self):
+        status, _ = await self._refused(_stream(f'token={self.token}'))
+
+        self.assertEqual(status, 400)
+
+    @override_settings(REALTIME_HEARTBEAT=0.05, REALTIME_RETRY_MS=1000)
+    async def test_idle_stream_sends_heartbeat(self):
+        # The header works as well as the query parameter
+        communicator = _stream('products=1', [(b'authorization', f'Bearer {self.token}'.encode())])
+        await communicator.send_input({'type': 'http.request'})
+
+        start = await communicator.receive_output(timeout=5)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        self.assertEqual(await _read_chunk(communicator), 'retry: 1000\n\n')
+        self.assertEqual(await _read_chunk(communicator), ': keepalive\n\n')
+
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(timeout=5)
+        self.assertNotIn('product:1', broker._subscribers)
+
+
+class EventPublishTests(TransactionTestCase):
+    """The poller reads the change log from a worker thread, so the writes must be committed"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        self.product = Product.objects.create(
+            title='Oak chair', description='Solid oak', category=category,
+            price=Decimal('25.00'), quantity=1, seller=self.user
+        )
+
+    @override_settings(REALTIME_POLL_INTERVAL=0.05)
+    async def test_sale_reaches_subscriber(self):
+        token = str(AccessToken.for_user(self.user))
+        communicator = _stream(f'products={self.product.pk}&token={token}')
+        await communicator.send_input({'type': 'http.request'})
+        self.assertEqual((await communicator.receive_output(timeout=5))['status'], 200)
+        await _read_chunk(communicator)
+        # Written after the poller started, from another thread as a web worker would
+        await asyncio.sleep(0.1)
+        await sync_to_async(self._sell, thread_sensitive=False)()
+
+        event, data = (await _read_chunk(communicator)).strip().split('\n')
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(timeout=5)
+        self.assertEqual(event, 'event: product')
+        self.assertEqual(json.loads(data[len('data: '):]), {
+            'id': self.product.pk, 'price': '25.00', 'quantity': 0, 'is_sold': True
+        })
+
+    def _sell(self):
+        self.product.quantity = 0
+        self.product.is_sold = True
+        self.product.save()
+
+
+@skipUnless(os.environ.get('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+class IdleStreamBenchmark(TestCase):
+    """Memory held per idle event stream, over BENCHMARK_STREAMS open connections (5000 by default)"""
+    streams = int(os.environ.get('BENCHMARK_STREAMS', 5000))
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password')
+
+    async def test_memory_per_stream(self):
+        token = str(AccessToken.for_user(self.user))
+        communicators = [_stream(f'products={index % 100 + 1}&cart=1&token={token}') for index in range(self.streams)]
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for communicator in communicators:
+            await communicator.send_input({'type': 'http.request'})
+            await communicator.receive_output(timeout=5)
+            await communicator.receive_output(timeout=5)
+        used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+        tracemalloc.stop()
+        for communicator in communicators:
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(timeout=5)
+        print(f'\n{self.streams} idle streams: {used / self.streams / 1024:.1f} KiB each')
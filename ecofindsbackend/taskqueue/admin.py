@@ -0,0 +1,16 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Task
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'created_at', 'run_ms')
+    list_filter = ('status', 'name')
+    search_fields = ('name',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'run_ms', 'last_error')
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected tasks')
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status='running').update(status='queued', attempts=0, run_at=timezone.now())
+        self.message_user(request, f'{updated} task(s) requeued')
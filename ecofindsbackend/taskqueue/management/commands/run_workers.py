@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import signal
+import time
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+HOUSEKEEPING_INTERVAL = 60
+
+
+def worker_process(settings_module, batch_size, poll_interval, once, stop_event):
+    # Entry point for child processes; also works with the spawn start method
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from taskqueue.worker import Worker
+    Worker(batch_size=batch_size, poll_interval=poll_interval).run(stop_event, once=once)
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers in a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+
+    def handle(self, *args, **options):
+        from taskqueue.worker import purge_finished_tasks, requeue_stale_tasks
+
+        requeue_stale_tasks()
+        # Children must not inherit the parent's database connections
+        connections.close_all()
+
+        stop_event = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(
+                target=worker_process,
+                args=(
+                    os.environ['DJANGO_SETTINGS_MODULE'], options['batch_size'],
+                    options['poll_interval'], options['once'], stop_event
+                ),
+                daemon=True
+            )
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(self.style.SUCCESS(f'Started {len(processes)} worker process(es)'))
+
+        signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+        try:
+            while any(process.is_alive() for process in processes):
+                time.sleep(HOUSEKEEPING_INTERVAL if not options['once'] else 0.5)
+                if not options['once']:
+                    requeue_stale_tasks()
+                    purge_finished_tasks()
+        except KeyboardInterrupt:
+            stop_event.set()
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS('Workers stopped'))
@@ -0,0 +1,43 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+from taskqueue.models import Task
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Show per-task latency (queue wait and run time) and queue depth'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Only look at tasks finished this recently')
+
+    def handle(self, *args, **options):
+        depth = dict(Task.objects.values_list('status').annotate(n=Count('id')).values_list('status', 'n'))
+        self.stdout.write(
+            f"queued={depth.get('queued', 0)} running={depth.get('running', 0)} dead={depth.get('dead', 0)}"
+        )
+
+        since = timezone.now() - timedelta(hours=options['hours'])
+        stats = {}
+        finished = Task.objects.filter(status='succeeded', finished_at__gte=since).values_list(
+            'name', 'run_at', 'started_at', 'run_ms'
+        )
+        for name, run_at, started_at, run_ms in finished.iterator(chunk_size=2000):
+            waits, runs = stats.setdefault(name, ([], []))
+            # From when the last attempt was due, so retry backoff is not counted as queueing
+            waits.append((started_at - run_at).total_seconds() * 1000)
+            runs.append(run_ms)
+
+        for name, (waits, runs) in sorted(stats.items()):
+            self.stdout.write(
+                f'{name}: n={len(runs)} '
+                f'wait_ms p50={percentile(waits, 0.5):.1f} p95={percentile(waits, 0.95):.1f} '
+                f'run_ms p50={percentile(runs, 0.5):.1f} p95={percentile(runs, 0.95):.1f}'
+            )
@@ -0,0 +1,39 @@
+from .models import Task
+
+_registry = {}
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_attempts):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """
+        Enqueue a call. The row is written in the caller's transaction, so a
+        rolled back request never leaves a task behind.
+        """
+        return Task.objects.create(
+            name=self.name,
+            args=list(args),
+            kwargs=kwargs,
+            max_attempts=self.max_attempts
+        )
+
+
+def task(name=None, max_attempts=3):
+    """Register a function so it can be enqueued with ``.delay()`` and run by ``run_workers``"""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        task_function = TaskFunction(func, task_name, max_attempts)
+        _registry[task_name] = task_function
+        return task_function
+    return decorator
+
+
+def get_task(name):
+    return _registry[name]
@@ -0,0 +1,89 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from .models import Task
+from .registry import get_task
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    def __init__(self, batch_size=10, poll_interval=1.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+
+    def run(self, stop_event=None, once=False):
+        """Process tasks until ``stop_event`` is set, or until the queue is empty if ``once``"""
+        while stop_event is None or not stop_event.is_set():
+            close_old_connections()
+            tasks = self.claim()
+            for task in tasks:
+                self.execute(task)
+            if not tasks:
+                if once:
+                    return
+                time.sleep(self.poll_interval)
+
+    def claim(self):
+        now = timezone.now()
+        candidates = list(
+            Task.objects.filter(status='queued', run_at__lte=now)
+            .order_by('run_at').values_list('pk', flat=True)[:self.batch_size]
+        )
+        claimed = []
+        for pk in candidates:
+            # Conditional update: exactly one worker wins each task, no row locks held
+            if Task.objects.filter(pk=pk, status='queued').update(
+                status='running', started_at=now, attempts=F('attempts') + 1
+            ):
+                claimed.append(pk)
+        return list(Task.objects.filter(pk__in=claimed).order_by('run_at'))
+
+    def execute(self, task):
+        start = time.perf_counter()
+        try:
+            get_task(task.name)(*task.args, **task.kwargs)
+        except Exception:
+            task.run_ms = (time.perf_counter() - start) * 1000
+            task.last_error = traceback.format_exc()
+            if task.attempts >= task.max_attempts:
+                # Dead letter: kept for inspection and manual requeue from the admin
+                task.status = 'dead'
+                task.finished_at = timezone.now()
+                logger.error('Task %s moved to dead letter after %s attempts', task, task.attempts)
+            else:
+                task.status = 'queued'
+                task.run_at = timezone.now() + timedelta(seconds=settings.TASK_RETRY_BACKOFF * 2 ** (task.attempts - 1))
+                logger.warning('Task %s failed, retrying at %s', task, task.run_at)
+        else:
+            task.run_ms = (time.perf_counter() - start) * 1000
+            task.status = 'succeeded'
+            task.finished_at = timezone.now()
+        task.save(update_fields=['status', 'run_at', 'run_ms', 'last_error', 'finished_at'])
+
+
+def requeue_stale_tasks():
+    """Put back tasks whose worker died mid-run; ones out of attempts go to the dead letter instead"""
+    now = timezone.now()
+    stale = Task.objects.filter(status='running', started_at__lt=now - settings.TASK_VISIBILITY_TIMEOUT)
+    # The crashed run already counted as an attempt when it was claimed, so a
+    # task that keeps killing its worker stops being retried
+    dead = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='dead', finished_at=now, last_error='Worker stopped responding while running the task'
+    )
+    if dead:
+        logger.error('%s task(s) moved to dead letter after their worker stopped responding', dead)
+    return stale.filter(attempts__lt=F('max_attempts')).update(status='queued', run_at=now)
+
+
+def purge_finished_tasks():
+    cutoff = timezone.now() - settings.TASK_RESULT_TTL
+    return Task.objects.filter(status='succeeded', finished_at__lt=cutoff).delete()[0]
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import CustomUser
+from cart.models import Cart
 
 class UserProfileSerializer(serializers.ModelSerializer):
     profile_image_url = serializers.ReadOnlyField()
@@ -42,4 +43,6 @@ class UserDashboardSerializer(serializers.ModelSerializer):
         return obj.purchases.count()
 
     def get_cart_items_count(self, obj):
-        return getattr(obj.cart, 'total_items', 0) if hasattr(obj, 'cart') else 0
+        # Read the maintained counter; users without a cart row have no items
+        total_items = Cart.objects.filter(user=obj).values_list('items_count', flat=True).first()
+        return total_items or 0